@@ -0,0 +1,31 @@
+from django.contrib import admin
+from django.db.models import Sum
+
+from .models import SalesDaily
+
+
+# ========================= ADMIN: SalesDaily =========================
+
+@admin.register(SalesDaily)
+class SalesDailyAdmin(admin.ModelAdmin):
+    """Дашборд продаж: только роллапы, итоги по текущему фильтру над списком"""
+    list_display = ('day', 'product', 'category', 'warehouse', 'payment_method', 'quantity', 'revenue', 'orders')
+    list_filter = ('payment_method', 'category', 'warehouse')
+    search_fields = ('product__name', 'product__sku')
+    date_hierarchy = 'day'
+    list_select_related = ('product', 'category', 'warehouse')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        response = super().changelist_view(request, extra_context)
+        cl = getattr(response, 'context_data', {}).get('cl')
+        if cl is not None:
+            response.context_data['sales_totals'] = cl.queryset.aggregate(
+                quantity=Sum('quantity'), revenue=Sum('revenue'), order_lines=Sum('orders')
+            )
+        return response
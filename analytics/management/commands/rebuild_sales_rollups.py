@@ -0,0 +1,38 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from orders.models import Orders
+from analytics.rollups import rebuild
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересобирает роллапы продаж SalesDaily за диапазон дат (по умолчанию — за всю историю заказов). '
+        'Запускать вне пиковой нагрузки: заказы, сменившие статус во время пересборки дня, '
+        'могут быть учтены дважды или пропущены.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='date_from', type=date.fromisoformat, help='Первый день, YYYY-MM-DD')
+        parser.add_argument('--to', dest='date_to', type=date.fromisoformat, help='Последний день, YYYY-MM-DD')
+        parser.add_argument('--workers', type=int, default=4, help='Число параллельных потоков')
+
+    def handle(self, *args, **options):
+        date_from, date_to = options['date_from'], options['date_to']
+        if date_from is None or date_to is None:
+            bounds = Orders.objects.aggregate(first=Min('created_at'), last=Max('created_at'))
+            if bounds['first'] is None:
+                self.stdout.write('Заказов нет — пересобирать нечего')
+                return
+            date_from = date_from or timezone.localdate(bounds['first'])
+            date_to = date_to or timezone.localdate(bounds['last'])
+        if date_from > date_to:
+            raise CommandError('--from позже --to')
+
+        result = rebuild(date_from, date_to, workers=options['workers'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересобрано дней: {len(result)}, строк: {sum(result.values())}'
+        ))
@@ -0,0 +1,46 @@
+from django.db import models
+
+from products.models import Product, Category, Warehouse
+from orders.models import Orders
+
+
+class SalesDaily(models.Model):
+    """
+    Продажи за день в разрезе товара, категории, склада и способа оплаты.
+    Поддерживается инкрементально при смене статуса заказа (analytics.rollups),
+    пересобирается командой rebuild_sales_rollups.
+    """
+    day = models.DateField(verbose_name='День')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+', verbose_name='Товар')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='+', verbose_name='Категория')
+    warehouse = models.ForeignKey(
+        Warehouse, on_delete=models.CASCADE, null=True, blank=True, related_name='+', verbose_name='Склад'
+    )
+    payment_method = models.CharField(max_length=20, choices=Orders.PAYMENT_CHOICES, verbose_name='Способ оплаты')
+    quantity = models.IntegerField(default=0, verbose_name='Количество')
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='Выручка')
+    orders = models.IntegerField(default=0, verbose_name='Заказов')
+
+    class Meta:
+        verbose_name = 'Продажи за день'
+        verbose_name_plural = 'Продажи по дням'
+        ordering = ['-day', 'product']
+        constraints = [
+            # NULL в warehouse не совпадает сам с собой — уникальность делим на два частичных индекса
+            models.UniqueConstraint(
+                fields=['day', 'product', 'category', 'warehouse', 'payment_method'],
+                condition=models.Q(warehouse__isnull=False),
+                name='analytics_salesdaily_key',
+            ),
+            models.UniqueConstraint(
+                fields=['day', 'product', 'category', 'payment_method'],
+                condition=models.Q(warehouse__isnull=True),
+                name='analytics_salesdaily_key_no_warehouse',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['day', 'category']),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.product_id}: {self.revenue} ₽"
@@ -0,0 +1,176 @@
+"""
+Роллапы продаж.
+
+Заказ учитывается в SalesDaily, пока его статус входит в COUNTED_STATUSES.
+Переход в учитываемый статус прибавляет позиции заказа к строкам роллапа,
+выход из него (отмена) — вычитает. День — дата создания заказа в часовом
+поясе проекта, категория — снятая в позиции при заказе (OrderItems.category),
+поэтому пересборка дня даёт тот же результат, что и инкрементальные обновления,
+даже если товар с тех пор перенесли в другую категорию.
+"""
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, time, timedelta
+
+from django.db import connection, transaction
+from django.db.models import Case, Count, DecimalField, F, IntegerField, Sum, Value, When
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from orders.models import OrderItems, ArchivedOrderItem
+from .models import SalesDaily
+
+COUNTED_STATUSES = ('confirmed', 'shipped', 'delivered')
+
+KEY_FIELDS = ('day', 'product_id', 'category_id', 'warehouse_id', 'payment_method')
+
+
+def _item_rows(items, *extra):
+    """Позиции, сгруппированные по ключу роллапа (и полям extra)"""
+    rows = (
+        items
+        .annotate(day=TruncDate('order__created_at', tzinfo=timezone.get_current_timezone()))
+        .values(
+            'day', 'product_id', 'warehouse_id', *extra,
+            # Категория на момент заказа; у позиций до её появления — текущая категория товара
+            sold_category=Coalesce('category_id', 'product__category_id'),
+            payment_method=F('order__payment_method'),
+        )
+        .annotate(qty=Sum('quantity'), rev=Sum('total_price'), n_orders=Count('order_id', distinct=True))
+        .order_by()
+    )
+    for row in rows:
+        row['category_id'] = row.pop('sold_category')
+        yield row
+
+
+def _key(row):
+    return tuple(row[field] for field in KEY_FIELDS)
+
+
+# -----------------------------
+# 🔹 Инкрементальное обновление
+# -----------------------------
+def apply_deltas(deltas):
+    """
+    Прибавляет {ключ: [quantity, revenue, orders]} к строкам SalesDaily.
+    Три запроса на пачку: вставка недостающих строк, чтение их id, один UPDATE с F().
+    """
+    deltas = {key: delta for key, delta in deltas.items() if any(delta)}
+    if not deltas:
+        return 0
+
+    SalesDaily.objects.bulk_create(
+        [SalesDaily(**dict(zip(KEY_FIELDS, key))) for key in deltas],
+        ignore_conflicts=True,
+    )
+    existing = SalesDaily.objects.filter(
+        day__in={key[0] for key in deltas},
+        product_id__in={key[1] for key in deltas},
+    ).values_list('pk', *KEY_FIELDS)
+    pks = {tuple(key): pk for pk, *key in existing if tuple(key) in deltas}
+
+    def case(index, output_field):
+        return Case(
+            *[When(pk=pk, then=Value(deltas[key][index])) for key, pk in pks.items()],
+            default=Value(0),
+            output_field=output_field,
+        )
+
+    return SalesDaily.objects.filter(pk__in=pks.values()).update(
+        quantity=F('quantity') + case(0, IntegerField()),
+        revenue=F('revenue') + case(1, DecimalField(max_digits=14, decimal_places=2)),
+        orders=F('orders') + case(2, IntegerField()),
+    )
+
+
+def apply_transitions(transitions):
+    """Учитывает пачку OrderTransition: + при входе в учитываемый статус, − при выходе"""
+    signs = {}
+    for t in transitions:
+        sign = (t.to_status in COUNTED_STATUSES) - (t.from_status in COUNTED_STATUSES)
+        if sign:
+            signs[t.order_id] = signs.get(t.order_id, 0) + sign
+    signs = {order_id: sign for order_id, sign in signs.items() if sign}
+    if not signs:
+        return 0
+
+    deltas = defaultdict(lambda: [0, 0, 0])
+    for row in _item_rows(OrderItems.objects.filter(order_id__in=signs), 'order_id'):
+        sign = signs[row['order_id']]
+        delta = deltas[_key(row)]
+        delta[0] += sign * row['qty']
+        delta[1] += sign * row['rev']
+        delta[2] += sign
+    return apply_deltas(deltas)
+
+
+# -----------------------------
+# 🔹 Пересборка
+# -----------------------------
+def _day_bounds(day):
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    end = timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+    return start, end
+
+
+def aggregate_day(day):
+    """Роллап за день с нуля по заказам — горячим и архивным (только чтение)"""
+    start, end = _day_bounds(day)
+    totals = defaultdict(lambda: [0, 0, 0])
+    # Заказ лежит либо в горячей таблице, либо в архиве — пересечений нет
+    for model in (OrderItems, ArchivedOrderItem):
+        items = model.objects.filter(
+            order__status__in=COUNTED_STATUSES,
+            order__created_at__gte=start,
+            order__created_at__lt=end,
+        )
+        for row in _item_rows(items):
+            total = totals[_key(row)]
+            total[0] += row['qty']
+            total[1] += row['rev']
+            total[2] += row['n_orders']
+
+    return [
+        SalesDaily(
+            **dict(zip(KEY_FIELDS, key)),
+            quantity=quantity,
+            revenue=revenue,
+            orders=orders,
+        )
+        for key, (quantity, revenue, orders) in totals.items()
+    ]
+
+
+@transaction.atomic
+def replace_day(day, rows):
+    """Заменяет строки роллапа за день одной транзакцией"""
+    SalesDaily.objects.filter(day=day).delete()
+    SalesDaily.objects.bulk_create(rows)
+    return len(rows)
+
+
+def rebuild_day(day):
+    """Пересчитывает роллап за день. Возвращает число строк."""
+    return replace_day(day, aggregate_day(day))
+
+
+def rebuild(date_from, date_to, workers=4):
+    """
+    Пересобирает дни [date_from, date_to]. Тяжёлая часть — агрегация по заказам —
+    идёт параллельно по дню на задачу, каждый поток в своём соединении с БД.
+    Замена строк дня — короткая транзакция в текущем потоке.
+    Возвращает {день: число строк}.
+    """
+    days = [date_from + timedelta(days=i) for i in range((date_to - date_from).days + 1)]
+    if workers <= 1:
+        return {day: rebuild_day(day) for day in days}
+
+    def run(day):
+        try:
+            return aggregate_day(day)
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return {day: replace_day(day, rows) for day, rows in zip(days, pool.map(run, days))}
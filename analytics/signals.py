@@ -0,0 +1,10 @@
+from django.dispatch import receiver
+
+from orders.signals import order_status_changed
+from . import rollups
+
+
+@receiver(order_status_changed)
+def update_sales_rollups(sender, transitions, **kwargs):
+    """Учитывает смену статуса заказов в SalesDaily (в той же транзакции)"""
+    rollups.apply_transitions(transitions)
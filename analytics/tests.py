@@ -0,0 +1,63 @@
+from django.utils import timezone
+
+from orders.state_machine import transition
+from orders.tests import ShopTestCase
+from products.models import Category
+
+from . import rollups
+from .models import SalesDaily
+
+
+class SalesRollupTests(ShopTestCase):
+    def rows(self):
+        """Ненулевые строки роллапа по ключу"""
+        return {
+            rollups._key({field: getattr(row, field) for field in rollups.KEY_FIELDS}): (row.quantity, row.revenue, row.orders)
+            for row in SalesDaily.objects.all()
+            if row.quantity or row.revenue or row.orders
+        }
+
+    def rebuilt(self):
+        rollups.rebuild_day(timezone.localdate())
+        return self.rows()
+
+    def test_incremental_matches_rebuild(self):
+        trout, salmon, pike = self.products
+        first = self.make_order((trout, 2), (salmon, 1))
+        second = self.make_order((trout, 1), (pike, 3))
+        third = self.make_order((salmon, 4))
+        transition([first, second, third], 'confirm')
+        transition([first], 'ship')
+        transition([second], 'cancel')
+
+        incremental = self.rows()
+        self.assertEqual(incremental[rollups._key({
+            'day': timezone.localdate(), 'product_id': salmon.pk, 'category_id': self.fish.pk,
+            'warehouse_id': self.store.pk, 'payment_method': 'cash',
+        })], (5, 500, 2))
+        self.assertEqual(incremental, self.rebuilt())
+
+    def test_category_change_between_sale_and_cancel(self):
+        trout = self.products[0]
+        order = self.make_order((trout, 2))
+        transition([order], 'confirm')
+
+        trout.category = Category.objects.create(name='Красная рыба', slug='red-fish')
+        trout.save()
+        transition([order], 'cancel')
+
+        # Отмена вычитается из той же строки, к которой прибавилась продажа
+        self.assertEqual(self.rows(), {})
+        self.assertFalse(SalesDaily.objects.filter(category=trout.category).exists())
+        self.assertEqual(self.rebuilt(), {})
+
+    def test_sale_stays_in_category_of_order(self):
+        trout = self.products[0]
+        transition([self.make_order((trout, 2))], 'confirm')
+        trout.category = Category.objects.create(name='Красная рыба', slug='red-fish')
+        trout.save()
+        transition([self.make_order((trout, 1))], 'confirm')
+
+        incremental = self.rows()
+        self.assertEqual({key[2]: value[0] for key, value in incremental.items()}, {self.fish.pk: 2, trout.category_id: 1})
+        self.assertEqual(incremental, self.rebuilt())
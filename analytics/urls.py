@@ -0,0 +1,7 @@
+from django.urls import path
+
+from .views import SalesView
+
+urlpatterns = [
+    path('sales/', SalesView.as_view(), name='analytics-sales'),
+]
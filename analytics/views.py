@@ -0,0 +1,69 @@
+from django.db.models import Sum
+from django.utils.dateparse import parse_date
+from rest_framework import status
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .models import SalesDaily
+
+# Разрез → поля группировки (имена подтягиваются вместе с id)
+GROUPS = {
+    'day': ('day',),
+    'product': ('product_id', 'product__name', 'product__sku'),
+    'category': ('category_id', 'category__name'),
+    'warehouse': ('warehouse_id', 'warehouse__name'),
+    'payment_method': ('payment_method',),
+}
+
+FILTERS = {
+    'product': 'product_id',
+    'category': 'category_id',
+    'warehouse': 'warehouse_id',
+    'payment_method': 'payment_method',
+}
+
+
+class SalesView(APIView):
+    """
+    Выручка из роллапов SalesDaily (исходные заказы не читаются).
+
+    GET /analytics/sales/?date_from=2024-01-01&date_to=2024-01-31&group_by=day,category
+    Фильтры: product, category, warehouse, payment_method.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        params = request.query_params
+        qs = SalesDaily.objects.all()
+
+        for name, lookup in (('date_from', 'day__gte'), ('date_to', 'day__lte')):
+            if params.get(name):
+                value = parse_date(params[name])
+                if value is None:
+                    return Response({'error': f'Неверная дата {name}'}, status=status.HTTP_400_BAD_REQUEST)
+                qs = qs.filter(**{lookup: value})
+
+        for name, field in FILTERS.items():
+            if params.get(name):
+                qs = qs.filter(**{field: params[name]})
+
+        group_by = [g for g in params.get('group_by', 'day').split(',') if g]
+        unknown = set(group_by) - set(GROUPS)
+        if unknown:
+            return Response(
+                {'error': 'Неизвестный разрез', 'details': sorted(unknown), 'allowed': list(GROUPS)},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        fields = [field for g in group_by for field in GROUPS[g]]
+
+        # Заказ с несколькими товарами входит в несколько строк роллапа,
+        # поэтому сумма orders — число пар (заказ, строка), а не заказов
+        totals = dict(quantity=Sum('quantity'), revenue=Sum('revenue'), order_lines=Sum('orders'))
+        rows = qs.values(*fields).annotate(**totals).order_by(*fields) if fields else []
+
+        return Response({
+            'group_by': group_by,
+            'rows': list(rows),
+            'totals': qs.aggregate(**totals),
+        })
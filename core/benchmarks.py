@@ -0,0 +1,390 @@
+"""
+Повторяемые замеры на синтетическом наборе (manage.py run_benchmarks).
+
+Сценарии — реальные эндпоинты через тестовый клиент Django (весь стек
+middleware, аутентификация JWT, сериализация и рендер DRF, без сети):
+каталог (список по категории, карточка, поиск — sync и async), проверка
+корзины, импорт и экспорт товаров, создание и подтверждение заказа.
+
+Повторяемость:
+- выбор товаров, категорий и строк импорта — из random.Random(seed, сценарий),
+  поэтому один и тот же seed на том же наборе даёт те же запросы;
+- пишущие сценарии выполняются в транзакции, которая откатывается после
+  каждого повтора: набор не меняется ни между повторами, ни между запусками
+  (COMMIT в замер не входит);
+- первые warmup повторов прогревают кеши процесса и в статистику не входят.
+
+По каждому повтору пишутся время, число и время SQL, сериализация и рендер
+(замер core.profiling), по сценарию — перцентили. Результат — JSON, который
+сравнивается с прошлым запуском (compare()).
+"""
+import csv
+import io
+import json
+import platform
+import random
+import statistics
+import subprocess
+import time
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client, RequestFactory, override_settings
+from django.utils import timezone
+
+from orders import confirmation
+from orders.models import DeliveryAddress, Orders, OrderItems
+from products.models import Category, Product, Stock, Price
+from products.views import ProductExportView
+from users.tokens import ShopRefreshToken
+
+from . import dataset
+from .profiling import Profile, _current, percentile
+
+METRICS = ('total', 'db', 'queries', 'serialize', 'render')
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+# -----------------------------
+# 🔹 Окружение замеров
+# -----------------------------
+class Bench:
+    """Набор, пользователи и клиенты, общие для всех сценариев запуска"""
+
+    def __init__(self, seed, import_rows=100, confirm_orders=10):
+        if not dataset.exists():
+            raise BenchmarkError('Набора нет — сначала manage.py generate_dataset')
+        self.seed = seed
+        self.import_rows = import_rows
+        self.confirm_orders = confirm_orders
+
+        products = Product.objects.filter(sku__startswith=dataset.SKU_PREFIX)
+        self.product_ids = list(products.filter(is_active=True).order_by('pk').values_list('pk', flat=True))
+        self.product_count = products.count()
+        self.category_slugs = list(
+            Category.objects.filter(slug__startswith=dataset.SLUG_PREFIX).order_by('pk').values_list('slug', flat=True)
+        )
+        # Строки остатков, из которых можно собрать заказ: (товар, склад)
+        self.stock_lines = list(
+            Stock.objects.filter(product__sku__startswith=dataset.SKU_PREFIX, product__is_active=True, quantity__gte=10)
+            .order_by('pk').values_list('product_id', 'warehouse_id')
+        )
+        # Импорт обновляет базовую цену через update_or_create — товары с историей базовой цены он не примет
+        self.importable_ids = list(
+            Price.objects.filter(product__sku__startswith=dataset.SKU_PREFIX, price_type__code='base')
+            .values('product_id').annotate(rows=Count('pk')).filter(rows=1)
+            .order_by('product_id').values_list('product_id', flat=True)
+        )
+        if not self.product_ids or not self.category_slugs or not self.stock_lines:
+            raise BenchmarkError('В наборе нет активных товаров с остатками — пересоздайте его')
+
+        User = get_user_model()
+        self.customer = (
+            User.objects.filter(username__startswith=dataset.USERNAME_PREFIX, is_staff=False).order_by('pk').first()
+        )
+        if self.customer is None:
+            raise BenchmarkError('В наборе нет покупателей — пересоздайте его с --users')
+        self.address = DeliveryAddress.objects.filter(user=self.customer).first()
+        self.admin = User.objects.filter(username=dataset.ADMIN_USERNAME).first()
+        if self.admin is None:
+            raise BenchmarkError(f'Нет пользователя {dataset.ADMIN_USERNAME} — пересоздайте набор')
+        self.meta = {
+            'products': self.product_count,
+            'users': User.objects.filter(username__startswith=dataset.USERNAME_PREFIX).count(),
+            'orders': Orders.objects.filter(user__username__startswith=dataset.USERNAME_PREFIX).count(),
+        }
+
+    def rng(self, case):
+        return random.Random(f'{self.seed}:{case}')
+
+    @staticmethod
+    def authorization(user):
+        # Свежий access-токен на сценарий: длинный запуск переживёт ACCESS_TOKEN_LIFETIME
+        return f'Bearer {ShopRefreshToken.for_user(user).access_token}'
+
+    def client(self, user):
+        return Client(HTTP_HOST='localhost', HTTP_AUTHORIZATION=self.authorization(user))
+
+
+def expect_ok(response):
+    if not 200 <= response.status_code < 300:
+        body = getattr(response, 'content', b'')[:500].decode(errors='replace')
+        raise BenchmarkError(f'Ответ {response.status_code}: {body}')
+    return response
+
+
+# -----------------------------
+# 🔹 Сценарии
+# -----------------------------
+class Case:
+    """
+    prepare(bench, rng) -> payload — до замера (в той же транзакции у пишущих),
+    run(bench, payload) — замеряемая часть.
+    """
+
+    def __init__(self, name, run, prepare=None, writes=False):
+        self.name = name
+        self.run = run
+        self.prepare = prepare or (lambda bench, rng: None)
+        self.writes = writes
+
+
+CASES = {}
+
+
+def case(name, writes=False, prepare=None):
+    def decorator(run):
+        CASES[name] = Case(name, run, prepare=prepare, writes=writes)
+        return run
+    return decorator
+
+
+def setup_client(user_attr):
+    """prepare, которому нужен только клиент пользователя и rng"""
+    return lambda bench, rng: (bench.client(getattr(bench, user_attr)), rng)
+
+
+# Список без пагинации: страница каталога — это фильтр по категории
+@case('catalog-list', prepare=setup_client('customer'))
+def catalog_list(bench, payload):
+    client, rng = payload
+    expect_ok(client.get('/products/products/', {'category__slug': rng.choice(bench.category_slugs)}))
+
+
+@case('catalog-list-async', prepare=setup_client('customer'))
+def catalog_list_async(bench, payload):
+    client, rng = payload
+    expect_ok(client.get('/products/async/products/', {'category__slug': rng.choice(bench.category_slugs)}))
+
+
+@case('catalog-detail', prepare=setup_client('customer'))
+def catalog_detail(bench, payload):
+    client, rng = payload
+    expect_ok(client.get(f'/products/products/{rng.choice(bench.product_ids)}/'))
+
+
+@case('catalog-detail-async', prepare=setup_client('customer'))
+def catalog_detail_async(bench, payload):
+    client, rng = payload
+    expect_ok(client.get(f'/products/async/products/{rng.choice(bench.product_ids)}/'))
+
+
+@case('search', prepare=setup_client('customer'))
+def search(bench, payload):
+    client, rng = payload
+    expect_ok(client.get('/products/products/', {'search': rng.choice(dataset.NOUNS)}))
+
+
+@case('availability', prepare=setup_client('customer'))
+def availability(bench, payload):
+    client, rng = payload
+    items = [
+        {'product_id': product_id, 'warehouse_id': warehouse_id, 'quantity': rng.randint(1, 3)}
+        for product_id, warehouse_id in rng.sample(bench.stock_lines, min(10, len(bench.stock_lines)))
+    ]
+    expect_ok(client.post('/products/availability/', {'items': items}, content_type='application/json'))
+
+
+def import_file(bench, rng):
+    """CSV в формате ProductImportView: половина строк обновляет товары набора, половина — новые"""
+    stream = io.StringIO()
+    writer = csv.writer(stream)
+    writer.writerow([
+        'Категория', 'Теги', 'Единица', 'SKU', 'Название', 'Описание', 'Активен',
+        'Происхождение', 'Срок годности', 'Цена (базовая)', 'Склад', 'Остаток',
+    ])
+    categories = list(Category.objects.filter(slug__startswith=dataset.SLUG_PREFIX).values_list('name', flat=True))
+    updated = rng.sample(bench.importable_ids, min(bench.import_rows // 2, len(bench.importable_ids)))
+    numbers = [
+        int(sku[len(dataset.SKU_PREFIX):])
+        for sku in Product.objects.filter(pk__in=updated).order_by('pk').values_list('sku', flat=True)
+    ]
+    numbers += range(bench.product_count + 1, bench.product_count + 1 + bench.import_rows - len(numbers))
+    for number in numbers:
+        writer.writerow([
+            rng.choice(categories), ', '.join(rng.sample(dataset.TAGS, 2)), 'pcs', dataset.product_sku(number),
+            dataset.product_name(rng, number), 'Импорт для замера', 1, rng.choice(dataset.ORIGINS),
+            f'2030-{rng.randint(1, 12):02d}-01', rng.randint(100, 5000), f'{dataset.WAREHOUSE_PREFIX}Склад 1',
+            rng.randint(0, 300),
+        ])
+    upload = io.BytesIO(stream.getvalue().encode())
+    upload.name = 'benchmark.csv'
+    return bench.client(bench.admin), upload
+
+
+@case('import', writes=True, prepare=import_file)
+def product_import(bench, payload):
+    client, upload = payload
+    data = expect_ok(client.post('/products/product-import/', {'file': upload})).json()
+    if data['errors']:
+        raise BenchmarkError(f'Ошибки импорта: {data["errors"][:3]}')
+
+
+# ProductExportView не подключён к urls — вызываем представление напрямую
+@case('export', prepare=lambda bench, rng: RequestFactory().get(
+    '/products/export/', HTTP_HOST='localhost', HTTP_AUTHORIZATION=bench.authorization(bench.admin),
+))
+def product_export(bench, request):
+    expect_ok(ProductExportView.as_view()(request)).render()
+
+
+def order_payload(bench, rng):
+    items = [
+        {'product_id': product_id, 'warehouse_id': warehouse_id, 'quantity': rng.randint(1, 3)}
+        for product_id, warehouse_id in rng.sample(bench.stock_lines, min(5, len(bench.stock_lines)))
+    ]
+    return bench.client(bench.customer), {'address_id': bench.address.pk, 'payment_method': 'card', 'items': items}
+
+
+@case('order-create', writes=True, prepare=order_payload)
+def order_create(bench, payload):
+    client, data = payload
+    expect_ok(client.post('/orders/create/', data, content_type='application/json'))
+
+
+def new_orders(bench, rng):
+    """confirm_orders новых заказов по 3 позиции — без замера, в откатываемой транзакции"""
+    orders = Orders.objects.bulk_create([
+        Orders(user=bench.customer, address=bench.address) for _ in range(bench.confirm_orders)
+    ])
+    OrderItems.objects.bulk_create([
+        OrderItems(order=order, product_id=product_id, warehouse_id=warehouse_id,
+                   price_per_unit=100, quantity=1, total_price=100)
+        for order in orders
+        for product_id, warehouse_id in rng.sample(bench.stock_lines, min(3, len(bench.stock_lines)))
+    ])
+    return [order.pk for order in orders]
+
+
+@case('order-confirm', writes=True, prepare=new_orders)
+def order_confirm(bench, order_ids):
+    # Путь админки: очередь и воркер, пачкой на все заказы
+    confirmation.enqueue(order_ids, user=bench.admin)
+    while confirmation.process_batch(len(order_ids)):
+        pass
+    confirmed = Orders.objects.filter(pk__in=order_ids, status='confirmed').count()
+    if confirmed != len(order_ids):
+        raise BenchmarkError(f'Подтверждено {confirmed} из {len(order_ids)} заказов')
+
+
+# -----------------------------
+# 🔹 Запуск
+# -----------------------------
+def measure(case, bench, rng):
+    """Один повтор: Profile с полями METRICS"""
+    payload = case.prepare(bench, rng)
+    profile = Profile()
+    token = _current.set(profile)
+    try:
+        case.run(bench, payload)
+    finally:
+        _current.reset(token)
+    profile.finish()
+    return profile
+
+
+def run_case(case, bench, iterations, warmup):
+    rng = bench.rng(case.name)
+    samples = []
+    for index in range(warmup + iterations):
+        if case.writes:
+            with transaction.atomic():
+                profile = measure(case, bench, rng)
+                transaction.set_rollback(True)
+        else:
+            profile = measure(case, bench, rng)
+        if index >= warmup:
+            samples.append(profile.sample())
+    return summarize(samples)
+
+
+def summarize(samples):
+    result = {'iterations': len(samples)}
+    for index, metric in enumerate(METRICS):
+        values = sorted(sample[index] for sample in samples)
+        result[metric] = {
+            'p50': percentile(values, 50),
+            'p95': percentile(values, 95),
+            'mean': round(statistics.fmean(values), 2),
+            'max': round(values[-1], 2),
+        }
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, timeout=5,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run(cases=None, seed=42, iterations=20, warmup=2, import_rows=100, confirm_orders=10, log=None):
+    """Прогоняет сценарии. Возвращает отчёт {'meta': ..., 'cases': {имя: статистика}}."""
+    log = log or (lambda message: None)
+    names = list(cases or CASES)
+    unknown = set(names) - set(CASES)
+    if unknown:
+        raise BenchmarkError(f'Неизвестные сценарии: {", ".join(sorted(unknown))}')
+
+    bench = Bench(seed, import_rows=import_rows, confirm_orders=confirm_orders)
+    report = {
+        'meta': {
+            'seed': seed,
+            'iterations': iterations,
+            'warmup': warmup,
+            'dataset': bench.meta,
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'revision': git_revision(),
+            'started_at': timezone.now().isoformat(),
+        },
+        'cases': {},
+    }
+    # Выборочное профилирование middleware перехватило бы замер запроса,
+    # а сотни запросов одного покупателя упёрлись бы в троттлинг
+    with override_settings(PROFILING_SAMPLE_RATE=0, THROTTLE_ENABLED=False):
+        for name in names:
+            started = time.perf_counter()
+            report['cases'][name] = stats = run_case(CASES[name], bench, iterations, warmup)
+            log(f'{name:<22} p50 {stats["total"]["p50"]:>9.1f} мс  p95 {stats["total"]["p95"]:>9.1f} мс  '
+                f'SQL {stats["queries"]["p50"]:>5.0f}  ({time.perf_counter() - started:.1f} сек)')
+    return report
+
+
+# -----------------------------
+# 🔹 Сравнение запусков
+# -----------------------------
+def compare(previous, current, metric='total', stat='p50', threshold=10.0):
+    """
+    [(сценарий, было, стало, изменение %, регрессия?)] по общим сценариям.
+    Регрессия — рост больше threshold процентов.
+    """
+    rows = []
+    for name, stats in current['cases'].items():
+        before = previous.get('cases', {}).get(name)
+        if before is None:
+            continue
+        old, new = before[metric][stat], stats[metric][stat]
+        change = (new - old) / old * 100 if old else 0.0
+        rows.append((name, old, new, round(change, 1), change > threshold))
+    return rows
+
+
+def load(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def dump(report, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,279 @@
+"""
+Синтетический набор данных для нагрузочных замеров (manage.py generate_dataset).
+
+Один и тот же seed даёт один и тот же набор: категории, теги, единицы, типы цен
+с историей цен, остатки по нескольким складам, записи фото (без файлов),
+покупатели с адресами и заказы с позициями. Всё пишется bulk_create пачками,
+поэтому сигналы не срабатывают — производные данные пересчитываются в конце
+явно: stock_cache, суммы заказов, версии справочников (refcache) и роллапы продаж.
+
+Все строки помечены префиксом (SKU BENCH-…, логины bench_…, slug bench-…),
+clear() удаляет только их — рядом с настоящим каталогом набор безопасен.
+"""
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from analytics.rollups import rebuild
+from orders.models import DeliveryAddress, Orders, OrderItems
+from products import refcache
+from products.models import Category, Tag, Unit, Product, ProductImage, Warehouse, Stock, PriceType, Price
+
+SKU_PREFIX = 'BENCH-'
+USERNAME_PREFIX = 'bench_'
+SLUG_PREFIX = 'bench-'
+WAREHOUSE_PREFIX = 'bench: '
+PASSWORD = 'bench-password'
+ADMIN_USERNAME = USERNAME_PREFIX + 'admin'  # импорт и экспорт в замерах
+
+BATCH_SIZE = 1000
+
+CATEGORIES = [
+    'Сыры', 'Колбасы', 'Молочное', 'Выпечка', 'Овощи', 'Фрукты', 'Мясо', 'Рыба',
+    'Бакалея', 'Напитки', 'Сладости', 'Заморозка', 'Чай и кофе', 'Специи', 'Соусы',
+]
+NOUNS = [
+    'Сыр', 'Колбаса', 'Йогурт', 'Хлеб', 'Томаты', 'Яблоки', 'Говядина', 'Сёмга',
+    'Гречка', 'Сок', 'Шоколад', 'Пельмени', 'Чай', 'Перец', 'Кетчуп', 'Масло',
+]
+ADJECTIVES = ['фермерский', 'домашний', 'отборный', 'классический', 'копчёный', 'свежий', 'органический']
+TAGS = ['хит', 'новинка', 'скидка', 'без сахара', 'веган', 'халяль', 'без глютена', 'местное', 'премиум', 'сезонное']
+ORIGINS = ['Россия', 'Беларусь', 'Армения', 'Италия', 'Сербия', 'Абхазия', '']
+CITIES = ['Москва', 'Санкт-Петербург', 'Казань', 'Екатеринбург', 'Новосибирск']
+STREETS = ['Ленина', 'Мира', 'Садовая', 'Центральная', 'Лесная', 'Школьная']
+UNITS = [('pcs', 'шт'), ('kg', 'кг'), ('g', 'г'), ('l', 'л')]
+PRICE_TYPES = [
+    # (code, название, множитель к базовой цене); base — тот же тип, что у импорта
+    ('base', 'Базовая цена', Decimal('1.00')),
+    (SLUG_PREFIX + 'wholesale', 'bench: Оптовая', Decimal('0.85')),
+    (SLUG_PREFIX + 'club', 'bench: Клубная', Decimal('0.93')),
+]
+# Статусы заказов с весами: большая часть истории уже доставлена
+ORDER_STATUSES = [('new', 15), ('confirmed', 10), ('shipped', 5), ('delivered', 60), ('cancelled', 10)]
+
+
+def exists():
+    return Product.objects.filter(sku__startswith=SKU_PREFIX).exists()
+
+
+def product_sku(number):
+    return f'{SKU_PREFIX}{number:06d}'
+
+
+def chunks(ids):
+    """pk__in пачками: у SQLite ограничено число параметров запроса"""
+    for start in range(0, len(ids), BATCH_SIZE):
+        yield ids[start:start + BATCH_SIZE]
+
+
+def product_name(rng, number):
+    # Номер латиницей в названии: slugify(название) импорта совпадает со slug набора
+    return f'{rng.choice(NOUNS)} {rng.choice(ADJECTIVES)} {SLUG_PREFIX}{number:06d}'
+
+
+# -----------------------------
+# 🔹 Генерация
+# -----------------------------
+@transaction.atomic
+def generate(products=1000, users=100, orders=500, warehouses=3, seed=42, log=None):
+    """Создаёт набор. Возвращает {модель: создано строк}."""
+    rng = random.Random(seed)
+    now = timezone.now()
+    log = log or (lambda message: None)
+    counts = {}
+
+    def create(model, rows):
+        created = model.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+        counts[model.__name__] = counts.get(model.__name__, 0) + len(created)
+        return created
+
+    # Справочники
+    units = [Unit.objects.get_or_create(code=code, defaults={'name': name})[0] for code, name in UNITS]
+    price_types = [
+        (PriceType.objects.get_or_create(code=code, defaults={'name': name})[0], factor)
+        for code, name, factor in PRICE_TYPES
+    ]
+    category_count = max(1, min(len(CATEGORIES) * 4, products // 50))
+    categories = create(Category, [
+        Category(name=f'{CATEGORIES[i % len(CATEGORIES)]} {i + 1}', slug=f'{SLUG_PREFIX}category-{i + 1}')
+        for i in range(category_count)
+    ])
+    tags = create(Tag, [Tag(name=name, slug=f'{SLUG_PREFIX}tag-{i + 1}') for i, name in enumerate(TAGS)])
+    stores = create(Warehouse, [Warehouse(name=f'{WAREHOUSE_PREFIX}Склад {i + 1}') for i in range(warehouses)])
+
+    # Товары
+    log(f'Товары: {products}')
+    catalog = create(Product, [
+        Product(
+            name=product_name(rng, number),
+            slug=f'{SLUG_PREFIX}{number:06d}',
+            sku=product_sku(number),
+            description=f'Синтетический товар №{number} для нагрузочных замеров.',
+            category=rng.choice(categories),
+            unit=rng.choice(units),
+            is_active=rng.random() < 0.95,
+            is_featured=rng.random() < 0.05,
+            origin=rng.choice(ORIGINS),
+            expiration_date=(now + timedelta(days=rng.randint(5, 365))).date() if rng.random() < 0.6 else None,
+        )
+        for number in range(1, products + 1)
+    ])
+
+    through = Product.tags.through
+    create(through, [
+        through(product_id=product.pk, tag_id=tag.pk)
+        for product in catalog
+        for tag in rng.sample(tags, rng.randint(0, 3))
+    ])
+
+    # Цены: у каждого типа 1–3 записи истории, действует последняя
+    base_prices = {}
+    price_rows = []
+    for product in catalog:
+        base = Decimal(rng.randint(4000, 250000)) / 100
+        base_prices[product.pk] = base
+        for price_type, factor in price_types:
+            history = rng.randint(1, 3)
+            start = now - timedelta(days=30 * history)
+            for step in range(history):
+                drift = Decimal(1 + (history - step - 1) * rng.uniform(-0.08, 0.04)).quantize(Decimal('0.0001'))
+                end = start + timedelta(days=30) if step < history - 1 else None
+                price_rows.append(Price(
+                    product=product, price_type=price_type,
+                    value=(base * factor * drift).quantize(Decimal('0.01')),
+                    start_date=start, end_date=end,
+                ))
+                start = end or start
+        # Акция поверх базовой цены у части товаров
+        if rng.random() < 0.1:
+            price_rows.append(Price(
+                product=product, price_type=price_types[0][0], priority=1,
+                value=(base * Decimal('0.8')).quantize(Decimal('0.01')),
+                start_date=now - timedelta(days=3), end_date=now + timedelta(days=rng.randint(1, 14)),
+            ))
+    create(Price, price_rows)
+
+    # Остатки: товар лежит на 1–N складах
+    stock_by_product = {}
+    stock_rows = []
+    for product in catalog:
+        for store in rng.sample(stores, rng.randint(1, len(stores))):
+            stock_rows.append(Stock(
+                product=product, warehouse=store, unit_id=product.unit_id, quantity=rng.randint(0, 500),
+            ))
+            stock_by_product.setdefault(product.pk, []).append(store.pk)
+    create(Stock, stock_rows)
+
+    # Фото: только записи, файлов в хранилище нет
+    create(ProductImage, [
+        ProductImage(
+            product=product, is_main=(index == 0), alt_text=product.name,
+            image=f'product_images/bench/{product.sku}-{index + 1}.jpg',
+            width=1200, height=1200, content_hash='%064x' % rng.getrandbits(256),
+        )
+        for product in catalog
+        for index in range(rng.randint(0, 3))
+    ])
+    for chunk in chunks([product.pk for product in catalog]):
+        Product.refresh_stock_cache(chunk)
+
+    # Покупатели: один хеш пароля на всех — PBKDF2 на каждого занял бы минуты
+    log(f'Покупатели: {users}')
+    password = make_password(PASSWORD)
+    customers = create(get_user_model(), [
+        get_user_model()(
+            username=f'{USERNAME_PREFIX}{number:05d}', email=f'{USERNAME_PREFIX}{number:05d}@example.com',
+            password=password, date_joined=now - timedelta(days=rng.randint(0, 365)),
+        )
+        for number in range(1, users + 1)
+    ])
+    create(get_user_model(), [get_user_model()(
+        username=ADMIN_USERNAME, email=f'{ADMIN_USERNAME}@example.com', password=password,
+        is_staff=True, is_superuser=True,
+    )])
+    addresses = create(DeliveryAddress, [
+        DeliveryAddress(
+            user=user, city=rng.choice(CITIES), street=rng.choice(STREETS),
+            house=str(rng.randint(1, 150)), apartment=str(rng.randint(1, 300)),
+        )
+        for user in customers
+    ])
+    address_by_user = {address.user_id: address for address in addresses}
+
+    # Заказы за последние полгода
+    log(f'Заказы: {orders}')
+    orderable = [product for product in catalog if product.is_active]
+    statuses, weights = zip(*ORDER_STATUSES)
+    order_rows = [
+        Orders(
+            user=user, address=address_by_user[user.pk],
+            payment_method=rng.choice(Orders.PAYMENT_CHOICES)[0],
+            status=rng.choices(statuses, weights)[0],
+        )
+        for user in (rng.choice(customers) for _ in range(orders if customers and orderable else 0))
+    ]
+    history = create(Orders, order_rows)
+    # auto_now_add при bulk_create ставит «сейчас»; bulk_update пишет значения как есть
+    for order in history:
+        order.created_at = order.updated_at = now - timedelta(minutes=rng.randint(0, 180 * 24 * 60))
+    Orders.objects.bulk_update(history, ['created_at', 'updated_at'], batch_size=BATCH_SIZE)
+
+    item_rows = []
+    for order in history:
+        for product in rng.sample(orderable, min(len(orderable), rng.randint(1, 5))):
+            quantity = rng.randint(1, 4)
+            price = base_prices[product.pk]
+            item_rows.append(OrderItems(
+                order=order, product=product, warehouse_id=rng.choice(stock_by_product[product.pk]),
+                category_id=product.category_id,
+                price_per_unit=price, quantity=quantity, total_price=price * quantity,
+            ))
+    create(OrderItems, item_rows)
+    for chunk in chunks([order.pk for order in history]):
+        Orders.recalc_totals(chunk)
+
+    refcache.bump(Category, Tag, Unit, PriceType, Warehouse)
+    rebuild_rollups(order_dates())
+    return counts
+
+
+def order_dates():
+    """Первая и последняя даты заказов набора"""
+    return Orders.objects.filter(user__username__startswith=USERNAME_PREFIX).aggregate(
+        first=Min('created_at'), last=Max('created_at'),
+    )
+
+
+def rebuild_rollups(bounds):
+    """Роллапы продаж ведут сигналы заказов, а bulk_create и каскадное удаление их обходят"""
+    if bounds['first'] is not None:
+        rebuild(timezone.localdate(bounds['first']), timezone.localdate(bounds['last']), workers=1)
+
+
+# -----------------------------
+# 🔹 Удаление
+# -----------------------------
+@transaction.atomic
+def clear():
+    """Удаляет набор (только помеченные строки). Возвращает число удалённых объектов."""
+    deleted = 0
+    bounds = order_dates()
+    # Пользователи первыми: позиции их заказов защищают товары (PROTECT)
+    for queryset in (
+        get_user_model().objects.filter(username__startswith=USERNAME_PREFIX),
+        Product.objects.filter(sku__startswith=SKU_PREFIX),
+        Category.objects.filter(slug__startswith=SLUG_PREFIX),
+        Tag.objects.filter(slug__startswith=SLUG_PREFIX),
+        PriceType.objects.filter(code__startswith=SLUG_PREFIX),
+        Warehouse.objects.filter(name__startswith=WAREHOUSE_PREFIX),
+    ):
+        deleted += queryset.delete()[0]
+    refcache.bump(Category, Tag, PriceType, Warehouse)
+    rebuild_rollups(bounds)
+    return deleted
@@ -0,0 +1,138 @@
+"""
+Чтение каталога с реплик, запись — в основную БД.
+
+Реплики перечислены в DATABASE_REPLICAS (алиасы из DATABASES). На реплику
+уходят только чтения запроса, который явно это разрешил (ReplicaReadMixin
+у представлений каталога и выгрузки), всё остальное — заказы, админка,
+импорт, фоновые команды — работает с 'default' как раньше.
+
+Чтение своих записей: запрос, который что-то записал, закрепляет клиента
+за основной БД на DATABASE_PIN_SECONDS — кукой (браузер, аноним) и ключом
+в кеше по пользователю (клиенты с токеном). Пока закрепление действует,
+его чтения идут в 'default', даже если реплика отстаёт.
+"""
+import random
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_COOKIE = 'db_primary_until'
+
+
+class RoutingState:
+    """Состояние одного запроса: выбранная реплика и была ли запись"""
+
+    def __init__(self):
+        self.replica = None
+        self.wrote = False
+
+
+_state = ContextVar('db_routing', default=None)
+
+
+def replicas():
+    return list(getattr(settings, 'DATABASE_REPLICAS', ()))
+
+
+def begin():
+    """Новое состояние маршрутизации; вернуть токен в end()"""
+    return _state.set(RoutingState())
+
+
+def end(token):
+    _state.reset(token)
+
+
+def current():
+    return _state.get()
+
+
+def use_replica():
+    """Направляет дальнейшие чтения запроса на случайную реплику (одну на запрос)"""
+    state = _state.get()
+    aliases = replicas()
+    if state is None or not aliases or state.wrote:
+        return None
+    if state.replica is None:
+        state.replica = random.choice(aliases)
+    return state.replica
+
+
+# -----------------------------
+# 🔹 Закрепление за основной БД
+# -----------------------------
+def _user_key(user_id):
+    return f'db-pin:user:{user_id}'
+
+
+def pin(request, response):
+    """После записи: клиент читает из основной БД ещё DATABASE_PIN_SECONDS"""
+    seconds = settings.DATABASE_PIN_SECONDS
+    until = time.time() + seconds
+    response.set_cookie(PIN_COOKIE, f'{until:.3f}', max_age=seconds, httponly=True, samesite='Lax')
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        cache.set(_user_key(user.pk), until, seconds)
+
+
+def _cookie_pinned(request):
+    try:
+        return float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def is_pinned(request):
+    if _cookie_pinned(request):
+        return True
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return (cache.get(_user_key(user.pk)) or 0) > time.time()
+    return False
+
+
+async def ais_pinned(request, user):
+    """is_pinned для async-представлений (пользователь уже аутентифицирован ими)"""
+    if _cookie_pinned(request):
+        return True
+    if user is not None and user.is_authenticated:
+        return (await cache.aget(_user_key(user.pk)) or 0) > time.time()
+    return False
+
+
+# -----------------------------
+# 🔹 Роутер
+# -----------------------------
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state.replica is None:
+            return DEFAULT_DB_ALIAS
+        # Внутри транзакции читаем то, что в неё же пишем
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            # Остаток запроса и следующие запросы клиента читают свои записи из основной БД
+            state.wrote = True
+            state.replica = None
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики — копии основной БД: объекты с любой из них совместимы
+        aliases = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схему реплик приносит репликация
+        if db in replicas():
+            return False
+        return None
@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import dataset
+
+
+class Command(BaseCommand):
+    help = (
+        'Синтетический каталог, покупатели и заказы для нагрузочных замеров (core/dataset.py). '
+        'Один и тот же --seed даёт один и тот же набор. Строки помечены префиксом bench, '
+        '--clear удаляет только их.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1000)
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--orders', type=int, default=500)
+        parser.add_argument('--warehouses', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--clear', action='store_true', help='Удалить прежний набор перед генерацией')
+        parser.add_argument('--clear-only', action='store_true', help='Только удалить набор')
+
+    def handle(self, *args, **options):
+        if options['clear'] or options['clear_only']:
+            self.stdout.write(f'Удалено объектов: {dataset.clear()}')
+            if options['clear_only']:
+                return
+        if dataset.exists():
+            raise CommandError('Набор уже есть — запустите с --clear, чтобы пересоздать его')
+        if options['warehouses'] < 1:
+            raise CommandError('--warehouses должно быть не меньше 1')
+
+        started = time.perf_counter()
+        counts = dataset.generate(
+            products=options['products'], users=options['users'], orders=options['orders'],
+            warehouses=options['warehouses'], seed=options['seed'], log=self.stdout.write,
+        )
+        for model, count in counts.items():
+            self.stdout.write(f'{model:<24} {count:>9}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Набор seed={options["seed"]} создан за {time.perf_counter() - started:.1f} сек'
+        ))
@@ -0,0 +1,64 @@
+import json
+import urllib.error
+import urllib.request
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import profiling
+
+
+class Command(BaseCommand):
+    help = (
+        'p50/p95/p99 по эндпоинтам из скользящих окон профилирования (core/profiling.py). '
+        'Окна живут в памяти процесса сервера, поэтому команда читает их через GET /core/profiling/.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://localhost:8000/core/profiling/')
+        parser.add_argument('--auth', default='', help='Значение Authorization сотрудника: "Bearer <jwt>" или "Token <key>"')
+        parser.add_argument('--sort', choices=profiling.METRICS, default='total', help='Сортировка по p95 метрики')
+        parser.add_argument('--json', action='store_true', help='Вывести ответ как есть')
+        parser.add_argument('--reset', action='store_true', help='Очистить окна после вывода')
+
+    def handle(self, *args, **options):
+        data = self.call(options['url'], options['auth'])
+        if options['json']:
+            self.stdout.write(json.dumps(data, ensure_ascii=False, indent=2))
+        else:
+            self.print_table(data, options['sort'])
+        if options['reset']:
+            self.call(options['url'], options['auth'], method='DELETE')
+
+    def call(self, url, auth, method='GET'):
+        request = urllib.request.Request(url, method=method)
+        if auth:
+            request.add_header('Authorization', auth)
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                body = response.read()
+        except urllib.error.HTTPError as e:
+            raise CommandError(f'{method} {url}: HTTP {e.code} {e.read()[:300]!r}')
+        except urllib.error.URLError as e:
+            raise CommandError(f'{method} {url}: {e.reason}')
+        return json.loads(body) if body else None
+
+    def print_table(self, data, sort):
+        endpoints = data['endpoints']
+        self.stdout.write(f'Процесс {data["pid"]}, доля замеров {data["sample_rate"]}')
+        if not endpoints:
+            self.stdout.write('Замеров нет: включите PROFILING_SAMPLE_RATE или шлите X-Profile: 1')
+            return
+
+        self.stdout.write(
+            f'{"эндпоинт":<40} {"n":>6} {"total p50":>10} {"p95":>8} {"p99":>8} '
+            f'{"db p95":>8} {"SQL p95":>8} {"ser p95":>8} {"rnd p95":>8}'
+        )
+        rows = sorted(endpoints.items(), key=lambda item: item[1][sort]['p95'], reverse=True)
+        for endpoint, stats in rows:
+            total = stats['total']
+            self.stdout.write(
+                f'{endpoint[:40]:<40} {stats["count"]:>6} {total["p50"]:>10.1f} {total["p95"]:>8.1f} '
+                f'{total["p99"]:>8.1f} {stats["db"]["p95"]:>8.1f} {stats["queries"]["p95"]:>8.0f} '
+                f'{stats["serialize"]["p95"]:>8.1f} {stats["render"]["p95"]:>8.1f}'
+            )
+        self.stdout.write('Время в мс')
@@ -0,0 +1,64 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core import benchmarks
+from core.benchmarks import BenchmarkError
+
+
+class Command(BaseCommand):
+    help = (
+        'Повторяемые замеры каталога, импорта/экспорта и заказов на наборе generate_dataset '
+        '(core/benchmarks.py). Результат — JSON; --compare сравнивает его с прошлым запуском.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default='benchmarks.json', help='Куда записать результат')
+        parser.add_argument('--compare', help='JSON прошлого запуска для сравнения')
+        parser.add_argument('--cases', nargs='+', choices=sorted(benchmarks.CASES), help='Только эти сценарии')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--import-rows', type=int, default=100, help='Строк в файле сценария import')
+        parser.add_argument('--confirm-orders', type=int, default=10, help='Заказов в пачке сценария order-confirm')
+        parser.add_argument('--threshold', type=float, default=10.0, help='Рост p50, %%, который считается регрессией')
+        parser.add_argument('--fail-on-regression', action='store_true', help='Код выхода 1 при регрессии')
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('--iterations должно быть не меньше 1')
+        previous = None
+        if options['compare']:
+            try:
+                previous = benchmarks.load(options['compare'])
+            except (OSError, ValueError) as e:
+                raise CommandError(f'Не удалось прочитать {options["compare"]}: {e}')
+
+        try:
+            report = benchmarks.run(
+                cases=options['cases'], seed=options['seed'], iterations=options['iterations'],
+                warmup=options['warmup'], import_rows=options['import_rows'],
+                confirm_orders=options['confirm_orders'], log=self.stdout.write,
+            )
+        except BenchmarkError as e:
+            raise CommandError(str(e))
+        benchmarks.dump(report, options['output'])
+        self.stdout.write(self.style.SUCCESS(f'Результат: {options["output"]}'))
+
+        if previous is not None:
+            self.report_comparison(previous, report, options['threshold'], options['fail_on_regression'])
+
+    def report_comparison(self, previous, report, threshold, fail):
+        for key in ('seed', 'dataset', 'database'):
+            if previous['meta'].get(key) != report['meta'][key]:
+                self.stdout.write(self.style.WARNING(
+                    f'{key} отличается от прошлого запуска: {previous["meta"].get(key)} → {report["meta"][key]}'
+                ))
+
+        rows = benchmarks.compare(previous, report, threshold=threshold)
+        self.stdout.write(f'\n{"сценарий":<22} {"было p50":>10} {"стало p50":>10} {"изм.":>8}')
+        for name, old, new, change, regressed in rows:
+            line = f'{name:<22} {old:>10.1f} {new:>10.1f} {change:>+7.1f}%'
+            self.stdout.write(self.style.ERROR(line) if regressed else line)
+
+        regressions = [row[0] for row in rows if row[4]]
+        if regressions and fail:
+            raise CommandError(f'Регрессия больше {threshold}%: {", ".join(regressions)}')
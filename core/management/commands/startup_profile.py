@@ -0,0 +1,54 @@
+import statistics
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core import startup
+
+
+class Command(BaseCommand):
+    help = (
+        'Холодный старт воркера в отдельном интерпретаторе (core/startup.py): время загрузки, '
+        'пиковая память и время импорта по пакетам или модулям (python -X importtime).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=20, help='Сколько строк показать')
+        parser.add_argument('--modules', action='store_true', help='По модулям, а не по пакетам верхнего уровня')
+        parser.add_argument('--repeat', type=int, default=3, help='Запусков без importtime для медианы времени')
+        parser.add_argument('--check', action='store_true', help='Код выхода 1, если бюджет превышен')
+
+    def handle(self, *args, **options):
+        try:
+            # importtime сам замедляет загрузку — время и память берём из отдельных запусков
+            boots = [startup.measure() for _ in range(max(1, options['repeat']))]
+            profile = startup.measure(importtime=True)
+        except RuntimeError as e:
+            raise CommandError(str(e))
+
+        seconds = statistics.median(boot.seconds for boot in boots)
+        rss_mb = statistics.median(boot.rss_mb for boot in boots)
+        if options['modules']:
+            rows = sorted(((name, own) for name, own, _ in profile.imports), key=lambda row: row[1], reverse=True)
+        else:
+            rows = profile.by_package()
+
+        self.stdout.write(f'{"модуль" if options["modules"] else "пакет":<48} {"мс":>8}')
+        for name, own in rows[:options['top']]:
+            self.stdout.write(f'{name:<48} {own:>8.1f}')
+
+        over = []
+        line = f'\nСтарт: {seconds:.2f} сек (бюджет {settings.STARTUP_TIME_BUDGET}), '
+        line += f'память: {rss_mb:.0f} МБ (бюджет {settings.STARTUP_RSS_BUDGET_MB})'
+        if seconds > settings.STARTUP_TIME_BUDGET:
+            over.append('время')
+        if rss_mb > settings.STARTUP_RSS_BUDGET_MB:
+            over.append('память')
+        eager = profile.eager()
+        if eager:
+            over.append('импорты')
+            line += f'\nЗагружены при старте: {", ".join(eager)}'
+        self.stdout.write(self.style.ERROR(line) if over else self.style.SUCCESS(line))
+
+        if over and options['check']:
+            raise CommandError(f'Бюджет старта превышен: {", ".join(over)}')
@@ -0,0 +1,41 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+
+from . import db_router
+
+
+class PrimaryStickinessMiddleware:
+    """
+    Состояние маршрутизации БД на время запроса (см. core/db_router.py).
+    Если запрос что-то записал, клиент закрепляется за основной БД.
+    Работает и под WSGI, и под ASGI без перехода в поток.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = db_router.begin()
+        try:
+            response = self.get_response(request)
+            if db_router.current().wrote:
+                db_router.pin(request, response)
+            return response
+        finally:
+            db_router.end(token)
+
+    async def __acall__(self, request):
+        token = db_router.begin()
+        try:
+            response = await self.get_response(request)
+            if db_router.current().wrote:
+                # request.user может быть ленивым (сессия) — читаем его в потоке
+                await sync_to_async(db_router.pin)(request, response)
+            return response
+        finally:
+            db_router.end(token)
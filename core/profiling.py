@@ -0,0 +1,215 @@
+"""
+Профилирование запросов: SQL, сериализация, рендер, общее время.
+
+ProfilingMiddleware замеряет долю PROFILING_SAMPLE_RATE запросов и любой запрос
+с заголовком X-Profile: 1. Замер:
+- db — число и время SQL-запросов (обёртка execute на каждом соединении, включая реплики);
+- serialize — время .data сериализаторов DRF (только внешний вызов; лениво
+  выполненный в сериализаторе SQL входит и сюда, и в db);
+- render — время рендера Response DRF;
+- total — весь запрос внутри middleware.
+
+Итог уходит в заголовок Server-Timing (только для сотрудников) и в скользящее
+окно последних PROFILING_WINDOW замеров на имя URL в памяти процесса
+(GET /core/profiling/, manage.py profiling_stats).
+
+Без замера обёртки только читают ContextVar и вызывают оригинал: выключенное
+профилирование стоит одного сравнения на запрос и одного get() на SQL-запрос.
+"""
+import random
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+
+METRICS = ('total', 'db', 'queries', 'serialize', 'render')
+
+_current = ContextVar('profile', default=None)
+
+
+class Profile:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.total = 0.0
+        self.db = 0.0
+        self.queries = 0
+        self.serialize = 0.0
+        self.render = 0.0
+        self.depth = 0  # вложенные сериализаторы не считаются повторно
+
+    def finish(self):
+        self.total = (time.perf_counter() - self.started) * 1000
+
+    def sample(self):
+        return tuple(getattr(self, metric) for metric in METRICS)
+
+    def server_timing(self):
+        return ', '.join([
+            f'db;dur={self.db:.1f};desc="{self.queries} SQL"',
+            f'serialize;dur={self.serialize:.1f}',
+            f'render;dur={self.render:.1f}',
+            f'total;dur={self.total:.1f}',
+        ])
+
+
+# -----------------------------
+# 🔹 Замеры
+# -----------------------------
+def record_query(execute, sql, params, many, context):
+    profile = _current.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.db += (time.perf_counter() - started) * 1000
+        profile.queries += 1
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """connection_created: обёртка ставится на соединение один раз"""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def timed_property(prop, metric, nested=False):
+    """Свойство, время вычисления которого добавляется к metric текущего замера"""
+    def getter(self):
+        profile = _current.get()
+        if profile is None or (nested and profile.depth):
+            return prop.fget(self)
+        profile.depth += nested
+        started = time.perf_counter()
+        try:
+            return prop.fget(self)
+        finally:
+            setattr(profile, metric, getattr(profile, metric) + (time.perf_counter() - started) * 1000)
+            profile.depth -= nested
+    return property(getter)
+
+
+def install():
+    """Подключает замеры SQL, сериализации и рендера (CoreConfig.ready)"""
+    from django.db.backends.signals import connection_created
+    from rest_framework.response import Response
+    from rest_framework.serializers import BaseSerializer
+
+    connection_created.connect(install_query_recorder, dispatch_uid='core.profiling')
+    # Serializer.data и ListSerializer.data вызывают BaseSerializer.data через super()
+    BaseSerializer.data = timed_property(BaseSerializer.data, 'serialize', nested=True)
+    Response.rendered_content = timed_property(Response.rendered_content, 'render')
+
+
+# -----------------------------
+# 🔹 Скользящие окна по эндпоинтам
+# -----------------------------
+class Histograms:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}
+
+    def add(self, endpoint, sample):
+        with self.lock:
+            window = self.samples.get(endpoint)
+            if window is None:
+                window = self.samples[endpoint] = deque(maxlen=settings.PROFILING_WINDOW)
+            window.append(sample)
+
+    def summary(self):
+        """{endpoint: {'count': n, metric: {'p50', 'p95', 'p99', 'max'}}}"""
+        with self.lock:
+            samples = {endpoint: list(window) for endpoint, window in self.samples.items()}
+        result = {}
+        for endpoint, rows in sorted(samples.items()):
+            stats = {'count': len(rows)}
+            for index, metric in enumerate(METRICS):
+                values = sorted(row[index] for row in rows)
+                stats[metric] = {
+                    'p50': percentile(values, 50),
+                    'p95': percentile(values, 95),
+                    'p99': percentile(values, 99),
+                    'max': round(values[-1], 2),
+                }
+            result[endpoint] = stats
+        return result
+
+    def clear(self):
+        with self.lock:
+            self.samples.clear()
+
+
+def percentile(values, p):
+    """Перцентиль по ближайшему рангу из отсортированного списка"""
+    rank = max(0, min(len(values) - 1, -(-len(values) * p // 100) - 1))
+    return round(values[int(rank)], 2)
+
+
+histograms = Histograms()
+
+
+# -----------------------------
+# 🔹 Middleware
+# -----------------------------
+def endpoint_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    return match.view_name or match.route
+
+
+def is_staff(request):
+    user = getattr(request, 'user', None)
+    return bool(user is not None and user.is_authenticated and user.is_staff)
+
+
+class ProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def should_profile(self, request):
+        rate = settings.PROFILING_SAMPLE_RATE
+        return (rate and random.random() < rate) or request.headers.get('X-Profile') == '1'
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.should_profile(request):
+            return self.get_response(request)
+
+        profile = Profile()
+        token = _current.set(profile)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.finish(request, response, profile, is_staff(request))
+        return response
+
+    async def __acall__(self, request):
+        if not self.should_profile(request):
+            return await self.get_response(request)
+
+        profile = Profile()
+        token = _current.set(profile)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        # request.user может быть ленивым (сессия) — читаем его в потоке
+        self.finish(request, response, profile, await sync_to_async(is_staff)(request))
+        return response
+
+    def finish(self, request, response, profile, staff):
+        profile.finish()
+        histograms.add(endpoint_name(request), profile.sample())
+        if staff:
+            response['Server-Timing'] = profile.server_timing()
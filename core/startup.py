@@ -0,0 +1,96 @@
+"""
+Холодный старт воркера: время загрузки, память и импорты (manage.py startup_profile).
+
+Замер идёт в отдельном интерпретаторе — в текущем процессе всё уже импортировано.
+Загрузка повторяет старт воркера: get_wsgi_application() (django.setup и
+middleware) и корневой URLconf, который воркер читает на первом запросе.
+Память — RSS процесса после загрузки.
+
+Тяжёлые зависимости загружаются только там, где нужны (STARTUP_LAZY_MODULES):
+- pandas — в ProductImportView;
+- django-import-export с tablib и openpyxl — вместе с админкой: модули admin.py
+  приложений читаются при первом запросе к /admin/ (mysite/admin_urls.py);
+- boto3/botocore — django-storages создаёт клиент при первом обращении к хранилищу.
+"""
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+
+BOOT = '''
+import json, resource, sys, time
+started = time.perf_counter()
+from django.core.wsgi import get_wsgi_application
+get_wsgi_application()
+from django.urls import get_resolver
+get_resolver().url_patterns
+seconds = time.perf_counter() - started
+try:
+    # Текущий RSS: ru_maxrss на Linux наследует пик родителя через fork/exec
+    with open('/proc/self/statm') as f:
+        rss_mb = int(f.read().split()[1]) * resource.getpagesize() / 2 ** 20
+except OSError:
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** (20 if sys.platform == 'darwin' else 10)
+print(json.dumps({
+    'seconds': seconds,
+    'rss_mb': rss_mb,
+    'modules': sorted(sys.modules),
+}))
+'''
+
+
+class Boot:
+    def __init__(self, seconds, rss_mb, modules, imports):
+        self.seconds = seconds
+        self.rss_mb = rss_mb
+        self.modules = modules
+        self.imports = imports  # [(модуль, собственное мс, с вложенными мс)], пусто без importtime
+
+    def eager(self, lazy_modules=None):
+        """Модули из STARTUP_LAZY_MODULES, загруженные при старте"""
+        lazy = lazy_modules if lazy_modules is not None else settings.STARTUP_LAZY_MODULES
+        return sorted(name for name in lazy if name in self.modules)
+
+    def by_package(self):
+        """[(пакет верхнего уровня, собственное время мс)] по убыванию"""
+        totals = defaultdict(float)
+        for name, self_ms, _ in self.imports:
+            totals[name.split('.')[0]] += self_ms
+        return sorted(totals.items(), key=lambda row: row[1], reverse=True)
+
+
+def child_env():
+    """Окружение нового интерпретатора с теми же настройками и путями"""
+    return {
+        **os.environ,
+        'DJANGO_SETTINGS_MODULE': settings.SETTINGS_MODULE,
+        'PYTHONPATH': os.pathsep.join(path for path in sys.path if path),
+    }
+
+
+def measure(importtime=False):
+    """Запускает старт воркера в новом интерпретаторе и возвращает Boot"""
+    command = [sys.executable, *(['-X', 'importtime'] if importtime else []), '-c', BOOT]
+    result = subprocess.run(command, cwd=settings.BASE_DIR, env=child_env(), capture_output=True, text=True)
+    if result.returncode:
+        raise RuntimeError(f'Старт завершился с ошибкой:\n{result.stderr[-2000:]}')
+
+    data = json.loads(result.stdout.strip().splitlines()[-1])
+    imports = parse_importtime(result.stderr) if importtime else []
+    return Boot(data['seconds'], data['rss_mb'], set(data['modules']), imports)
+
+
+def parse_importtime(text):
+    """Строки 'import time: self | cumulative | module' из python -X importtime (мкс -> мс)"""
+    rows = []
+    for line in text.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        if not self_us.strip().isdigit():
+            continue  # заголовок таблицы
+        rows.append((name.strip(), int(self_us) / 1000, int(cumulative_us) / 1000))
+    return rows
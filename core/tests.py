@@ -0,0 +1,305 @@
+import subprocess
+import sys
+from unittest import skipUnless
+
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+
+from products import refcache
+from products.models import Price, Product
+
+from . import benchmarks, dataset, db_router, profiling, startup, throttling
+from .db_router import ReplicaRouter
+
+# Сквозные тесты нужны реплике: DB_REPLICA_HOSTS (второй Postgres) или
+# SQLite-алиас с TEST={'MIRROR': 'default'} в DATABASE_REPLICAS
+REPLICA = next(iter(getattr(settings, 'DATABASE_REPLICAS', ())), None)
+
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+
+@override_settings(DATABASE_REPLICAS=['replica_a', 'replica_b'])
+class ReplicaRouterTests(SimpleTestCase):
+    databases = {DEFAULT_DB_ALIAS}
+
+    def setUp(self):
+        self.router = ReplicaRouter()
+        token = db_router.begin()
+        self.addCleanup(db_router.end, token)
+
+    def test_reads_stay_on_primary_unless_view_allows_replica(self):
+        self.assertEqual(self.router.db_for_read(Token), DEFAULT_DB_ALIAS)
+        replica = db_router.use_replica()
+        self.assertIn(replica, ('replica_a', 'replica_b'))
+        # Одна реплика на весь запрос
+        self.assertEqual(db_router.use_replica(), replica)
+        self.assertEqual(self.router.db_for_read(Token), replica)
+
+    def test_write_sends_rest_of_request_to_primary(self):
+        db_router.use_replica()
+        self.assertEqual(self.router.db_for_write(Token), DEFAULT_DB_ALIAS)
+        self.assertEqual(self.router.db_for_read(Token), DEFAULT_DB_ALIAS)
+        self.assertIsNone(db_router.use_replica())
+
+    def test_transaction_reads_from_primary(self):
+        db_router.use_replica()
+        with transaction.atomic():
+            self.assertEqual(self.router.db_for_read(Token), DEFAULT_DB_ALIAS)
+
+    def test_replicas_are_not_migrated(self):
+        self.assertFalse(self.router.allow_migrate('replica_a', 'products'))
+        self.assertIsNone(self.router.allow_migrate(DEFAULT_DB_ALIAS, 'products'))
+
+
+@skipUnless(REPLICA, 'реплика не настроена (DATABASE_REPLICAS)')
+class ReplicaRoutingRequestTests(TransactionTestCase):
+    # Без обёртки TestCase в транзакцию: внутри неё роутер читает из основной БД
+    databases = {DEFAULT_DB_ALIAS, REPLICA} if REPLICA else {DEFAULT_DB_ALIAS}
+
+    def setUp(self):
+        cache.clear()
+        user = get_user_model().objects.create_user('reader', password='pass')
+        self.token = Token.objects.create(user=user)
+        self.auth = {'HTTP_AUTHORIZATION': f'Token {self.token.key}'}
+
+    def get_products(self, client=None):
+        """Число запросов каталога к (основной БД, реплике)"""
+        with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as primary, \
+                CaptureQueriesContext(connections[REPLICA]) as replica:
+            response = (client or self.client).get('/products/products/', **self.auth)
+        self.assertEqual(response.status_code, 200)
+        return len(primary), len(replica)
+
+    def test_catalog_reads_from_replica(self):
+        primary, replica = self.get_products()
+        self.assertGreater(replica, 0)
+        # В основную БД — только проверка токена
+        self.assertEqual(primary, 1)
+
+    def test_writer_sticks_to_primary(self):
+        response = self.client.post('/api-token-auth/', {'username': 'reader', 'password': 'pass'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(db_router.PIN_COOKIE, response.cookies)
+
+        primary, replica = self.get_products()
+        self.assertEqual(replica, 0)
+        # Клиент с токеном без куки закреплён по пользователю
+        self.client.cookies.clear()
+        request = RequestFactory().post('/')
+        request.user = self.token.user
+        db_router.pin(request, response)
+        primary, replica = self.get_products()
+        self.assertEqual(replica, 0)
+
+        cache.clear()
+        primary, replica = self.get_products()
+        self.assertGreater(replica, 0)
+
+    def test_orders_stay_on_primary(self):
+        with CaptureQueriesContext(connections[REPLICA]) as replica:
+            self.client.get('/orders/', **self.auth)
+        self.assertEqual(len(replica), 0)
+
+
+@override_settings(PROFILING_SAMPLE_RATE=0)
+class ProfilingTests(TestCase):
+    def setUp(self):
+        profiling.histograms.clear()
+        self.addCleanup(profiling.histograms.clear)
+        staff = get_user_model().objects.create_user('staff', is_staff=True)
+        buyer = get_user_model().objects.create_user('buyer')
+        self.staff = {'HTTP_AUTHORIZATION': f'Token {Token.objects.create(user=staff).key}'}
+        self.buyer = {'HTTP_AUTHORIZATION': f'Token {Token.objects.create(user=buyer).key}'}
+
+    def test_off_by_default(self):
+        response = self.client.get('/products/categories/', **self.staff)
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(profiling.histograms.summary(), {})
+
+    def test_staff_gets_server_timing(self):
+        response = self.client.get('/products/categories/', HTTP_X_PROFILE='1', **self.staff)
+        timing = dict(part.split(';', 1) for part in response['Server-Timing'].split(', '))
+        self.assertEqual(set(timing), {'db', 'serialize', 'render', 'total'})
+        # Проверка токена и выборка категорий
+        self.assertIn('desc="2 SQL"', timing['db'])
+
+        stats = profiling.histograms.summary()['category-list']
+        self.assertEqual((stats['count'], stats['queries']['p50']), (1, 2))
+
+    def test_sampled_for_everyone_header_only_for_staff(self):
+        with override_settings(PROFILING_SAMPLE_RATE=1):
+            response = self.client.get('/products/categories/', **self.buyer)
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(profiling.histograms.summary()['category-list']['count'], 1)
+
+    def test_stats_endpoint(self):
+        self.client.get('/products/categories/', HTTP_X_PROFILE='1', **self.buyer)
+        self.assertEqual(self.client.get('/core/profiling/', **self.buyer).status_code, 403)
+        endpoints = self.client.get('/core/profiling/', **self.staff).json()['endpoints']
+        self.assertEqual(set(endpoints['category-list']), {'count', *profiling.METRICS})
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(
+            [profiling.percentile(values, p) for p in (50, 95, 99)], [50, 95, 99]
+        )
+
+
+# Экспорт строит ссылки на фото — локальное хранилище вместо S3
+@override_settings(STORAGES=STORAGES)
+class DatasetBenchmarkTests(TestCase):
+    def setUp(self):
+        refcache.clear()
+        self.addCleanup(refcache.clear)
+
+    def generate(self, seed=7):
+        dataset.generate(products=20, users=3, orders=5, warehouses=2, seed=seed)
+
+    def snapshot(self):
+        products = Product.objects.filter(sku__startswith=dataset.SKU_PREFIX)
+        return (
+            list(products.order_by('sku').values_list('sku', 'name', 'stock_cache')),
+            sorted(Price.objects.filter(product__in=products).values_list('product__sku', 'value')),
+        )
+
+    def test_same_seed_same_dataset(self):
+        self.generate()
+        first = self.snapshot()
+        self.assertEqual(len(first[0]), 20)
+        dataset.clear()
+        self.assertFalse(dataset.exists())
+        self.assertFalse(get_user_model().objects.filter(username__startswith=dataset.USERNAME_PREFIX).exists())
+
+        self.generate()
+        self.assertEqual(self.snapshot(), first)
+        dataset.clear()
+        self.generate(seed=8)
+        self.assertNotEqual(self.snapshot(), first)
+
+    def test_suite_leaves_dataset_unchanged(self):
+        self.generate()
+        before = self.snapshot()
+        report = benchmarks.run(iterations=1, warmup=0, import_rows=4, confirm_orders=2)
+
+        self.assertEqual(set(report['cases']), set(benchmarks.CASES))
+        self.assertEqual(report['meta']['dataset']['products'], 20)
+        self.assertEqual(set(report['cases']['catalog-list']), {'iterations', *benchmarks.METRICS})
+        # Пишущие сценарии откатываются после каждого повтора
+        self.assertEqual(self.snapshot(), before)
+
+        rows = benchmarks.compare(report, report)
+        self.assertEqual({change for _, _, _, change, _ in rows}, {0.0})
+
+    def test_compare_flags_regressions(self):
+        def report(p50):
+            return {'cases': {'search': {'total': {'p50': p50}}}}
+        self.assertEqual(benchmarks.compare(report(100), report(125)), [('search', 100, 125, 25.0, True)])
+        self.assertFalse(benchmarks.compare(report(100), report(105))[0][4])
+
+
+class StartupBudgetTests(SimpleTestCase):
+    def test_cold_start_within_budget(self):
+        boot = startup.measure()
+        self.assertEqual(boot.eager(), [], 'тяжёлые модули загружены при старте воркера')
+        self.assertLessEqual(boot.seconds, settings.STARTUP_TIME_BUDGET)
+        self.assertLessEqual(boot.rss_mb, settings.STARTUP_RSS_BUDGET_MB)
+
+    def test_checks_see_every_model_admin(self):
+        # Новый интерпретатор: до проверок admin.py ещё не прочитаны
+        script = (
+            'import django; django.setup()\n'
+            'from django.contrib import admin\n'
+            'from django.core import checks\n'
+            'checks.run_checks(tags=[checks.Tags.admin])\n'
+            'print(len(admin.site._registry))\n'
+        )
+        result = subprocess.run(
+            [sys.executable, '-c', script], cwd=settings.BASE_DIR, env=startup.child_env(),
+            capture_output=True, text=True, check=True,
+        )
+        self.assertEqual(int(result.stdout.split()[-1]), len(admin.site._registry))
+        self.assertGreater(len(admin.site._registry), 0)
+
+    def test_parse_importtime(self):
+        text = (
+            'import time: self [us] | cumulative | imported package\n'
+            'import time:       120 |        120 |   pandas._libs\n'
+            'import time:       300 |        420 | pandas\n'
+        )
+        rows = startup.parse_importtime(text)
+        self.assertEqual(rows, [('pandas._libs', 0.12, 0.12), ('pandas', 0.3, 0.42)])
+        self.assertEqual(startup.Boot(0, 0, set(), rows).by_package(), [('pandas', 0.42)])
+
+
+class ThrottlingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.admin = get_user_model().objects.create_user('admin', password='secret1', is_staff=True)
+        self.auth = {'HTTP_AUTHORIZATION': f'Token {Token.objects.create(user=self.admin).key}'}
+
+    def test_bucket_refills_at_rate(self):
+        now = 1000.0
+        self.assertEqual([throttling.take('bucket', 3, 1.0, 1, now) for _ in range(3)], [0, 0, 0])
+        self.assertEqual(throttling.take('bucket', 3, 1.0, 1, now), 1.0)
+        self.assertEqual(throttling.take('bucket', 3, 1.0, 1, now + 0.5), 0.5)
+        self.assertEqual(throttling.take('bucket', 3, 1.0, 1, now + 1), 0)
+        # Дорогой запрос ждёт, пока наберётся его цена
+        self.assertEqual(throttling.take('bucket', 3, 1.0, 3, now + 1), 3.0)
+
+    @override_settings(THROTTLE_BUCKETS={**settings.THROTTLE_BUCKETS, 'user': (10, 0.01)})
+    def test_endpoint_cost_and_retry_after(self):
+        # order-create стоит 5 токенов: из ведра на 10 проходят два запроса
+        statuses = [self.client.post('/orders/create/', {}, **self.auth).status_code for _ in range(3)]
+        self.assertEqual(statuses[:2], [400, 400])
+        self.assertEqual(statuses[2], 429)
+        response = self.client.post('/orders/create/', {}, **self.auth)
+        self.assertGreaterEqual(int(response['Retry-After']), 400)
+
+        with override_settings(THROTTLE_ENABLED=False):
+            self.assertEqual(self.client.post('/orders/create/', {}, **self.auth).status_code, 400)
+
+    @override_settings(THROTTLE_BUCKETS={**settings.THROTTLE_BUCKETS, 'login': (2, 0.01)})
+    def test_login_bucket_per_address(self):
+        def login(address):
+            return self.client.post(
+                '/users/token/', {'username': 'admin', 'password': 'wrong'}, REMOTE_ADDR=address,
+            ).status_code
+        self.assertEqual([login('10.0.0.1') for _ in range(3)], [401, 401, 429])
+        self.assertEqual(login('10.0.0.2'), 401)
+        self.assertEqual(self.client.post('/api-token-auth/', {}, REMOTE_ADDR='10.0.0.1').status_code, 429)
+
+    @override_settings(THROTTLE_BUCKETS={**settings.THROTTLE_BUCKETS, 'login': (2, 0.01)})
+    def test_spoofed_forwarded_for_keeps_bucket(self):
+        # За nginx: REMOTE_ADDR — прокси, последняя запись X-Forwarded-For — адрес клиента
+        statuses = [
+            self.client.post(
+                '/users/token/', {'username': 'admin', 'password': 'wrong'},
+                REMOTE_ADDR='127.0.0.1', HTTP_X_FORWARDED_FOR=f'10.9.9.{i}, 10.0.0.1',
+            ).status_code
+            for i in range(3)
+        ]
+        self.assertEqual(statuses, [401, 401, 429])
+
+    def test_concurrency_cap(self):
+        key = 'throttle:concurrency:import'
+        cache.set(key, settings.THROTTLE_CONCURRENCY['import'])
+        with self.assertLogs('django.request', 'ERROR'):
+            response = self.client.post('/products/product-import/', {}, **self.auth)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], str(settings.THROTTLE_BUSY_RETRY_AFTER))
+        self.assertEqual(cache.get(key), settings.THROTTLE_CONCURRENCY['import'])
+
+        cache.set(key, 0)
+        # Файла нет — 400, но слот занят и освобождён
+        self.assertEqual(self.client.post('/products/product-import/', {}, **self.auth).status_code, 400)
+        self.assertEqual(cache.get(key), 0)
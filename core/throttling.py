@@ -0,0 +1,120 @@
+"""
+Ограничение частоты запросов к API: token bucket в общем кеше (CACHES['default']).
+
+Ведро клиента вмещает capacity токенов и пополняется на rate токенов в секунду:
+ёмкость — допустимый всплеск, rate — средняя частота. Запрос списывает цену
+своего throttle_scope (THROTTLE_COSTS, по умолчанию 1 токен); если токенов не
+хватает — 429 и Retry-After: через сколько секунд их станет достаточно.
+
+Ведра (THROTTLE_BUCKETS):
+- user — на вошедшего пользователя;
+- ip — на адрес анонимного клиента (адрес — как у DRF, см. NUM_PROXIES:
+  X-Forwarded-For от клиента не подменяет адрес, который записал прокси);
+- login — дополнительно на адрес для входа и регистрации (throttle_scope='login'):
+  перебор паролей упирается в лимит адреса, сколько бы логинов он ни пробовал.
+
+Состояние ведра — (токены, время) под одним ключом: get и set на запрос, без
+блокировок. Одновременные запросы одного клиента могут один раз списать одни и
+те же токены (как у SimpleRateThrottle DRF); от скрипта, который заваливает БД,
+это защищает так же.
+
+Импорт и экспорт вдобавок ограничены числом одновременных запросов на весь
+сервис (THROTTLE_CONCURRENCY, core.views.ConcurrencyLimitMixin): счётчик
+incr/decr в кеше, сверх лимита — 503 и Retry-After.
+
+Без REDIS_URL кеш живёт в памяти процесса, и лимиты считаются в каждом воркере отдельно.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import exceptions
+from rest_framework.throttling import BaseThrottle
+
+
+# -----------------------------
+# 🔹 Token bucket
+# -----------------------------
+def take(key, capacity, rate, cost, now=None):
+    """Списывает cost токенов из ведра key. 0 — списано, иначе секунд до нужного запаса."""
+    now = time.time() if now is None else now
+    tokens, updated = cache.get(key) or (capacity, now)
+    tokens = min(capacity, tokens + (now - updated) * rate)
+    if tokens < cost:
+        return (cost - tokens) / rate
+    tokens -= cost
+    # Полное ведро хранить незачем: ключ истекает, когда оно наполнится
+    cache.set(key, (tokens, now), int((capacity - tokens) / rate) + 1)
+    return 0
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Ведра user/ip и login для входа; цена запроса — THROTTLE_COSTS[throttle_scope]"""
+
+    def __init__(self):
+        self.retry_after = None
+
+    def buckets(self, request, scope):
+        ident = self.get_ident(request)
+        # Самое узкое ведро первым: отказ в нём не списывает токены пользователя
+        if scope == 'login':
+            yield 'login', ident
+        if request.user and request.user.is_authenticated:
+            yield 'user', request.user.pk
+        else:
+            yield 'ip', ident
+
+    def allow_request(self, request, view):
+        if not settings.THROTTLE_ENABLED:
+            return True
+        scope = getattr(view, 'throttle_scope', None)
+        cost = settings.THROTTLE_COSTS.get(scope, 1)
+        now = time.time()
+        for bucket, ident in self.buckets(request, scope):
+            capacity, rate = settings.THROTTLE_BUCKETS[bucket]
+            wait = take(f'throttle:{bucket}:{ident}', capacity, rate, cost, now)
+            if wait:
+                self.retry_after = wait
+                return False
+        return True
+
+    def wait(self):
+        return self.retry_after
+
+
+# -----------------------------
+# 🔹 Одновременные запросы
+# -----------------------------
+class Busy(exceptions.APIException):
+    status_code = 503
+    default_detail = 'Сервис занят, повторите позже.'
+    default_code = 'busy'
+
+    def __init__(self, wait):
+        super().__init__()
+        self.wait = wait  # exception_handler DRF пишет его в Retry-After
+
+
+def acquire(scope):
+    """Занимает слот scope (THROTTLE_CONCURRENCY). Ключ слота для release() или None, если лимита нет."""
+    limit = settings.THROTTLE_CONCURRENCY.get(scope)
+    if not limit or not settings.THROTTLE_ENABLED:
+        return None
+    key = f'throttle:concurrency:{scope}'
+    # Таймаут — страховка от воркера, упавшего посреди запроса: счётчик не «залипнет»
+    cache.add(key, 0, settings.THROTTLE_CONCURRENCY_TIMEOUT)
+    try:
+        running = cache.incr(key)
+    except ValueError:
+        return None  # ключ истёк между add и incr — пропускаем запрос без слота
+    if running > limit:
+        release(key)
+        raise Busy(settings.THROTTLE_BUSY_RETRY_AFTER)
+    return key
+
+
+def release(key):
+    try:
+        cache.decr(key)
+    except ValueError:
+        pass  # ключ уже истёк
@@ -0,0 +1,7 @@
+from django.urls import path
+
+from .views import ProfilingStatsView
+
+urlpatterns = [
+    path('profiling/', ProfilingStatsView.as_view(), name='profiling-stats'),
+]
@@ -0,0 +1,60 @@
+import os
+
+from django.conf import settings
+from rest_framework.permissions import SAFE_METHODS, IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from . import db_router, profiling, throttling
+
+
+class ReplicaReadMixin:
+    """
+    Чтения безопасных запросов представления идут на реплику (DATABASE_REPLICAS),
+    если клиент не закреплён за основной БД недавней записью.
+    Решение принимается после аутентификации: токен проверяется в основной БД.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS and not db_router.is_pinned(request):
+            db_router.use_replica()
+
+
+class ConcurrencyLimitMixin:
+    """
+    Не больше THROTTLE_CONCURRENCY[throttle_scope] одновременных запросов к
+    представлению на весь сервис; лишние получают 503 с Retry-After.
+    Слот занимается после аутентификации и проверок прав и частоты.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.concurrency_slot = throttling.acquire(self.throttle_scope)
+
+    def dispatch(self, request, *args, **kwargs):
+        self.concurrency_slot = None
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            if self.concurrency_slot:
+                throttling.release(self.concurrency_slot)
+
+
+class ProfilingStatsView(APIView):
+    """
+    Перцентили времени по эндпоинтам из скользящих окон этого процесса (core/profiling.py).
+    DELETE — очистить окна.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response({
+            'pid': os.getpid(),
+            'sample_rate': settings.PROFILING_SAMPLE_RATE,
+            'endpoints': profiling.histograms.summary(),
+        })
+
+    def delete(self, request):
+        profiling.histograms.clear()
+        return Response(status=204)
@@ -0,0 +1,24 @@
+from django.contrib import admin
+
+from .models import SyncCursor, StockEvent
+
+
+@admin.register(SyncCursor)
+class SyncCursorAdmin(admin.ModelAdmin):
+    list_display = ('entity', 'updated_since', 'last_run_at', 'last_rows', 'last_error')
+    readonly_fields = ('entity', 'last_run_at', 'last_rows', 'last_error')
+    actions = ['reset']
+
+    @admin.action(description='Сбросить курсор (следующий запуск — полная синхронизация)')
+    def reset(self, request, queryset):
+        updated = queryset.update(updated_since=None)
+        self.message_user(request, f'Сброшено курсоров: {updated}')
+
+
+@admin.register(StockEvent)
+class StockEventAdmin(admin.ModelAdmin):
+    list_display = ('id', 'received_at', 'payload')
+    readonly_fields = ('payload', 'received_at')
+
+    def has_add_permission(self, request):
+        return False
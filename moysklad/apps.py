@@ -0,0 +1,7 @@
+from django.apps import AppConfig
+
+
+class MoyskladConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'moysklad'
+    verbose_name = 'МойСклад'
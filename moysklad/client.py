@@ -0,0 +1,185 @@
+"""
+Клиент JSON API МойСклад (remap 1.2) на стандартной библиотеке.
+
+MoySkladClient.get/post — один синхронный запрос с повторами на 429/5xx.
+iter_pages — постраничное чтение коллекции: первая страница даёт meta.size,
+остальные запрашиваются параллельно (asyncio + потоки) в пределах
+MOYSKLAD_CONCURRENCY одновременных запросов и MOYSKLAD_RATE_LIMIT запросов
+в секунду. Страницы отдаются вызывающему коду в его потоке, поэтому запись
+в БД идёт обычным синхронным ORM, пока следующие страницы уже качаются.
+"""
+import asyncio
+import gzip
+import json
+import queue
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from django.conf import settings
+
+
+class MoySkladError(Exception):
+    def __init__(self, message, status=None, payload=None, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.payload = payload  # разобранное тело ответа с ошибкой, если это JSON
+        self.retry_after = retry_after  # пауза, которую просил сервер (сек)
+
+
+def uuid_from_meta(value):
+    """uuid сущности из {'meta': {'href': '.../entity/product/<uuid>'}}"""
+    if not value:
+        return None
+    href = value.get('meta', {}).get('href', '')
+    return href.rstrip('/').rsplit('/', 1)[-1].split('?', 1)[0] or None
+
+
+class MoySkladClient:
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self, base_url=None, token=None, timeout=None, retries=None):
+        self.base_url = (base_url or settings.MOYSKLAD_API_URL).rstrip('/')
+        self.token = token if token is not None else settings.MOYSKLAD_TOKEN
+        self.timeout = timeout or settings.MOYSKLAD_TIMEOUT
+        self.retries = settings.MOYSKLAD_RETRIES if retries is None else retries
+
+    def _request(self, method, path, params=None, body=None, retries=None):
+        retries = self.retries if retries is None else retries
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        if params:
+            url += '?' + urllib.parse.urlencode(params)
+        data = json.dumps(body).encode() if body is not None else None
+
+        request = urllib.request.Request(url, data=data, method=method)
+        request.add_header('Authorization', f'Bearer {self.token}')
+        request.add_header('Accept', 'application/json;charset=utf-8')
+        request.add_header('Accept-Encoding', 'gzip')
+        if data is not None:
+            request.add_header('Content-Type', 'application/json')
+
+        for attempt in range(retries + 1):
+            try:
+                with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                    return self._decode(response.read(), response.headers)
+            except urllib.error.HTTPError as e:
+                delay = self._retry_after(e.headers, attempt)
+                if e.code not in self.RETRY_STATUSES or attempt == retries:
+                    raw = e.read()
+                    try:
+                        payload = self._decode(raw, e.headers)
+                    except (ValueError, OSError):
+                        payload = None
+                    raise MoySkladError(
+                        f'{method} {path}: HTTP {e.code} {raw[:500]!r}', status=e.code,
+                        payload=payload, retry_after=delay if e.code in self.RETRY_STATUSES else None,
+                    )
+            except (urllib.error.URLError, TimeoutError) as e:
+                if attempt == retries:
+                    raise MoySkladError(f'{method} {path}: {e}')
+                delay = self._retry_after({}, attempt)
+            time.sleep(delay)
+
+    @staticmethod
+    def _decode(payload, headers):
+        if headers.get('Content-Encoding') == 'gzip':
+            payload = gzip.decompress(payload)
+        return json.loads(payload or b'null')
+
+    @staticmethod
+    def _retry_after(headers, attempt):
+        # МойСклад отдаёт паузу в миллисекундах в X-Lognex-Retry-After
+        if headers.get('X-Lognex-Retry-After'):
+            return int(headers['X-Lognex-Retry-After']) / 1000
+        if headers.get('Retry-After'):
+            return float(headers['Retry-After'])
+        return min(2 ** attempt, 30) * (0.5 + random.random())
+
+    def get(self, path, params=None, retries=None):
+        return self._request('GET', path, params, retries=retries)
+
+    def post(self, path, body, retries=None):
+        return self._request('POST', path, body=body, retries=retries)
+
+    def meta(self, path, ms_uuid):
+        """Ссылка на сущность для тела запроса: {'meta': {'href': ..., 'type': ...}}"""
+        return {'meta': {
+            'href': f"{self.base_url}/{path.strip('/')}/{ms_uuid}",
+            'type': path.rstrip('/').rsplit('/', 1)[-1],
+            'mediaType': 'application/json',
+        }}
+
+
+class RateLimiter:
+    """Не больше rate запросов в секунду (равномерно) для корутин одного цикла"""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.next_at = 0
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            now = time.monotonic()
+            wait = self.next_at - now
+            self.next_at = max(now, self.next_at) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+_DONE = object()
+
+
+def iter_pages(client, path, params=None, page_size=None, concurrency=None, rate=None):
+    """
+    Все строки коллекции постранично: генератор списков rows.
+    Порядок страниц не гарантируется.
+    """
+    page_size = page_size or settings.MOYSKLAD_PAGE_SIZE
+    concurrency = concurrency or settings.MOYSKLAD_CONCURRENCY
+    rate = settings.MOYSKLAD_RATE_LIMIT if rate is None else rate
+    params = dict(params or {})
+    # Ограниченная очередь — обратное давление: не качаем сильно впереди записи в БД
+    pages = queue.Queue(maxsize=concurrency * 2)
+
+    async def fetch(offset, semaphore, limiter):
+        async with semaphore:
+            await limiter.acquire()
+            return await asyncio.to_thread(client.get, path, {**params, 'limit': page_size, 'offset': offset})
+
+    async def produce():
+        semaphore = asyncio.Semaphore(concurrency)
+        limiter = RateLimiter(rate)
+        first = await fetch(0, semaphore, limiter)
+        await asyncio.to_thread(pages.put, first.get('rows', []))
+
+        size = first.get('meta', {}).get('size', 0)
+        tasks = [asyncio.create_task(fetch(offset, semaphore, limiter)) for offset in range(page_size, size, page_size)]
+        try:
+            for task in asyncio.as_completed(tasks):
+                page = await task
+                await asyncio.to_thread(pages.put, page.get('rows', []))
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def run():
+        try:
+            asyncio.run(produce())
+            pages.put(_DONE)
+        except BaseException as e:
+            pages.put(e)
+
+    thread = threading.Thread(target=run, name=f'moysklad-pages:{path}', daemon=True)
+    thread.start()
+    while True:
+        item = pages.get()
+        if item is _DONE:
+            break
+        if isinstance(item, BaseException):
+            raise item
+        yield item
+    thread.join()
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from moysklad.sync import ENTITIES, pull
+
+
+class Command(BaseCommand):
+    help = (
+        'Инкрементальная выгрузка каталога из МойСклад по курсорам (запускать по расписанию). '
+        '--full раз в сутки сверяет всё целиком.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Игнорировать курсоры и выгрузить всё')
+        parser.add_argument('--entity', action='append', choices=ENTITIES, help='Только указанные сущности')
+
+    def handle(self, *args, **options):
+        stats = pull(
+            full=options['full'],
+            entities=options['entity'] or ENTITIES,
+            log=self.stdout.write,
+        )
+        self.stdout.write(self.style.SUCCESS(f'Синхронизировано строк: {sum(stats.values())}'))
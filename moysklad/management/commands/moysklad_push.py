@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from moysklad.push import push
+
+
+class Command(BaseCommand):
+    help = 'Выгрузка в МойСклад товаров с локальными правками (changed_locally), запускать по расписанию.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, help='Товаров за один проход (по умолчанию MOYSKLAD_PUSH_CHUNK_SIZE)')
+        parser.add_argument('--batch-size', type=int, help='Позиций в одном запросе (по умолчанию MOYSKLAD_PUSH_BATCH_SIZE)')
+
+    def handle(self, *args, **options):
+        stats = push(
+            chunk_size=options['chunk_size'],
+            batch_size=options['batch_size'],
+            log=self.stdout.write,
+        )
+        style = self.style.SUCCESS if not stats['failed'] else self.style.WARNING
+        self.stdout.write(style(f"Выгружено товаров: {stats['pushed']}, с ошибками: {stats['failed']}"))
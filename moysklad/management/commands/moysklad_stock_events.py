@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from moysklad.stock_events import run_coalescer
+
+
+class Command(BaseCommand):
+    help = (
+        'Применяет остатки из вебхука МойСклад: события за окно сливаются в один запрос отчёта '
+        'и одну запись в Stock. Запускать одним постоянным процессом (--once — разобрать очередь и выйти).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--window', type=float, help='Окно накопления, сек (по умолчанию MOYSKLAD_STOCK_WINDOW)')
+        parser.add_argument('--once', action='store_true', help='Выйти, когда очередь опустеет')
+
+    def handle(self, *args, **options):
+        try:
+            processed = run_coalescer(window=options['window'], stop_when_empty=options['once'])
+        except KeyboardInterrupt:
+            return
+        self.stdout.write(self.style.SUCCESS(f'Обработано событий: {processed}'))
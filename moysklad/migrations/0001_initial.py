@@ -0,0 +1,30 @@
+# Generated by Django 5.0.3 on 2026-10-19 00:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entity', models.CharField(max_length=50, unique=True, verbose_name='Сущность')),
+                ('updated_since', models.DateTimeField(blank=True, null=True, verbose_name='Изменённые после')),
+                ('last_run_at', models.DateTimeField(blank=True, null=True, verbose_name='Последний запуск')),
+                ('last_rows', models.PositiveIntegerField(default=0, verbose_name='Строк за запуск')),
+                ('last_error', models.TextField(blank=True, verbose_name='Ошибка')),
+            ],
+            options={
+                'verbose_name': 'Курсор синхронизации',
+                'verbose_name_plural': 'Курсоры синхронизации',
+                'ordering': ['entity'],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+from django.db import models
+
+
+class SyncCursor(models.Model):
+    """Курсор инкрементальной синхронизации с МойСклад: по одному на тип сущности"""
+    entity = models.CharField(max_length=50, unique=True, verbose_name='Сущность')
+    updated_since = models.DateTimeField(null=True, blank=True, verbose_name='Изменённые после')
+    last_run_at = models.DateTimeField(null=True, blank=True, verbose_name='Последний запуск')
+    last_rows = models.PositiveIntegerField(default=0, verbose_name='Строк за запуск')
+    last_error = models.TextField(blank=True, verbose_name='Ошибка')
+
+    class Meta:
+        verbose_name = 'Курсор синхронизации'
+        verbose_name_plural = 'Курсоры синхронизации'
+        ordering = ['entity']
+
+    def __str__(self):
+        return f"{self.entity}: {self.updated_since or '—'}"
+
+
+class StockEvent(models.Model):
+    """
+    Уведомление МойСклад об изменении остатков (webhookstock), принятое вебхуком.
+    Очередь разбирает manage.py moysklad_stock_events: события за окно сливаются
+    в одну выборку отчёта и одну запись в Stock, обработанные удаляются.
+    """
+    payload = models.JSONField(verbose_name='Тело уведомления')
+    received_at = models.DateTimeField(auto_now_add=True, verbose_name='Получено')
+
+    class Meta:
+        verbose_name = 'Событие остатков'
+        verbose_name_plural = 'События остатков'
+        ordering = ['id']
+
+    def __str__(self):
+        return f"#{self.pk} {self.received_at:%d.%m.%Y %H:%M:%S}"
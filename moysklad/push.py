@@ -0,0 +1,251 @@
+"""
+Выгрузка локальных правок товаров в МойСклад.
+
+Товары с changed_locally=True читаются кусками по MOYSKLAD_PUSH_CHUNK_SIZE
+(по возрастанию pk, обычным SELECT без блокировок) и отправляются массовыми
+POST entity/product по MOYSKLAD_PUSH_BATCH_SIZE позиций: позиция с meta
+обновляет товар в МС, без meta — создаёт. Запросы куска идут параллельно
+(asyncio + потоки) в пределах MOYSKLAD_CONCURRENCY и MOYSKLAD_RATE_LIMIT;
+429/5xx и сетевые ошибки повторяются с экспоненциальной паузой со случайным
+разбросом.
+
+Ответ МС — массив той же длины, что и запрос: ошибка одной позиции не отменяет
+остальные, такой товар остаётся changed_locally и уйдёт следующим запуском.
+
+Итог куска пишется одним UPDATE: synced_at, ms_uuid для созданных и снятие
+changed_locally. Флаг снимается, только если updated_at товара не изменился
+с момента чтения — правка, сделанная во время выгрузки, не теряется.
+
+Повтор создания (ответ мог потеряться, а товар — создаться) не плодит дубли:
+перед каждой попыткой новые товары ищутся в МС по артикулу.
+"""
+import asyncio
+import random
+
+from django.conf import settings
+from django.db.models import Case, F, Q, Value, When
+from django.utils import timezone
+
+from products.models import Product, Price
+from .client import MoySkladClient, MoySkladError, RateLimiter
+from .models import SyncCursor
+
+PUSH_ENTITY = 'product_push'  # строка SyncCursor с итогом последней выгрузки
+
+
+def backoff_delay(attempt, cap=30):
+    """Пауза перед повтором: случайная от 0 до min(cap, 2**attempt) сек (full jitter)"""
+    return random.uniform(0, min(cap, 2 ** attempt))
+
+
+def is_retryable(error):
+    return error.status is None or error.status in MoySkladClient.RETRY_STATUSES
+
+
+def filter_value(value):
+    """Значение для filter МойСклад: ';' разделяет условия, поэтому экранируется (как и сам '\\')"""
+    return str(value).replace('\\', '\\\\').replace(';', '\\;')
+
+
+def item_error(item):
+    """Текст ошибки позиции массового ответа МС или None, если позиция сохранена"""
+    if not isinstance(item, dict):
+        return 'Пустой ответ МойСклад'
+    errors = item.get('errors')
+    if not errors:
+        return None if item.get('id') else 'Ответ без id'
+    return '; '.join(str(error.get('error', error)) for error in errors)
+
+
+class ProductPush:
+    def __init__(self, client=None, log=None, chunk_size=None, batch_size=None):
+        self.client = client or MoySkladClient()
+        self.log = log or (lambda message: None)
+        self.chunk_size = chunk_size or settings.MOYSKLAD_PUSH_CHUNK_SIZE
+        self.batch_size = batch_size or settings.MOYSKLAD_PUSH_BATCH_SIZE
+        self.retries = self.client.retries
+        self.errors = {}  # {product_id: текст ошибки}
+
+    # -----------------------------
+    # 🔹 Запуск
+    # -----------------------------
+    def run(self):
+        """Выгружает все товары с локальными правками. Возвращает {'pushed': n, 'failed': n}."""
+        started = timezone.now()
+        pushed, last_pk = 0, 0
+        while True:
+            chunk = list(
+                Product.objects.filter(changed_locally=True, pk__gt=last_pk)
+                .select_related('category', 'unit')
+                .order_by('pk')[:self.chunk_size]
+            )
+            if not chunk:
+                break
+            last_pk = chunk[-1].pk
+            pushed += self.push_chunk(chunk)
+
+        summary = '\n'.join(f'#{pk}: {message}' for pk, message in sorted(self.errors.items()))
+        SyncCursor.objects.update_or_create(entity=PUSH_ENTITY, defaults={
+            'last_run_at': started, 'last_rows': pushed, 'last_error': summary[:2000],
+        })
+        return {'pushed': pushed, 'failed': len(self.errors)}
+
+    def push_chunk(self, products):
+        """Кусок товаров: тела, параллельная отправка, один UPDATE с итогом. Возвращает число выгруженных."""
+        bodies = self.bodies(products)
+        batches = [products[i:i + self.batch_size] for i in range(0, len(products), self.batch_size)]
+        synced = {}
+        for result in asyncio.run(self.send_all(batches, bodies)):
+            for pk, outcome in result.items():
+                if isinstance(outcome, MoySkladError):
+                    self.errors[pk] = str(outcome)
+                else:
+                    synced[pk] = outcome
+        saved = self.save_results(products, synced)
+        self.log(f'product: выгружено {saved}, ошибок {len(products) - saved}')
+        return saved
+
+    # -----------------------------
+    # 🔹 Тела запросов
+    # -----------------------------
+    def bodies(self, products):
+        """{product_id: позиция массового POST} — все запросы к БД до сетевых вызовов"""
+        prices = self.sale_prices(products)
+        bodies = {}
+        for product in products:
+            body = {
+                'name': product.name,
+                'description': product.description,
+                'article': product.sku,
+                'archived': not product.is_active,
+            }
+            if product.ms_uuid:
+                body.update(self.client.meta('entity/product', product.ms_uuid))
+            if product.category.ms_uuid:
+                body['productFolder'] = self.client.meta('entity/productfolder', product.category.ms_uuid)
+            if product.unit.ms_uuid:
+                body['uom'] = self.client.meta('entity/uom', product.unit.ms_uuid)
+            if prices.get(product.pk):
+                body['salePrices'] = prices[product.pk]
+            bodies[product.pk] = body
+        return bodies
+
+    def sale_prices(self, products):
+        """Действующие цены по типам цен, известным МС: {product_id: [salePrice, ...]}"""
+        current = {}
+        for product_id, price_type_uuid, value in (
+            Price.current().filter(product__in=products, price_type__ms_uuid__isnull=False)
+            .order_by('product_id', 'price_type_id', '-priority', '-start_date')
+            .values_list('product_id', 'price_type__ms_uuid', 'value')
+        ):
+            current.setdefault((product_id, price_type_uuid), value)
+
+        prices = {}
+        for (product_id, price_type_uuid), value in current.items():
+            prices.setdefault(product_id, []).append({
+                # МойСклад хранит цены в копейках
+                'value': int(value * 100),
+                'priceType': self.client.meta('context/companysettings/pricetype', price_type_uuid),
+            })
+        return prices
+
+    # -----------------------------
+    # 🔹 Отправка
+    # -----------------------------
+    async def send_all(self, batches, bodies):
+        semaphore = asyncio.Semaphore(settings.MOYSKLAD_CONCURRENCY)
+        limiter = RateLimiter(settings.MOYSKLAD_RATE_LIMIT)
+        return await asyncio.gather(*(self.send(batch, bodies, semaphore, limiter) for batch in batches))
+
+    async def send(self, batch, bodies, semaphore, limiter):
+        """Одна пачка с повторами. Возвращает {product_id: ms_uuid | MoySkladError}."""
+        for attempt in range(self.retries + 1):
+            try:
+                async with semaphore:
+                    # Поиск по артикулу — отдельный запрос, его тоже учитываем в лимите
+                    for _ in range(2 if any(not p.ms_uuid for p in batch) else 1):
+                        await limiter.acquire()
+                    return await asyncio.to_thread(self.post, batch, bodies)
+            except MoySkladError as e:
+                if not is_retryable(e) or attempt == self.retries:
+                    return {product.pk: e for product in batch}
+                await asyncio.sleep(max(e.retry_after or 0, backoff_delay(attempt)))
+
+    def post(self, batch, bodies):
+        """
+        Массовый POST пачки (выполняется в потоке, к БД не обращается).
+        Повторы делает send, поэтому сам клиент здесь не повторяет.
+        """
+        known = self.find_by_article([product.sku for product in batch if not product.ms_uuid])
+        payload = []
+        for product in batch:
+            body = bodies[product.pk]
+            if not product.ms_uuid and product.sku in known:
+                body = {**body, **self.client.meta('entity/product', known[product.sku])}
+            payload.append(body)
+
+        try:
+            response = self.client.post('entity/product', payload, retries=0)
+        except MoySkladError as e:
+            # При ошибке части позиций МС может ответить 4xx, но с тем же массивом в теле
+            if is_retryable(e) or not isinstance(e.payload, list) or len(e.payload) != len(payload):
+                raise
+            response = e.payload
+        if not isinstance(response, list) or len(response) != len(payload):
+            raise MoySkladError('POST entity/product: ответ не совпадает с запросом по длине')
+
+        result = {}
+        for product, item in zip(batch, response):
+            error = item_error(item)
+            result[product.pk] = MoySkladError(error) if error else item['id']
+        return result
+
+    def find_by_article(self, articles):
+        """{артикул: ms_uuid} для товаров, уже существующих в МС"""
+        if not articles:
+            return {}
+        response = self.client.get('entity/product', {
+            'filter': ';'.join(f'article={filter_value(article)}' for article in articles),
+            'limit': len(articles),
+        }, retries=0)
+        return {row['article']: row['id'] for row in response.get('rows', []) if row.get('article')}
+
+    # -----------------------------
+    # 🔹 Запись итога
+    # -----------------------------
+    def save_results(self, products, synced):
+        """Один UPDATE на кусок; строки не блокируются, правки во время выгрузки сохраняют флаг."""
+        read = {product.pk: product for product in products}
+        new_uuids = {pk: ms_uuid for pk, ms_uuid in synced.items() if read[pk].ms_uuid != ms_uuid}
+
+        # ms_uuid уникален: если МС вернул id, уже привязанный к другому товару, это ошибка позиции
+        taken = dict(
+            Product.objects.filter(ms_uuid__in=new_uuids.values())
+            .exclude(pk__in=new_uuids).values_list('ms_uuid', 'pk')
+        )
+        for pk, ms_uuid in list(new_uuids.items()):
+            if ms_uuid in taken:
+                self.errors[pk] = f'Товар МойСклад {ms_uuid} уже привязан к товару #{taken[ms_uuid]}'
+                del new_uuids[pk], synced[pk]
+        if not synced:
+            return 0
+
+        unchanged = Q()
+        for pk in synced:
+            unchanged |= Q(pk=pk, updated_at=read[pk].updated_at)
+        fields = {
+            'synced_at': timezone.now(),
+            'changed_locally': Case(When(unchanged, then=Value(False)), default=F('changed_locally')),
+        }
+        if new_uuids:
+            fields['ms_uuid'] = Case(
+                *[When(pk=pk, then=Value(ms_uuid)) for pk, ms_uuid in new_uuids.items()],
+                default=F('ms_uuid'),
+            )
+        Product.objects.filter(pk__in=synced).update(**fields)
+        return len(synced)
+
+
+def push(client=None, log=None, chunk_size=None, batch_size=None):
+    """Выгрузка товаров с локальными правками в МойСклад (см. ProductPush)"""
+    return ProductPush(client=client, log=log, chunk_size=chunk_size, batch_size=batch_size).run()
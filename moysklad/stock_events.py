@@ -0,0 +1,98 @@
+"""
+Остатки из вебхука МойСклад (webhookstock) без шторма записей.
+
+Вебхук только сохраняет уведомление в StockEvent и сразу отвечает 204 (без тела).
+Коалесцер (manage.py moysklad_stock_events) раз в окно MOYSKLAD_STOCK_WINDOW
+забирает накопившиеся события и:
+
+    1. по их reportUrl берёт самый ранний changedSince;
+    2. одним запросом report/stock/bystore/current?changedSince=... получает
+       изменившиеся пары (товар, склад) — по последнему значению на пару;
+    3. пишет их в Stock пачкой (CatalogPull.save_stock_report): один UPDATE,
+       один INSERT новых строк, один пересчёт stock_cache, один INSERT журнала;
+    4. удаляет обработанные события (DELETE по id, пачками).
+
+Тысяча уведомлений за окно превращается в один HTTP-запрос и несколько SQL.
+Отчёт содержит абсолютные остатки, поэтому повторная обработка безопасна:
+если запрос к МС упал, события остаются в очереди до следующего прохода.
+"""
+import logging
+import time
+import urllib.parse
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.utils import timezone
+
+from .client import MoySkladClient
+from .models import StockEvent
+from .sync import BATCH_SIZE, CatalogPull, ms_datetime
+
+logger = logging.getLogger(__name__)
+
+
+def changed_since(payload):
+    """changedSince из reportUrl уведомления (aware datetime) или None — нужен полный отчёт"""
+    url = payload.get('reportUrl') if isinstance(payload, dict) else None
+    if not url:
+        return None
+    value = urllib.parse.parse_qs(urllib.parse.urlparse(url).query).get('changedSince', [None])[0]
+    if not value:
+        return None
+    try:
+        since = datetime.strptime(value[:19], '%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        return None
+    return since.replace(tzinfo=ZoneInfo(settings.MOYSKLAD_TIMEZONE))
+
+
+def flush(client=None, limit=None):
+    """Обрабатывает накопившиеся события одним проходом. Возвращает (событий, пар товар/склад)."""
+    events = list(
+        StockEvent.objects.order_by('id').values_list('id', 'payload')[:limit or settings.MOYSKLAD_STOCK_EVENTS_LIMIT]
+    )
+    if not events:
+        return 0, 0
+
+    client = client or MoySkladClient()
+    since = [changed_since(payload) for _, payload in events]
+    params = {} if None in since else {'changedSince': ms_datetime(min(since))}
+    # Сеть — до записи в БД: транзакция и блокировки Stock держатся только на время записи
+    report = client.get('report/stock/bystore/current', params)
+    pairs = CatalogPull(client=client).save_stock_report(report, reference='moysklad:webhook')
+
+    # По id, а не id <= последнего: событие с меньшим id могло закоммититься позже выборки
+    ids = [event_id for event_id, _ in events]
+    for start in range(0, len(ids), BATCH_SIZE):
+        StockEvent.objects.filter(id__in=ids[start:start + BATCH_SIZE]).delete()
+    return len(events), pairs
+
+
+def run_coalescer(window=None, client=None, stop_when_empty=False, should_stop=lambda: False):
+    """
+    Цикл: ждёт, пока самому старому событию исполнится window секунд
+    (за это время подтягивается вся пачка), и сливает очередь. Возвращает число событий.
+    """
+    window = settings.MOYSKLAD_STOCK_WINDOW if window is None else window
+    processed = 0
+    while not should_stop():
+        oldest = StockEvent.objects.order_by('id').values_list('received_at', flat=True).first()
+        if oldest is None:
+            if stop_when_empty:
+                break
+            time.sleep(window)
+            continue
+        wait = window - (timezone.now() - oldest).total_seconds()
+        if wait > 0:
+            time.sleep(wait)
+            continue
+        try:
+            events, pairs = flush(client)
+        except Exception:
+            logger.exception('Сбой обработки событий остатков')
+            time.sleep(window)
+            continue
+        processed += events
+        logger.info('События остатков: %s, пар товар/склад: %s', events, pairs)
+    return processed
@@ -0,0 +1,370 @@
+"""
+Инкрементальная выгрузка каталога из МойСклад.
+
+Порядок: единицы измерения, группы товаров (категории), склады, типы цен,
+товары с ценами, остатки. Для каждой сущности хранится курсор SyncCursor:
+запрашиваются только строки с updated >= курсора (для остатков — changedSince).
+
+ms_uuid -> pk резолвится через словари, загруженные один раз за запуск;
+страница записывается пачкой: bulk_update изменившихся, bulk_create новых;
+строки, совпадающие с МС, не переписываются — ежедневная полная сверка дешёвая.
+Товары с changed_locally=True не перезаписываются — их сначала надо выгрузить в МС.
+
+Тегов в МойСклад нет (нет такой сущности), поэтому Tag не синхронизируется.
+"""
+import hashlib
+from datetime import timedelta
+from decimal import Decimal
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import slugify
+
+from products import refcache
+from products.models import Category, Unit, Warehouse, PriceType, Product, Price, Stock, StockMovement
+from products.stock_ledger import apply_stock_deltas, movement, record_movements
+from .client import MoySkladClient, iter_pages, uuid_from_meta
+from .models import SyncCursor
+
+ENTITIES = ('uom', 'productfolder', 'store', 'pricetype', 'product', 'stock')
+
+BATCH_SIZE = 500
+
+
+def ms_datetime(value):
+    """Дата для фильтров МойСклад: 'YYYY-MM-DD HH:MM:SS' по московскому времени"""
+    return value.astimezone(ZoneInfo(settings.MOYSKLAD_TIMEZONE)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def ms_suffix(ms_uuid, length=8):
+    """Короткий стабильный хвост для кодов и slug: у uuid МС общие префиксы не редкость"""
+    return hashlib.sha1(ms_uuid.encode()).hexdigest()[:length]
+
+
+def ms_slug(name, ms_uuid, max_length=50):
+    """Уникальный slug для новой строки: slugify(name) + хвост от uuid"""
+    suffix = ms_suffix(ms_uuid)
+    base = slugify(name)[:max_length - len(suffix) - 1]
+    return f"{base}-{suffix}" if base else f"ms-{suffix}"
+
+
+class CatalogPull:
+    def __init__(self, client=None, full=False, log=None):
+        self.client = client or MoySkladClient()
+        self.full = full
+        self.log = log or (lambda message: None)
+        self.now = timezone.now()
+        self._ids = {}
+
+    # -----------------------------
+    # 🔹 Запуск и курсоры
+    # -----------------------------
+    def run(self, entities=ENTITIES):
+        """Выгружает сущности по порядку. Возвращает {сущность: число строк}."""
+        stats = {}
+        for entity in ENTITIES:
+            if entity not in entities:
+                continue
+            cursor, _ = SyncCursor.objects.get_or_create(entity=entity)
+            since = None if self.full else cursor.updated_since
+            started = timezone.now()
+            try:
+                rows = getattr(self, f'pull_{entity}')(since)
+            except Exception as e:
+                cursor.last_run_at = started
+                cursor.last_error = str(e)[:2000]
+                cursor.save(update_fields=['last_run_at', 'last_error'])
+                raise
+            # Запас на расхождение часов и транзакции МС, закоммиченные во время выгрузки
+            cursor.updated_since = started - timedelta(seconds=settings.MOYSKLAD_CURSOR_OVERLAP)
+            cursor.last_run_at = started
+            cursor.last_rows = rows
+            cursor.last_error = ''
+            cursor.save()
+            stats[entity] = rows
+            self.log(f'{entity}: {rows}')
+        return stats
+
+    @staticmethod
+    def _params(since):
+        return {'filter': f'updated>={ms_datetime(since)}'} if since else {}
+
+    def ids(self, model):
+        """{ms_uuid: pk} для модели — загружается один раз за запуск"""
+        if model not in self._ids:
+            self._ids[model] = dict(model.objects.exclude(ms_uuid=None).values_list('ms_uuid', 'pk'))
+        return self._ids[model]
+
+    def _save(self, model, values_by_uuid, adopt_field=None, create_defaults=None, stamp=None, touch=None):
+        """
+        Пачка {ms_uuid: {поле: значение}}: изменившиеся строки — bulk_update,
+        новые — bulk_create, совпадающие с МС не переписываются (им только touch).
+        stamp — поля, которые пишутся вместе с любым изменением (updated_at и т.п.).
+        adopt_field — естественный ключ, по которому к МС привязываются локальные
+        строки без ms_uuid (например, склад с тем же именем).
+        """
+        if not values_by_uuid:
+            return 0
+        stamp, touch = stamp or {}, touch or {}
+        fields = list(next(iter(values_by_uuid.values())))
+        ids = self.ids(model)
+
+        adoptable = {}
+        if adopt_field:
+            pending = {values[adopt_field] for ms_uuid, values in values_by_uuid.items() if ms_uuid not in ids}
+            if pending:
+                adoptable = dict(
+                    model.objects.filter(ms_uuid=None, **{f'{adopt_field}__in': pending})
+                    .values_list(adopt_field, 'pk')
+                )
+
+        known = [ids[ms_uuid] for ms_uuid in values_by_uuid if ms_uuid in ids]
+        current = {row.pop('pk'): row for row in model.objects.filter(pk__in=known).values('pk', *fields)}
+
+        to_update, to_create, unchanged = [], [], []
+        for ms_uuid, values in values_by_uuid.items():
+            pk = ids.get(ms_uuid) or (adoptable.pop(values[adopt_field], None) if adopt_field else None)
+            if pk is None:
+                extra = create_defaults(ms_uuid, values) if create_defaults else {}
+                to_create.append(model(ms_uuid=ms_uuid, **values, **stamp, **touch, **extra))
+            elif current.get(pk) == values:
+                unchanged.append(pk)
+            else:
+                to_update.append(model(pk=pk, ms_uuid=ms_uuid, **values, **stamp, **touch))
+
+        with transaction.atomic():
+            if to_update:
+                model.objects.bulk_update(
+                    to_update, [*fields, *stamp, *touch, 'ms_uuid'], batch_size=BATCH_SIZE
+                )
+            if unchanged and touch:
+                model.objects.filter(pk__in=unchanged).update(**touch)
+            created = model.objects.bulk_create(to_create, batch_size=BATCH_SIZE)
+            if model in refcache.MODELS and (to_update or created):
+                # Массовые записи не шлют сигналов — версию справочника поднимаем сами
+                refcache.bump(model)
+        for obj in [*to_update, *created]:
+            ids[obj.ms_uuid] = obj.pk
+        return len(values_by_uuid)
+
+    # -----------------------------
+    # 🔹 Справочники
+    # -----------------------------
+    def pull_uom(self, since):
+        rows = 0
+        for page in iter_pages(self.client, 'entity/uom', self._params(since)):
+            rows += self._save(
+                Unit,
+                {row['id']: {'name': row['name'][:50]} for row in page},
+                adopt_field='name',
+                create_defaults=lambda ms_uuid, values: {'code': f"ms-{ms_suffix(ms_uuid, 7)}"},
+            )
+        return rows
+
+    def pull_productfolder(self, since):
+        rows = 0
+        for page in iter_pages(self.client, 'entity/productfolder', self._params(since)):
+            rows += self._save(
+                Category,
+                {
+                    row['id']: {'name': row['name'][:255], 'is_active': not row.get('archived', False)}
+                    for row in page
+                },
+                adopt_field='name',
+                create_defaults=lambda ms_uuid, values: {'slug': ms_slug(values['name'], ms_uuid)},
+            )
+        return rows
+
+    def pull_store(self, since):
+        rows = 0
+        for page in iter_pages(self.client, 'entity/store', self._params(since)):
+            rows += self._save(
+                Warehouse,
+                {row['id']: {'name': row['name'][:255]} for row in page},
+                adopt_field='name',
+            )
+        return rows
+
+    def pull_pricetype(self, since):
+        # Типы цен — настройка компании: короткий список без фильтра и страниц
+        price_types = self.client.get('context/companysettings/pricetype')
+        return self._save(
+            PriceType,
+            {row['id']: {'name': row['name'][:255]} for row in price_types},
+            adopt_field='name',
+            create_defaults=lambda ms_uuid, values: {'code': ms_slug(values['name'], ms_uuid)},
+        )
+
+    # -----------------------------
+    # 🔹 Товары и цены
+    # -----------------------------
+    def _fallback_category_id(self):
+        if not hasattr(self, '_fallback_category'):
+            self._fallback_category, _ = Category.objects.get_or_create(
+                slug='moysklad-no-folder', defaults={'name': 'Без группы (МойСклад)'}
+            )
+        return self._fallback_category.pk
+
+    def pull_product(self, since):
+        rows = 0
+        for page in iter_pages(self.client, 'entity/product', self._params(since)):
+            rows += self.save_products(page)
+        return rows
+
+    def save_products(self, page):
+        categories = self.ids(Category)
+        units = self.ids(Unit)
+        products = self.ids(Product)
+        default_unit = Product._meta.get_field('unit').default
+
+        # Локальные правки ещё не выгружены в МС — такие товары не трогаем.
+        # Строки блокируются до конца записи: правка, пришедшая между проверкой
+        # флага и bulk_update, ждёт коммита и не затирается данными МС
+        known = [products[row['id']] for row in page if row['id'] in products]
+        with transaction.atomic():
+            changed_locally = {
+                pk for pk, changed in Product.objects.select_for_update()
+                .filter(pk__in=known).order_by('pk').values_list('pk', 'changed_locally')
+                if changed
+            }
+            page = [row for row in page if products.get(row['id']) not in changed_locally]
+
+            values = {}
+            for row in page:
+                values[row['id']] = {
+                    'name': row['name'][:255],
+                    'description': row.get('description', ''),
+                    'sku': (row.get('article') or row.get('code') or row['id'])[:255],
+                    'is_active': not row.get('archived', False),
+                    'category_id': categories.get(uuid_from_meta(row.get('productFolder'))) or self._fallback_category_id(),
+                    'unit_id': units.get(uuid_from_meta(row.get('uom'))) or default_unit,
+                }
+            # changed_locally здесь не пишется: у отобранных строк он и так False,
+            # а флаг, поставленный параллельной правкой, сбрасывать нельзя
+            self._save(
+                Product, values,
+                adopt_field='sku',
+                create_defaults=lambda ms_uuid, v: {'slug': ms_slug(v['name'], ms_uuid, max_length=255)},
+                stamp={'updated_at': self.now},
+                touch={'synced_at': self.now},
+            )
+        self.save_prices(page)
+        return len(page)
+
+    def save_prices(self, page):
+        """
+        Цены продажи: новая строка Price, только если значение изменилось;
+        прежняя активная цена того же типа закрывается (история сохраняется).
+        """
+        products = self.ids(Product)
+        price_types = self.ids(PriceType)
+
+        wanted = {}
+        for row in page:
+            for sale_price in row.get('salePrices', []):
+                price_type_id = price_types.get(uuid_from_meta(sale_price.get('priceType')))
+                if price_type_id and sale_price.get('value'):
+                    # МойСклад хранит цены в копейках
+                    wanted[(products[row['id']], price_type_id)] = Decimal(sale_price['value']) / 100
+        if not wanted:
+            return 0
+
+        active = {}
+        for pk, product_id, price_type_id, value in Price.objects.filter(
+            product_id__in={product_id for product_id, _ in wanted}, is_active=True
+        ).values_list('pk', 'product_id', 'price_type_id', 'value'):
+            active.setdefault((product_id, price_type_id), []).append((pk, value))
+
+        changed = [
+            key for key, value in wanted.items()
+            if [v for _, v in active.get(key, [])] != [value]
+        ]
+        if not changed:
+            return 0
+
+        with transaction.atomic():
+            Price.objects.filter(
+                pk__in=[pk for key in changed for pk, _ in active.get(key, [])]
+            ).update(is_active=False, end_date=self.now, updated_at=self.now)
+            Price.objects.bulk_create([
+                Price(product_id=product_id, price_type_id=price_type_id, value=wanted[(product_id, price_type_id)],
+                      start_date=self.now)
+                for product_id, price_type_id in changed
+            ], batch_size=BATCH_SIZE)
+        return len(changed)
+
+    # -----------------------------
+    # 🔹 Остатки
+    # -----------------------------
+    def pull_stock(self, since):
+        """Текущие остатки по складам (report/stock/bystore/current)"""
+        params = {'changedSince': ms_datetime(since)} if since else {}
+        return self.save_stock_report(self.client.get('report/stock/bystore/current', params))
+
+    def save_stock_report(self, report, reference='moysklad'):
+        """
+        Строки отчёта об остатках -> Stock. Расхождения пишутся одним UPDATE на пачку
+        и в журнал движений (reason=sync). Для одной пары побеждает последняя строка.
+        """
+        products = self.ids(Product)
+        warehouses = self.ids(Warehouse)
+        targets = {}
+        for row in report:
+            product_id = products.get(row.get('assortmentId'))
+            warehouse_id = warehouses.get(row.get('storeId'))
+            if product_id and warehouse_id:
+                targets[(product_id, warehouse_id)] = int(round(row.get('stock') or 0))
+
+        if self.full:
+            # Полный отчёт не содержит нулевых строк: чего нет в отчёте — того нет на складе
+            for pair in Stock.objects.filter(
+                product__ms_uuid__isnull=False, warehouse__ms_uuid__isnull=False
+            ).values_list('product_id', 'warehouse_id'):
+                targets.setdefault(pair, 0)
+
+        product_ids = sorted({product_id for product_id, _ in targets})
+        for start in range(0, len(product_ids), BATCH_SIZE):
+            chunk = set(product_ids[start:start + BATCH_SIZE])
+            self.save_stock({pair: qty for pair, qty in targets.items() if pair[0] in chunk}, reference)
+        return len(targets)
+
+    @transaction.atomic
+    def save_stock(self, targets, reference='moysklad'):
+        existing = {
+            (stock.product_id, stock.warehouse_id): stock
+            for stock in Stock.objects.select_for_update().filter(product_id__in={p for p, _ in targets})
+        }
+        units = dict(Product.objects.filter(pk__in={p for p, _ in targets}).values_list('pk', 'unit_id'))
+
+        deltas, created, movements = {}, [], []
+        for (product_id, warehouse_id), quantity in targets.items():
+            stock = existing.get((product_id, warehouse_id))
+            if stock is None:
+                if quantity:
+                    created.append(Stock(
+                        product_id=product_id, warehouse_id=warehouse_id,
+                        unit_id=units[product_id], quantity=quantity,
+                    ))
+                    movements.append(movement(product_id, warehouse_id, quantity, StockMovement.REASON_SYNC, reference))
+                continue
+            delta = quantity - stock.quantity
+            if delta:
+                deltas[stock] = delta
+                movements.append(movement(product_id, warehouse_id, delta, StockMovement.REASON_SYNC, reference))
+
+        if created:
+            Stock.objects.bulk_create(created)
+        apply_stock_deltas(deltas, refresh_cache=False)
+        # Один пересчёт stock_cache на пачку — и для новых строк, и для изменённых
+        touched = {stock.product_id for stock in [*created, *deltas]}
+        if touched:
+            Product.refresh_stock_cache(touched)
+        record_movements(movements)
+        return len(movements)
+
+
+def pull(full=False, entities=ENTITIES, client=None, log=None):
+    """Выгрузка каталога из МойСклад (см. CatalogPull)"""
+    return CatalogPull(client=client, full=full, log=log).run(entities)
@@ -0,0 +1,459 @@
+import copy
+import gzip
+import json
+import re
+import threading
+import urllib.parse
+import uuid
+from decimal import Decimal
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from products.models import Category, Unit, Warehouse, PriceType, Product, Price, Stock, StockMovement
+from .client import MoySkladClient, MoySkladError
+from .models import SyncCursor, StockEvent
+from .push import PUSH_ENTITY, ProductPush, push
+from .stock_events import flush
+from .sync import CatalogPull, pull
+
+TEST_DATA = Path(__file__).resolve().parent / 'test_data'
+
+ROUTES = {
+    '/entity/uom': 'uom.json',
+    '/entity/productfolder': 'productfolder.json',
+    '/entity/store': 'store.json',
+    '/context/companysettings/pricetype': 'pricetype.json',
+    '/entity/product': 'product.json',
+    '/report/stock/bystore/current': 'stock.json',
+}
+
+
+class StubMoySklad:
+    """
+    Локальный HTTP-сервер с записанными ответами МойСклад (test_data/*.json).
+    Понимает limit/offset и filter=updated>=... / article=...;article=...,
+    массовый POST entity/product, отвечает gzip, пишет журнал запросов.
+    """
+
+    def __init__(self):
+        self.data = {path: json.loads((TEST_DATA / name).read_text()) for path, name in ROUTES.items()}
+        self.requests = []
+        self.fail_next = []  # HTTP-коды, которыми ответить на ближайшие запросы
+        self.lose_next_post = False  # обработать POST, но ответить 503 (ответ «потерялся»)
+        self.posted = []  # тела массовых POST
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                url = urllib.parse.urlparse(self.path)
+                params = dict(urllib.parse.parse_qsl(url.query))
+                stub.requests.append((url.path, params, self.headers.get('Authorization')))
+                if stub.fail_next:
+                    self.send_response(stub.fail_next.pop(0))
+                    self.send_header('X-Lognex-Retry-After', '10')
+                    self.end_headers()
+                    return
+                body = stub.respond(url.path, params)
+                if body is None:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                self.reply(200, body)
+
+            def do_POST(self):
+                url = urllib.parse.urlparse(self.path)
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                stub.requests.append((url.path, body, self.headers.get('Authorization')))
+                if stub.fail_next:
+                    self.send_response(stub.fail_next.pop(0))
+                    self.send_header('X-Lognex-Retry-After', '10')
+                    self.end_headers()
+                    return
+                if url.path != '/entity/product':
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                stub.posted.append(body)
+                result = stub.save_products(body)
+                if stub.lose_next_post:
+                    stub.lose_next_post = False
+                    self.send_response(503)
+                    self.end_headers()
+                    return
+                self.reply(200, result)
+
+            def reply(self, status, body):
+                payload = gzip.compress(json.dumps(body).encode())
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Encoding', 'gzip')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+
+    def respond(self, path, params):
+        data = self.data.get(path)
+        if data is None or isinstance(data, list):
+            return data
+        rows = data['rows']
+        if params.get('filter', '').startswith('updated>='):
+            since = params['filter'][len('updated>='):]
+            rows = [row for row in rows if row['updated'] >= since]
+        elif params.get('filter', '').startswith('article='):
+            # ';' внутри значения экранирован обратной косой чертой
+            articles = {
+                re.sub(r'\\(.)', r'\1', part[len('article='):])
+                for part in re.split(r'(?<!\\);', params['filter'])
+            }
+            rows = [row for row in rows if row.get('article') in articles]
+        offset, limit = int(params.get('offset', 0)), int(params.get('limit', 1000))
+        return {**data, 'meta': {**data['meta'], 'size': len(rows), 'offset': offset, 'limit': limit},
+                'rows': rows[offset:offset + limit]}
+
+    def save_products(self, items):
+        """Массовое создание/обновление: позиция без имени — ошибка только этой позиции"""
+        rows = {row['id']: row for row in self.data['/entity/product']['rows']}
+        result = []
+        for item in items:
+            if not item.get('name'):
+                result.append({'errors': [{'error': "Поле 'name' не может быть пустым", 'code': 3000}]})
+                continue
+            ms_uuid = item['meta']['href'].rsplit('/', 1)[-1] if 'meta' in item else str(uuid.uuid4())
+            row = rows.get(ms_uuid)
+            if row is None:
+                row = rows[ms_uuid] = {'id': ms_uuid, 'updated': '2099-01-01 00:00:00.000'}
+                self.data['/entity/product']['rows'].append(row)
+            row.update({key: value for key, value in item.items() if key != 'meta'})
+            result.append(row)
+        return result
+
+    def paths(self, path):
+        return [params for p, params, _ in self.requests if p == path]
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@override_settings(MOYSKLAD_RATE_LIMIT=0, MOYSKLAD_RETRIES=2)
+class CatalogPullTests(TestCase):
+    def setUp(self):
+        self.stub = StubMoySklad().__enter__()
+        self.addCleanup(self.stub.__exit__)
+        self.client_ms = MoySkladClient(base_url=self.stub.url, token='test-token')
+
+    def pull(self, **kwargs):
+        return pull(client=self.client_ms, **kwargs)
+
+    def test_full_pull_creates_catalog(self):
+        stats = self.pull()
+
+        self.assertEqual(stats['product'], 5)
+        self.assertEqual(Category.objects.filter(ms_uuid__isnull=False).count(), 2)
+        self.assertEqual(Warehouse.objects.count(), 2)
+        self.assertEqual(PriceType.objects.count(), 2)
+
+        trout = Product.objects.get(sku='MS-100')
+        self.assertEqual(trout.category.name, 'Рыба')
+        self.assertEqual(trout.unit.name, 'кг')
+        self.assertIsNotNone(trout.synced_at)
+        self.assertFalse(Product.objects.get(sku='MS-104').is_active)
+        self.assertEqual(Product.objects.get(sku='MS-102').category.name, 'Икра')
+
+        # Копейки -> рубли; нулевая оптовая цена не создаётся
+        self.assertEqual(Price.get_current_price(trout).value, Decimal('1500.00'))
+        self.assertEqual(Price.objects.filter(product=trout).count(), 1)
+
+        # Остатки: дробный округляется, неизвестный товар пропускается, журнал и кеш обновлены
+        self.assertEqual(Stock.objects.count(), 4)
+        self.assertEqual(Stock.objects.get(product__sku='MS-101').quantity, 8)
+        trout.refresh_from_db()
+        self.assertEqual(trout.stock_cache, 15)
+        self.assertEqual(
+            StockMovement.objects.filter(reason=StockMovement.REASON_SYNC, product=trout).count(), 2
+        )
+
+        self.assertEqual(SyncCursor.objects.filter(updated_since__isnull=False).count(), 6)
+        self.assertTrue(all(auth == 'Bearer test-token' for _, _, auth in self.stub.requests))
+
+    @override_settings(MOYSKLAD_PAGE_SIZE=2, MOYSKLAD_CONCURRENCY=3)
+    def test_pages_are_fetched_concurrently_and_all_saved(self):
+        self.pull(entities=('uom', 'productfolder', 'pricetype', 'product'))
+
+        offsets = sorted(int(p['offset']) for p in self.stub.paths('/entity/product'))
+        self.assertEqual(offsets, [0, 2, 4])
+        self.assertEqual(Product.objects.filter(ms_uuid__isnull=False).count(), 5)
+
+    def test_incremental_pull_uses_cursor_and_keeps_local_changes(self):
+        self.pull()
+        salmon = Product.objects.get(sku='MS-101')
+        Product.objects.filter(pk=salmon.pk).update(name='Сёмга (правка)', changed_locally=True)
+
+        rows = self.stub.data['/entity/product']['rows']
+        rows[0]['salePrices'][0]['value'] = 160000
+        rows[1]['name'] = 'Сёмга из МС'
+        for row in rows[:2]:
+            row['updated'] = '2099-01-01 00:00:00.000'
+        self.stub.requests.clear()
+
+        stats = self.pull(entities=('product',))
+
+        product_filter = self.stub.paths('/entity/product')[0]['filter']
+        self.assertTrue(product_filter.startswith('updated>='))
+        self.assertEqual(stats['product'], 1)
+        salmon.refresh_from_db()
+        self.assertEqual(salmon.name, 'Сёмга (правка)')
+        self.assertTrue(salmon.changed_locally)
+
+        # История цен: старая закрыта, новая активна
+        trout = Product.objects.get(sku='MS-100')
+        self.assertEqual(Price.objects.filter(product=trout).count(), 2)
+        self.assertEqual(Price.get_current_price(trout).value, Decimal('1600.00'))
+        self.assertEqual(Price.objects.filter(product=trout, is_active=True).count(), 1)
+
+    def test_flag_set_during_product_write_is_kept(self):
+        self.pull()
+        salmon = Product.objects.get(sku='MS-101')
+        self.stub.data['/entity/product']['rows'][1]['name'] = 'Сёмга из МС'
+        save = CatalogPull._save
+
+        def edit_then_save(pull, model, *args, **kwargs):
+            # Правка попадает между проверкой флага и записью пачки
+            if model is Product:
+                Product.objects.filter(pk=salmon.pk).update(changed_locally=True)
+            return save(pull, model, *args, **kwargs)
+
+        with mock.patch.object(CatalogPull, '_save', edit_then_save):
+            self.pull(full=True, entities=('product',))
+
+        salmon.refresh_from_db()
+        self.assertTrue(salmon.changed_locally)
+
+    @skipUnlessDBFeature('has_select_for_update')
+    def test_products_are_locked_while_written(self):
+        self.pull()
+        with CaptureQueriesContext(connection) as queries:
+            self.pull(full=True, entities=('product',))
+        self.assertTrue(any(
+            'FOR UPDATE' in query['sql'] and 'changed_locally' in query['sql'] for query in queries
+        ))
+
+    def test_local_rows_are_adopted_by_natural_key(self):
+        warehouse = Warehouse.objects.create(name='Основной склад')
+        unit = Unit.objects.create(code='pcs', name='шт')
+
+        self.pull(entities=('uom', 'store'))
+
+        warehouse.refresh_from_db()
+        unit.refresh_from_db()
+        self.assertEqual(warehouse.ms_uuid, 'b1b2c3d4-0000-11ee-0a80-000200000001')
+        self.assertEqual(unit.ms_uuid, '19f1edc0-fc42-4001-94cb-c9ec9c62ec10')
+        self.assertEqual(Warehouse.objects.count(), 2)
+
+    def test_full_stock_pull_zeroes_missing_pairs(self):
+        self.pull()
+        stock = copy.deepcopy(self.stub.data['/report/stock/bystore/current'])
+        self.stub.data['/report/stock/bystore/current'] = [row for row in stock if row['stock'] != 3.0]
+
+        self.pull(full=True, entities=('stock',))
+
+        trout = Product.objects.get(sku='MS-100')
+        self.assertEqual(Stock.objects.get(product=trout, warehouse__name='Магазин').quantity, 0)
+        trout.refresh_from_db()
+        self.assertEqual(trout.stock_cache, 12)
+
+    @override_settings(MOYSKLAD_RETRIES=2)
+    def test_rate_limited_request_is_retried(self):
+        self.stub.fail_next = [429]
+        self.pull(entities=('store',))
+        self.assertEqual(Warehouse.objects.count(), 2)
+        self.assertEqual(len(self.stub.paths('/entity/store')), 2)
+
+
+@override_settings(MOYSKLAD_RATE_LIMIT=0, MOYSKLAD_RETRIES=2)
+class ProductPushTests(TestCase):
+    def setUp(self):
+        self.stub = StubMoySklad().__enter__()
+        self.addCleanup(self.stub.__exit__)
+        self.client_ms = MoySkladClient(base_url=self.stub.url, token='test-token')
+        pull(client=self.client_ms)
+        self.stub.requests.clear()
+
+    def push(self, **kwargs):
+        return push(client=self.client_ms, **kwargs)
+
+    def posted_items(self):
+        return [item for body in self.stub.posted for item in body]
+
+    def test_changed_products_are_pushed_in_batches(self):
+        trout = Product.objects.get(sku='MS-100')
+        Product.objects.filter(pk=trout.pk).update(name='Форель (правка)', changed_locally=True)
+        Price.objects.filter(product=trout).update(value=Decimal('1750.00'))
+        new = Product.objects.create(
+            name='Новый товар', slug='novyi-tovar', sku='LOCAL-1',
+            category=trout.category, unit=trout.unit, changed_locally=True,
+        )
+        Product.objects.filter(sku__in=['MS-101', 'MS-102']).update(changed_locally=True)
+
+        stats = self.push(batch_size=2)
+
+        self.assertEqual(stats, {'pushed': 4, 'failed': 0})
+        self.assertEqual(len(self.stub.posted), 2)
+        items = {item['article']: item for item in self.posted_items()}
+        self.assertTrue(items['MS-100']['meta']['href'].endswith(trout.ms_uuid))
+        self.assertEqual(items['MS-100']['name'], 'Форель (правка)')
+        self.assertEqual(items['MS-100']['salePrices'][0]['value'], 175000)
+        self.assertNotIn('meta', items['LOCAL-1'])
+        self.assertTrue(items['LOCAL-1']['productFolder']['meta']['href'].endswith(trout.category.ms_uuid))
+
+        self.assertFalse(Product.objects.filter(changed_locally=True).exists())
+        new.refresh_from_db()
+        self.assertIsNotNone(new.ms_uuid)
+        self.assertIsNotNone(new.synced_at)
+        cursor = SyncCursor.objects.get(entity=PUSH_ENTITY)
+        self.assertEqual((cursor.last_rows, cursor.last_error), (4, ''))
+
+    def test_partial_failure_keeps_failed_rows_dirty(self):
+        Product.objects.filter(sku='MS-100').update(name='', changed_locally=True)
+        Product.objects.filter(sku='MS-101').update(changed_locally=True)
+
+        stats = self.push()
+
+        self.assertEqual(stats, {'pushed': 1, 'failed': 1})
+        self.assertTrue(Product.objects.get(sku='MS-100').changed_locally)
+        self.assertFalse(Product.objects.get(sku='MS-101').changed_locally)
+        self.assertIn('name', SyncCursor.objects.get(entity=PUSH_ENTITY).last_error)
+
+    def test_edit_during_push_stays_dirty(self):
+        Product.objects.filter(sku__in=['MS-100', 'MS-101']).update(changed_locally=True)
+        products = list(Product.objects.filter(changed_locally=True).select_related('category', 'unit').order_by('pk'))
+
+        # Правка между чтением куска и записью итога
+        salmon = Product.objects.get(sku='MS-101')
+        salmon.name = 'Сёмга (новая правка)'
+        salmon.save()
+
+        pushed = ProductPush(client=self.client_ms).push_chunk(products)
+
+        self.assertEqual(pushed, 2)
+        self.assertFalse(Product.objects.get(sku='MS-100').changed_locally)
+        salmon.refresh_from_db()
+        self.assertTrue(salmon.changed_locally)
+        self.assertIsNotNone(salmon.synced_at)
+
+    def test_lost_response_is_retried_without_duplicates(self):
+        trout = Product.objects.get(sku='MS-100')
+        Product.objects.create(
+            name='Новый товар', slug='novyi-tovar', sku='LOCAL-1',
+            category=trout.category, unit=trout.unit, changed_locally=True,
+        )
+        self.stub.lose_next_post = True
+
+        stats = self.push()
+
+        self.assertEqual(stats, {'pushed': 1, 'failed': 0})
+        created = [row for row in self.stub.data['/entity/product']['rows'] if row.get('article') == 'LOCAL-1']
+        self.assertEqual(len(created), 1)
+        self.assertEqual(Product.objects.get(sku='LOCAL-1').ms_uuid, created[0]['id'])
+        # Повтор ушёл обновлением найденного по артикулу товара
+        self.assertIn('meta', self.stub.posted[-1][0])
+
+    def test_article_with_separator_is_escaped(self):
+        rows = self.stub.data['/entity/product']['rows']
+        rows.append({**rows[0], 'id': str(uuid.uuid4()), 'article': 'MS;100'})
+
+        found = ProductPush(client=self.client_ms).find_by_article(['MS;100', 'MS-101'])
+
+        self.assertEqual(found, {'MS;100': rows[-1]['id'], 'MS-101': rows[1]['id']})
+        self.assertEqual(self.stub.paths('/entity/product')[-1]['filter'], 'article=MS\\;100;article=MS-101')
+
+    def test_unavailable_api_leaves_rows_dirty(self):
+        Product.objects.filter(sku='MS-100').update(changed_locally=True)
+        self.stub.fail_next = [503] * 3  # первая попытка и оба повтора
+
+        stats = self.push()
+
+        self.assertEqual(stats, {'pushed': 0, 'failed': 1})
+        self.assertTrue(Product.objects.get(sku='MS-100').changed_locally)
+
+
+@override_settings(MOYSKLAD_RATE_LIMIT=0, MOYSKLAD_RETRIES=2, MOYSKLAD_WEBHOOK_SECRET='s3cret')
+class StockWebhookTests(TestCase):
+    REPORT_URL = 'https://api.moysklad.ru/api/remap/1.2/report/stock/bystore/current?changedSince={}'
+
+    def setUp(self):
+        self.stub = StubMoySklad().__enter__()
+        self.addCleanup(self.stub.__exit__)
+        self.client_ms = MoySkladClient(base_url=self.stub.url, token='test-token')
+        pull(client=self.client_ms)
+        self.stub.requests.clear()
+
+    def notify(self, changed_since, secret='s3cret'):
+        return self.client.post(
+            f"{reverse('moysklad_stock_webhook')}?secret={secret}",
+            {'accountId': 'acc', 'stockType': 'stock', 'reportType': 'bystore',
+             'reportUrl': self.REPORT_URL.format(changed_since)},
+            content_type='application/json',
+        )
+
+    def test_webhook_only_queues_event(self):
+        self.assertEqual(self.notify('2024-01-10 12:00:00', secret='wrong').status_code, 403)
+        self.assertEqual(self.notify('2024-01-10 12:00:00').status_code, 204)
+        self.assertEqual(StockEvent.objects.count(), 1)
+        self.assertEqual(self.stub.requests, [])
+
+    def test_webhook_is_not_throttled(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        burst = settings.THROTTLE_BUCKETS['ip'][0] + 10
+        statuses = {self.notify('2024-01-10 12:00:00').status_code for _ in range(burst)}
+        self.assertEqual(statuses, {204})
+
+    def test_burst_is_coalesced_into_one_report_and_one_write(self):
+        report = self.stub.data['/report/stock/bystore/current']
+        for row in report:
+            row['stock'] += 5
+        StockEvent.objects.bulk_create([
+            StockEvent(payload={'reportUrl': self.REPORT_URL.format(f'2024-01-10 12:{i % 60:02d}:00')})
+            for i in range(1000)
+        ])
+
+        with CaptureQueriesContext(connection) as queries:
+            events, pairs = flush(client=self.client_ms)
+
+        self.assertEqual((events, pairs), (1000, 4))
+        self.assertEqual(self.stub.paths('/report/stock/bystore/current'), [{'changedSince': '2024-01-10 12:00:00'}])
+        self.assertLess(len(queries), 20)
+        self.assertFalse(StockEvent.objects.exists())
+
+        trout = Product.objects.get(sku='MS-100')
+        self.assertEqual(trout.stock_cache, 25)
+        self.assertEqual(
+            StockMovement.objects.filter(reference='moysklad:webhook', product=trout).count(), 2
+        )
+
+    def test_failed_report_keeps_events(self):
+        StockEvent.objects.create(payload={'reportUrl': self.REPORT_URL.format('2024-01-10 12:00:00')})
+        self.stub.fail_next = [503] * 3
+
+        with self.assertRaises(MoySkladError):
+            flush(client=self.client_ms)
+        self.assertEqual(StockEvent.objects.count(), 1)
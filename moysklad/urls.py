@@ -0,0 +1,7 @@
+from django.urls import path
+
+from .views import StockWebhookView
+
+urlpatterns = [
+    path('webhooks/stock/', StockWebhookView.as_view(), name='moysklad_stock_webhook'),
+]
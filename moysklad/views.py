@@ -0,0 +1,32 @@
+import hmac
+
+from django.conf import settings
+from rest_framework import permissions, status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .models import StockEvent
+
+
+class StockWebhookView(APIView):
+    """
+    Вебхук МойСклад об изменении остатков (webhookstock).
+    Только кладёт уведомление в очередь StockEvent и сразу отвечает 204:
+    МС ждёт ответа не дольше 1.5 с. Остатки применяет manage.py moysklad_stock_events.
+    МС не умеет заголовки авторизации, поэтому секрет передаётся в адресе (?secret=).
+    Троттлинг не применяется: все уведомления МС идут с одних адресов.
+    """
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+    # Всплески уведомлений МС — норма, а запрос и так проверен секретом
+    throttle_classes = []
+
+    def post(self, request):
+        secret = settings.MOYSKLAD_WEBHOOK_SECRET
+        if not secret or not hmac.compare_digest(request.query_params.get('secret', ''), secret):
+            return Response(status=status.HTTP_403_FORBIDDEN)
+        if not isinstance(request.data, dict):
+            return Response({'error': 'Ожидается JSON-объект'}, status=status.HTTP_400_BAD_REQUEST)
+
+        StockEvent.objects.create(payload=request.data)
+        return Response(status=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,14 @@
+"""
+URL админки, загружаемые при первом запросе к /admin/.
+
+Модули admin.py тянут django-import-export, а с ним tablib и openpyxl
+(~0.15 с и заметная часть памяти воркера). Админка подключена через
+mysite.apps.AdminConfig без автопоиска при старте: admin.py читаются здесь,
+когда URLResolver впервые разбирает путь под /admin/ (или строит reverse),
+либо в проверках manage.py check.
+"""
+from django.contrib import admin
+
+admin.autodiscover()
+
+urlpatterns = admin.site.get_urls()
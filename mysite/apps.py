@@ -0,0 +1,28 @@
+"""
+Конфигурация админки проекта (INSTALLED_APPS: 'mysite.apps.AdminConfig').
+
+Отдельный модуль, а не core/apps.py: при двух AppConfig в модуле приложения
+Django перестаёт выбирать CoreConfig по умолчанию.
+"""
+from django.contrib import admin
+from django.contrib.admin.apps import SimpleAdminConfig
+from django.contrib.admin.checks import check_admin_app, check_dependencies
+from django.core import checks
+
+
+def check_admin(app_configs, **kwargs):
+    """
+    Проверки ModelAdmin. admin.py при старте не читаются (mysite/admin_urls.py),
+    поэтому сначала автопоиск — иначе manage.py check видит пустую админку.
+    Проверки запускают только команды manage.py, старт воркера остаётся ленивым.
+    """
+    admin.autodiscover()
+    return check_admin_app(app_configs)
+
+
+class AdminConfig(SimpleAdminConfig):
+    """SimpleAdminConfig, у которого проверки админки сами находят admin.py"""
+
+    def ready(self):
+        checks.register(check_dependencies, checks.Tags.admin)
+        checks.register(check_admin, checks.Tags.admin)
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 import os
+from datetime import timedelta
 from pathlib import Path
 
 from django.urls import reverse_lazy
@@ -38,14 +39,17 @@ ALLOWED_HOSTS = ['51.250.123.92', 'localhost', '127.0.0.1', 'morevkus.ru', 'www.
 INSTALLED_APPS = [
     'storages',
     'import_export',
+    'core',
     'products',
     'orders',
     'users',
+    'analytics',
+    'moysklad',
     'django_extensions',
     'django_filters',
     'rest_framework.authtoken',
     'rest_framework',
-    'django.contrib.admin',
+    'mysite.apps.AdminConfig',  # admin.py — при первом запросе к /admin/ (mysite/admin_urls.py) или в manage.py check
     'django.contrib.auth',
     'django.contrib.contenttypes',
     'django.contrib.sessions',
@@ -55,7 +59,9 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    'core.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.PrimaryStickinessMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -99,6 +105,35 @@ DATABASES = {
     }
 }
 
+# Реплики только для чтения (core/db_router.py): DB_REPLICA_HOSTS=host1,host2[:port].
+# Имя БД и учётные данные — как у основной; в тестах реплика смотрит в тестовую основную БД
+DATABASE_REPLICAS = []
+for _number, _host in enumerate(filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(',')), start=1):
+    _host, _, _port = _host.strip().partition(':')
+    DATABASES[f'replica_{_number}'] = {
+        **DATABASES['default'],
+        'HOST': _host,
+        'PORT': _port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica_{_number}')
+
+DATABASE_ROUTERS = ['core.db_router.ReplicaRouter']
+# Сколько секунд после записи клиент читает из основной БД (запас на отставание реплик)
+DATABASE_PIN_SECONDS = 5
+
+# Профилирование запросов (core/profiling.py): доля замеряемых запросов, 0 — только
+# запросы с заголовком X-Profile: 1. Server-Timing отдаётся только сотрудникам
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', '0'))
+PROFILING_WINDOW = 1000  # последних замеров на эндпоинт в памяти процесса
+
+# Бюджет холодного старта воркера (core/startup.py, manage.py startup_profile, тест в core/tests.py):
+# время get_wsgi_application() + URLconf и RSS процесса после старта
+STARTUP_TIME_BUDGET = float(os.getenv('STARTUP_TIME_BUDGET', '1.5'))  # сек
+STARTUP_RSS_BUDGET_MB = int(os.getenv('STARTUP_RSS_BUDGET_MB', '110'))
+# Тяжёлые зависимости, которые грузятся только на своих путях, а не при старте
+STARTUP_LAZY_MODULES = ('pandas', 'numpy', 'import_export.admin', 'tablib', 'openpyxl', 'boto3', 'botocore')
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -146,17 +181,125 @@ LOGIN_REDIRECT_URL = reverse_lazy("customers:profile")
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
+        'users.authentication.StatelessJWTAuthentication',
         'rest_framework.authentication.TokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
-    'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend']
+    'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
+    'DEFAULT_THROTTLE_CLASSES': ['core.throttling.TokenBucketThrottle'],
+    # Сколько прокси перед приложением (nginx — 1): адрес клиента для ведер — запись
+    # X-Forwarded-For, добавленная последним прокси; подставленные клиентом записи левее
+    # не учитываются. Без прокси — NUM_PROXIES=0 (REMOTE_ADDR)
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES', '1')),
+}
+
+# Общий кеш воркеров: ведра троттлинга, закрепление за основной БД, ответы /availability/.
+# Без REDIS_URL — память процесса (разработка): лимиты считаются в каждом воркере отдельно
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+
+# Ограничение частоты (core/throttling.py): token bucket в общем кеше.
+# Ведро: (ёмкость — допустимый всплеск, пополнение — токенов в секунду)
+THROTTLE_ENABLED = os.getenv('THROTTLE_ENABLED', '1') == '1'
+THROTTLE_BUCKETS = {
+    'user': (120, 2.0),      # вошедший пользователь
+    'ip': (60, 1.0),         # анонимный клиент по адресу
+    'login': (10, 10 / 60),  # вход и регистрация с адреса: 10 сразу, дальше 10 в минуту
+}
+# Цена запроса в токенах по throttle_scope представления (остальные — 1)
+THROTTLE_COSTS = {
+    'import': 30,
+    'export': 30,
+    'order-create': 5,
+    'order-repeat': 5,
+}
+# Одновременных запросов на весь сервис; сверх лимита — 503 с Retry-After
+THROTTLE_CONCURRENCY = {
+    'import': 2,
+    'export': 2,
 }
+THROTTLE_BUSY_RETRY_AFTER = 10  # сек
+THROTTLE_CONCURRENCY_TIMEOUT = 15 * 60  # сек: счётчик сбросится, если воркер упал посреди запроса
+
+# JWT (users/tokens.py): Authorization: Bearer <access>, проверка без БД.
+# Access не отзывается — поэтому короткий; refresh одноразовый, отзывается при выходе
+SIMPLE_JWT = {
+    'ACCESS_TOKEN_LIFETIME': timedelta(minutes=5),
+    'REFRESH_TOKEN_LIFETIME': timedelta(days=14),
+    'ROTATE_REFRESH_TOKENS': True,
+    'TOKEN_OBTAIN_SERIALIZER': 'users.serializers.JWTObtainSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'users.serializers.JWTRefreshSerializer',
+}
+
+# Время жизни кэша ответа /products/availability/ (сек) — гасит частые обновления корзины
+AVAILABILITY_CACHE_TIMEOUT = 5
+
+# Idempotency-Key для POST /orders/create/ и /orders/<pk>/repeat/:
+# сколько хранить ответ (сек) и сколько ждать параллельный дубль (сек)
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+IDEMPOTENCY_WAIT_TIMEOUT = 10
+# Аренда ключа «в работе» (сек): после неё повтор перехватывает ключ у упавшего
+# воркера. Больше самого долгого запроса создания/повтора заказа
+IDEMPOTENCY_LEASE = 60
+
+# Архивация заказов (manage.py archive_orders): доставленные и отменённые
+# заказы старше стольких дней переносятся в архив пачками такого размера
+ORDER_ARCHIVE_AFTER_DAYS = 180
+ORDER_ARCHIVE_BATCH_SIZE = 1000
+
+# Очередь подтверждения заказов (manage.py confirm_orders_worker):
+# заказов в пачке, попыток при сбое пачки, пауза воркера при пустой очереди (сек)
+CONFIRMATION_BATCH_SIZE = 100
+CONFIRMATION_MAX_ATTEMPTS = 3
+CONFIRMATION_IDLE_SLEEP = 1.0
+
+# МойСклад (manage.py moysklad_pull). Лимиты API: 45 запросов за 3 секунды
+# и не больше 5 параллельных запросов на пользователя
+MOYSKLAD_API_URL = os.getenv('MOYSKLAD_API_URL', 'https://api.moysklad.ru/api/remap/1.2')
+MOYSKLAD_TOKEN = os.getenv('MOYSKLAD_TOKEN', '')
+MOYSKLAD_TIMEZONE = 'Europe/Moscow'
+MOYSKLAD_TIMEOUT = 30
+MOYSKLAD_RETRIES = 3
+MOYSKLAD_PAGE_SIZE = 1000
+MOYSKLAD_CONCURRENCY = 4
+MOYSKLAD_RATE_LIMIT = 12  # запросов в секунду
+MOYSKLAD_CURSOR_OVERLAP = 300  # сек: курсор сдвигается назад на этот запас
+MOYSKLAD_PUSH_CHUNK_SIZE = 500  # товаров с локальными правками за один проход
+MOYSKLAD_PUSH_BATCH_SIZE = 100  # позиций в одном массовом POST (МС принимает до 1000)
+# Вебхук остатков: https://<сайт>/moysklad/webhooks/stock/?secret=<MOYSKLAD_WEBHOOK_SECRET>
+MOYSKLAD_WEBHOOK_SECRET = os.getenv('MOYSKLAD_WEBHOOK_SECRET', '')
+MOYSKLAD_STOCK_WINDOW = 2  # сек: события остатков копятся окно и применяются одной пачкой
+MOYSKLAD_STOCK_EVENTS_LIMIT = 5000  # событий за один проход коалесцера
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+
+# Кеш справочников в памяти процесса (products/refcache.py): как часто сверять версии, сек
+REFERENCE_CACHE_CHECK_INTERVAL = 2
+
+# Публичные медиа товаров: ссылки собираются строкой без подписи (products/media_urls.py).
+# Префиксы должны быть открыты на чтение политикой бакета; MEDIA_CDN_URL — например https://cdn.morevkus.ru/
+MEDIA_CDN_URL = os.getenv('MEDIA_CDN_URL', '')
+MEDIA_PUBLIC_PREFIXES = ('product_images/',)
+
+# Уменьшенные копии фото товаров (srcset): ширины, форматы, качество, процессов Pillow
+PRODUCT_IMAGE_WIDTHS = (200, 400, 800, 1200)
+PRODUCT_IMAGE_FORMATS = ('webp', 'jpeg')
+PRODUCT_IMAGE_QUALITY = 80
+PRODUCT_IMAGE_WORKERS = 2
+# Массовая загрузка фото (products/images/bulk-upload/)
+PRODUCT_IMAGE_UPLOAD_THREADS = 8  # параллельных загрузок в хранилище
+PRODUCT_IMAGE_UPLOAD_MAX_FILES = 500
+PRODUCT_IMAGE_UPLOAD_MAX_SIZE = 20 * 1024 * 1024  # байт на файл
+PRODUCT_IMAGE_UPLOAD_MAX_TOTAL = 500 * 1024 * 1024  # байт на загрузку (после распаковки)
 # Настройки django-import-export
 IMPORT_EXPORT_USE_TRANSACTIONS = True  # Использовать транзакции при импорте
 IMPORT_EXPORT_SKIP_ADMIN_LOG = False   # Логировать действия в истории админки
@@ -1,20 +1,24 @@
 from django.conf.urls.static import static
 from django.contrib import admin
-from rest_framework.authtoken.views import obtain_auth_token
 from rest_framework.routers import DefaultRouter
 from django.urls import include, path
 
 from mysite import settings
+from users.views import ObtainAuthTokenView
 from mysite.settings import DEBUG, MEDIA_URL
 
 urlpatterns = [
-    path('api-token-auth/', obtain_auth_token, name='api_token_auth'),
+    path('api-token-auth/', ObtainAuthTokenView.as_view(), name='api_token_auth'),
     path("orders/", include("orders.urls")),
-    path("admin/", admin.site.urls),
+    # Модуль строкой: URLResolver импортирует его при первом обращении (mysite/admin_urls.py)
+    path("admin/", ("mysite.admin_urls", "admin", admin.site.name)),
     path('accounts/', include("django.contrib.auth.urls")),
     #path('users/', include("users.urls", namespace='users')),
     path('users/', include('users.urls')),
     path('products/', include('products.urls')),
+    path('analytics/', include('analytics.urls')),
+    path('moysklad/', include('moysklad.urls')),
+    path('core/', include('core.urls')),
 ]
 
 if DEBUG:
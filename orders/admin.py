@@ -1,10 +1,16 @@
 from django.contrib import admin, messages
 from django.db import transaction
-from django.db.models import Sum, F
+from django.db.models import Sum
 from django.utils.html import format_html
 
-from .models import Orders, OrderItems, DeliveryAddress
-from products.models import Stock
+from .models import (
+    Orders, OrderItems, DeliveryAddress, IdempotencyKey, OrderTransition, Cart, CartLine,
+    ArchivedOrder, ArchivedOrderItem, ConfirmationTask,
+)
+from .state_machine import transition
+from .confirmation import enqueue
+from . import totals as order_totals
+from products.models import stock_total_subquery
 
 
 # ========================= INLINE: Order Items =========================
@@ -27,6 +33,13 @@ class OrderItemsInline(admin.TabularInline):
         'available_stock_display',
     )
 
+    def get_queryset(self, request):
+        return (
+            super().get_queryset(request)
+            .select_related('product', 'warehouse')
+            .annotate(stock_total=stock_total_subquery('product_id'))
+        )
+
     @admin.display(description='Цена за ед.')
     def price_per_unit_display(self, obj):
         return f"{obj.price_per_unit:.2f} ₽" if obj.price_per_unit else "-"
@@ -37,11 +50,27 @@ class OrderItemsInline(admin.TabularInline):
 
     @admin.display(description='Остаток на складе')
     def available_stock_display(self, obj):
-        if not obj.product:
+        if not obj.product_id:
             return "-"
-        total = obj.product.stocks.aggregate(total=Sum('quantity'))['total'] or 0
+        total = getattr(obj, 'stock_total', None)
+        if total is None:
+            total = obj.product.stocks.aggregate(total=Sum('quantity'))['total'] or 0
         color = "green" if total > 10 else "orange" if total > 0 else "red"
-        return format_html(f'<b style="color:{color};">{total}</b>')
+        return format_html('<b style="color:{};">{}</b>', color, total)
+
+
+class OrderTransitionInline(admin.TabularInline):
+    model = OrderTransition
+    extra = 0
+    can_delete = False
+    fields = ('created_at', 'event', 'from_status', 'to_status', 'user')
+    readonly_fields = fields
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('user')
 
 
 # ========================= ADMIN: Orders =========================
@@ -54,11 +83,13 @@ class OrdersAdmin(admin.ModelAdmin):
     )
     list_filter = ('status', 'payment_method', 'created_at')
     search_fields = ('user__username', 'id')
-    readonly_fields = ('created_at', 'updated_at', 'order_sum_display')
-    inlines = [OrderItemsInline]
+    # Статус меняется только действиями (orders.state_machine), новый заказ создаётся в статусе «Новый»
+    readonly_fields = ('status', 'created_at', 'updated_at', 'order_sum_display')
+    inlines = [OrderItemsInline, OrderTransitionInline]
     ordering = ('-created_at',)
     actions = ['confirm_orders', 'mark_as_shipped', 'mark_as_delivered', 'cancel_orders']
     save_on_top = True
+    list_select_related = ('user', 'address')
 
     # ----------- Display helpers -----------
 
@@ -72,7 +103,7 @@ class OrdersAdmin(admin.ModelAdmin):
             'cancelled': '#e74c3c',   # красный
         }
         color = colors.get(obj.status, 'black')
-        return format_html(f'<b style="color:{color};">{obj.get_status_display()}</b>')
+        return format_html('<b style="color:{};">{}</b>', color, obj.get_status_display())
 
     @admin.display(description='Сумма заказа')
     def order_sum_display(self, obj):
@@ -84,81 +115,29 @@ class OrdersAdmin(admin.ModelAdmin):
 
     # ========================= ACTIONS =========================
 
+    def _run_transition(self, request, queryset, event, success_message):
+        result = transition(queryset, event, user=request.user)
+        for error in result.failed.values():
+            self.message_user(request, error, messages.ERROR)
+        self.message_user(request, success_message.format(len(result.done)), messages.SUCCESS)
+
     @admin.action(description='✅ Подтвердить заказ (списать остатки)')
-    @transaction.atomic
     def confirm_orders(self, request, queryset):
-        confirmed = 0
-        for order in queryset.prefetch_related('items__product', 'items__warehouse'):
-            if order.status != 'new':
-                continue
-            try:
-                # Списание остатков и пересчет stock_cache
-                for item in order.items.select_related('product', 'warehouse'):
-                    product = item.product
-                    stock = item.warehouse.stocks.select_for_update().filter(product=product).first()
-                    if not stock or stock.quantity < item.quantity:
-                        raise ValueError(f"Недостаточно остатков для {product.name}")
-                    stock.quantity = F('quantity') - item.quantity
-                    stock.save(update_fields=['quantity'])
-
-                    # Пересчет stock_cache
-                    total_stock = product.stocks.aggregate(total=Sum('quantity'))['total'] or 0
-                    product.stock_cache = total_stock
-                    product.save(update_fields=['stock_cache'])
-
-                order.status = 'confirmed'
-                order.save(update_fields=['status'])
-                confirmed += 1
-            except Exception as e:
-                self.message_user(
-                    request,
-                    f"Ошибка при подтверждении заказа #{order.id}: {e}",
-                    messages.ERROR
-                )
-        self.message_user(request, f"Подтверждено {confirmed} заказ(ов)", messages.SUCCESS)
+        # Подтверждение идёт в фоне (manage.py confirm_orders_worker), результат — в «Очереди подтверждения»
+        queued = enqueue(queryset.filter(status='new'), user=request.user)
+        self.message_user(request, f"Поставлено в очередь на подтверждение: {queued} заказ(ов)", messages.SUCCESS)
 
     @admin.action(description='📦 Отметить как отправленные')
     def mark_as_shipped(self, request, queryset):
-        updated = queryset.filter(status='confirmed').update(status='shipped')
-        self.message_user(request, f"Отмечено {updated} заказ(ов) как отправленные", messages.SUCCESS)
+        self._run_transition(request, queryset, 'ship', "Отмечено {} заказ(ов) как отправленные")
 
     @admin.action(description='🚚 Отметить как доставленные')
     def mark_as_delivered(self, request, queryset):
-        updated = queryset.filter(status='shipped').update(status='delivered')
-        self.message_user(request, f"Отмечено {updated} заказ(ов) как доставленные", messages.SUCCESS)
+        self._run_transition(request, queryset, 'deliver', "Отмечено {} заказ(ов) как доставленные")
 
     @admin.action(description='❌ Отменить заказы')
-    @transaction.atomic
     def cancel_orders(self, request, queryset):
-        cancelled = 0
-        for order in queryset.prefetch_related('items__product', 'items__warehouse'):
-            if order.status in ['cancelled', 'delivered', 'completed']:
-                continue
-            try:
-                if order.status == 'confirmed':
-                    # Только для подтвержденных заказов возвращаем остатки
-                    for item in order.items.select_related('product', 'warehouse'):
-                        product = item.product
-                        stock = item.warehouse.stocks.select_for_update().filter(product=product).first()
-                        if stock:
-                            stock.quantity = F('quantity') + item.quantity
-                            stock.save(update_fields=['quantity'])
-
-                            # Пересчет stock_cache
-                            total_stock = product.stocks.aggregate(total=Sum('quantity'))['total'] or 0
-                            product.stock_cache = total_stock
-                            product.save(update_fields=['stock_cache'])
-
-                order.status = 'cancelled'
-                order.save(update_fields=['status'])
-                cancelled += 1
-            except Exception as e:
-                self.message_user(
-                    request,
-                    f"Ошибка при отмене заказа #{order.id}: {e}",
-                    messages.ERROR
-                )
-        self.message_user(request, f"Отменено {cancelled} заказ(ов)", messages.SUCCESS)
+        self._run_transition(request, queryset, 'cancel', "Отменено {} заказ(ов)")
 
     # ========================= SAVE LOGIC =========================
 
@@ -166,15 +145,11 @@ class OrdersAdmin(admin.ModelAdmin):
     def save_related(self, request, form, formsets, change):
         """
         После сохранения позиций:
-        - пересчитывает сумму
+        - пересчитывает сумму один раз на весь набор позиций
         - не списывает остатки повторно
         """
-        super().save_related(request, form, formsets, change)
-
-        order = form.instance
-        total_sum = sum(item.total_price for item in order.items.all())
-        order.order_sum = total_sum
-        order.save(update_fields=['order_sum'])
+        with order_totals.batch():
+            super().save_related(request, form, formsets, change)
 
 
 # ========================= ADMIN: OrderItems =========================
@@ -184,6 +159,7 @@ class OrderItemsAdmin(admin.ModelAdmin):
     list_display = ('order', 'product', 'warehouse', 'quantity', 'price_per_unit', 'total_price')
     list_filter = ('warehouse',)
     search_fields = ('product__name', 'order__id')
+    list_select_related = ('order', 'product', 'warehouse')
 
 
 # ========================= ADMIN: DeliveryAddress =========================
@@ -192,3 +168,95 @@ class OrderItemsAdmin(admin.ModelAdmin):
 class DeliveryAddressAdmin(admin.ModelAdmin):
     list_display = ('user', 'city', 'street', 'house', 'apartment', 'created_at')
     search_fields = ('city', 'street', 'house', 'user__username')
+    list_select_related = ('user',)
+
+
+# ========================= ADMIN: IdempotencyKey =========================
+
+@admin.register(IdempotencyKey)
+class IdempotencyKeyAdmin(admin.ModelAdmin):
+    list_display = ('key', 'user', 'status', 'response_status', 'created_at', 'expires_at')
+    list_filter = ('status',)
+    search_fields = ('key', 'user__username')
+    list_select_related = ('user',)
+    readonly_fields = [f.name for f in IdempotencyKey._meta.fields]
+
+
+# ========================= ADMIN: Cart =========================
+
+class CartLineInline(admin.TabularInline):
+    model = CartLine
+    extra = 0
+    fields = ('product', 'warehouse', 'quantity', 'price_per_unit', 'line_total', 'priced_at')
+    readonly_fields = fields
+    can_delete = False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product', 'warehouse')
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Cart)
+class CartAdmin(admin.ModelAdmin):
+    list_display = ('user', 'total', 'updated_at')
+    search_fields = ('user__username',)
+    list_select_related = ('user',)
+    readonly_fields = ('user', 'total', 'updated_at')
+    inlines = [CartLineInline]
+
+
+# ========================= ADMIN: ArchivedOrder =========================
+
+class ArchivedOrderItemInline(admin.TabularInline):
+    model = ArchivedOrderItem
+    extra = 0
+    fields = ('product', 'warehouse', 'quantity', 'price_per_unit', 'total_price')
+    readonly_fields = fields
+    can_delete = False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product', 'warehouse')
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(admin.ModelAdmin):
+    """Архив заказов (orders.archive): только просмотр"""
+    list_display = ('id', 'user', 'status', 'order_sum', 'payment_method', 'created_at', 'archived_at')
+    list_filter = ('status', 'payment_method')
+    search_fields = ('user__username', 'id')
+    date_hierarchy = 'created_at'
+    list_select_related = ('user',)
+    inlines = [ArchivedOrderItemInline]
+    readonly_fields = [f.name for f in ArchivedOrder._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+# ========================= ADMIN: ConfirmationTask =========================
+
+@admin.register(ConfirmationTask)
+class ConfirmationTaskAdmin(admin.ModelAdmin):
+    list_display = ('order', 'status', 'requested_by', 'attempts', 'message', 'created_at', 'finished_at')
+    list_filter = ('status',)
+    search_fields = ('order__id', 'requested_by__username')
+    list_select_related = ('order', 'requested_by')
+    readonly_fields = [f.name for f in ConfirmationTask._meta.fields]
+    actions = ['requeue']
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description='🔁 Поставить в очередь повторно')
+    def requeue(self, request, queryset):
+        order_ids = queryset.exclude(status=ConfirmationTask.STATUS_PENDING).values_list('order_id', flat=True)
+        queued = enqueue(list(order_ids), user=request.user)
+        self.message_user(request, f"Поставлено в очередь повторно: {queued} заказ(ов)", messages.SUCCESS)
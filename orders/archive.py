@@ -0,0 +1,124 @@
+"""
+Перенос завершённых заказов в архив.
+
+Доставленные и отменённые заказы старше settings.ORDER_ARCHIVE_AFTER_DAYS
+переносятся пачками в ArchivedOrder/ArchivedOrderItem с теми же id и
+удаляются из горячих таблиц. История заказов пользователя читает обе
+таблицы (orders_history).
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Orders, OrderItems, OrderTransition, ArchivedOrder, ArchivedOrderItem
+
+FINISHED_STATUSES = ('delivered', 'cancelled')
+
+
+def archive_cutoff(days=None):
+    if days is None:
+        days = settings.ORDER_ARCHIVE_AFTER_DAYS
+    return timezone.now() - timedelta(days=days)
+
+
+@transaction.atomic
+def archive_batch(cutoff, batch_size=None):
+    """
+    Переносит в архив одну пачку заказов, завершённых и не менявшихся до cutoff.
+    Заказы, заблокированные другой транзакцией, пропускаются. Возвращает число перенесённых.
+    """
+    batch_size = batch_size or settings.ORDER_ARCHIVE_BATCH_SIZE
+    orders = list(
+        Orders.objects.select_for_update(skip_locked=True)
+        .filter(status__in=FINISHED_STATUSES, created_at__lt=cutoff, updated_at__lt=cutoff)
+        .order_by('created_at')[:batch_size]
+    )
+    if not orders:
+        return 0
+    order_ids = [order.pk for order in orders]
+
+    history = {}
+    for t in OrderTransition.objects.filter(order_id__in=order_ids).order_by('created_at', 'id'):
+        history.setdefault(t.order_id, []).append({
+            'event': t.event,
+            'from_status': t.from_status,
+            'to_status': t.to_status,
+            'user_id': t.user_id,
+            'created_at': t.created_at,
+        })
+
+    now = timezone.now()
+    ArchivedOrder.objects.bulk_create([
+        ArchivedOrder(
+            id=order.pk,
+            user_id=order.user_id,
+            address_id=order.address_id,
+            payment_method=order.payment_method,
+            status=order.status,
+            order_sum=order.order_sum,
+            created_at=order.created_at,
+            updated_at=order.updated_at,
+            archived_at=now,
+            transitions=history.get(order.pk, []),
+        )
+        for order in orders
+    ])
+    ArchivedOrderItem.objects.bulk_create([
+        ArchivedOrderItem(
+            id=item.pk,
+            order_id=item.order_id,
+            product_id=item.product_id,
+            warehouse_id=item.warehouse_id,
+            category_id=item.category_id,
+            price_per_unit=item.price_per_unit,
+            quantity=item.quantity,
+            total_price=item.total_price,
+        )
+        for item in OrderItems.objects.filter(order_id__in=order_ids)
+    ])
+
+    OrderTransition.objects.filter(order_id__in=order_ids).delete()
+    OrderItems.objects.filter(order_id__in=order_ids).delete()
+    Orders.objects.filter(pk__in=order_ids).delete()
+    return len(order_ids)
+
+
+def archive_orders(days=None, batch_size=None, max_batches=None):
+    """Переносит пачками всё, что старше порога. Каждая пачка — отдельная короткая транзакция."""
+    cutoff = archive_cutoff(days)
+    total = batches = 0
+    while max_batches is None or batches < max_batches:
+        moved = archive_batch(cutoff, batch_size)
+        if not moved:
+            break
+        total += moved
+        batches += 1
+    return total
+
+
+def orders_history(user):
+    """
+    Заказы пользователя из горячей таблицы и архива, от новых к старым.
+    Два запроса на заказы плюс prefetch позиций.
+    """
+    hot = (
+        Orders.objects.filter(user=user)
+        .select_related('address')
+        .prefetch_related('items__product')
+    )
+    archived = (
+        ArchivedOrder.objects.filter(user=user)
+        .select_related('address')
+        .prefetch_related('items__product')
+    )
+    return sorted([*hot, *archived], key=lambda order: (order.created_at, order.pk), reverse=True)
+
+
+def find_order(user, pk):
+    """Заказ пользователя по id: горячая таблица, затем архив. None, если не найден."""
+    return (
+        Orders.objects.filter(user=user, pk=pk).first()
+        or ArchivedOrder.objects.filter(user=user, pk=pk).first()
+    )
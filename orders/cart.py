@@ -0,0 +1,243 @@
+"""
+Серверная корзина.
+
+Сумма строки и сумма корзины поддерживаются инкрементально: добавление,
+изменение и удаление строки сдвигают Cart.total на разницу одним UPDATE с F().
+Строка хранит снапшот цены (price_id, price_per_unit, priced_at). При
+оформлении перечитываются только строки, у товаров которых после priced_at
+менялись цены или остатки; актуальная корзина оформляется вставкой заказа
+и одной пачкой позиций.
+"""
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from products.models import Product, Price, Stock
+from products.availability import load_stocks, pick_stock
+from .models import Cart, CartLine, Orders, OrderItems
+
+
+def get_cart(user, lock=False):
+    """Корзина пользователя (создаётся при первом обращении)"""
+    qs = Cart.objects.select_for_update() if lock else Cart.objects
+    cart, _ = qs.get_or_create(user=user)
+    return cart
+
+
+def _shift_total(cart, delta):
+    """Сдвигает сумму корзины на delta одним UPDATE"""
+    if delta:
+        Cart.objects.filter(pk=cart.pk).update(total=F('total') + delta, updated_at=timezone.now())
+
+
+def _check(product, quantity, price, stocks, warehouse_id=None):
+    """Строка остатка для позиции; ValidationError, если товар нельзя положить в корзину"""
+    if not product.is_active:
+        raise ValidationError(f'Товар "{product.name}" недоступен')
+    if price is None:
+        raise ValidationError(f'У товара "{product.name}" нет цены')
+    stock = pick_stock(stocks, warehouse_id)
+    if not stock or stock.quantity < quantity:
+        raise ValidationError(f"Недостаточно товара '{product.name}' на складе!")
+    return stock
+
+
+# -----------------------------
+# 🔹 Операции со строками
+# -----------------------------
+@transaction.atomic
+def set_line(user, product_id, quantity, warehouse_id=None, add=False):
+    """
+    Кладёт товар в корзину с количеством quantity (add=True — прибавляет к текущему).
+    Цена снимается заново; сумма корзины сдвигается на разницу.
+    """
+    cart = get_cart(user, lock=True)
+    product = Product.objects.filter(pk=product_id).first()
+    if product is None:
+        raise Product.DoesNotExist('Товар не найден')
+
+    line = CartLine.objects.filter(cart=cart, product=product).first()
+    if add and line:
+        quantity += line.quantity
+    if quantity <= 0:
+        raise ValidationError('Количество должно быть больше нуля')
+    if warehouse_id is None and line:
+        warehouse_id = line.warehouse_id
+
+    price = Price.get_current_price(product)
+    stock = _check(product, quantity, price, load_stocks([product.pk]).get(product.pk, []), warehouse_id)
+
+    old_total = line.line_total if line else 0
+    line = line or CartLine(cart=cart, product=product)
+    line.warehouse_id = stock.warehouse_id
+    line.quantity = quantity
+    line.price = price
+    line.price_per_unit = price.value
+    line.line_total = price.value * quantity
+    line.priced_at = timezone.now()
+    line.save()
+
+    _shift_total(cart, line.line_total - old_total)
+    return line
+
+
+@transaction.atomic
+def remove_line(user, product_id):
+    """Убирает товар из корзины; False, если его там не было"""
+    cart = get_cart(user, lock=True)
+    line = CartLine.objects.filter(cart=cart, product_id=product_id).first()
+    if line is None:
+        return False
+    line.delete()
+    _shift_total(cart, -line.line_total)
+    return True
+
+
+@transaction.atomic
+def merge(user, items):
+    """
+    Переносит в корзину пользователя корзину, собранную до входа (она живёт на клиенте):
+    количества одинаковых товаров складываются. Строки, которые положить нельзя,
+    пропускаются — возвращается список [{product_id, error}].
+    """
+    errors = []
+    for item in items:
+        try:
+            with transaction.atomic():
+                set_line(user, item['product_id'], item['quantity'], item.get('warehouse_id'), add=True)
+        except Product.DoesNotExist as e:
+            errors.append({'product_id': item['product_id'], 'error': str(e)})
+        except ValidationError as e:
+            errors.append({'product_id': item['product_id'], 'error': e.messages[0]})
+    return errors
+
+
+@transaction.atomic
+def clear(user):
+    cart = get_cart(user, lock=True)
+    cart.lines.all().delete()
+    Cart.objects.filter(pk=cart.pk).update(total=0, updated_at=timezone.now())
+
+
+# -----------------------------
+# 🔹 Оформление
+# -----------------------------
+def stale_lines(lines):
+    """
+    Строки, у товаров которых после снапшота менялись цены или остатки.
+    Два запроса на любую корзину; строки с неизменными ценами и остатками не перечитываются.
+    """
+    if not lines:
+        return []
+    since = min(line.priced_at for line in lines)
+    now = timezone.now()
+    product_ids = {line.product_id for line in lines}
+
+    # Цена «меняется» и без записи: когда наступает start_date или проходит end_date
+    changed = {}
+    prices = Price.objects.filter(product_id__in=product_ids).filter(
+        Q(updated_at__gt=since)
+        | Q(start_date__gt=since, start_date__lte=now)
+        | Q(end_date__gte=since, end_date__lt=now)
+    ).values_list('product_id', 'updated_at', 'start_date', 'end_date')
+    for product_id, *moments in prices:
+        latest = max(m for m in moments if m is not None and m <= now)
+        changed[product_id] = max(changed.get(product_id, latest), latest)
+
+    stocks = Stock.objects.filter(
+        product_id__in=product_ids, updated_at__gt=since
+    ).values_list('product_id', 'updated_at')
+    for product_id, updated_at in stocks:
+        changed[product_id] = max(changed.get(product_id, updated_at), updated_at)
+
+    return [
+        line for line in lines
+        if not line.product.is_active
+        or (line.product_id in changed and changed[line.product_id] > line.priced_at)
+    ]
+
+
+def reprice(cart, lines):
+    """
+    Перечитывает цены и остатки строк (два запроса) и обновляет снапшоты.
+    Возвращает список проблем: изменившиеся цены и нехватку остатков.
+    """
+    if not lines:
+        return []
+    product_ids = [line.product_id for line in lines]
+    prices = Price.get_current_prices(product_ids)
+    stocks = load_stocks(product_ids)
+
+    now = timezone.now()
+    changes = []
+    delta = 0
+    for line in lines:
+        price = prices.get(line.product_id)
+        try:
+            stock = _check(line.product, line.quantity, price, stocks.get(line.product_id, []), line.warehouse_id)
+        except ValidationError as e:
+            changes.append({'product_id': line.product_id, 'error': e.messages[0]})
+            continue
+
+        if price.value != line.price_per_unit:
+            changes.append({
+                'product_id': line.product_id,
+                'old_price': str(line.price_per_unit),
+                'new_price': str(price.value),
+            })
+        new_total = price.value * line.quantity
+        delta += new_total - line.line_total
+        line.warehouse_id = stock.warehouse_id
+        line.price = price
+        line.price_per_unit = price.value
+        line.line_total = new_total
+        line.priced_at = now
+
+    CartLine.objects.bulk_update(lines, ['warehouse', 'price', 'price_per_unit', 'line_total', 'priced_at'])
+    _shift_total(cart, delta)
+    return changes
+
+
+@transaction.atomic
+def checkout(user, payment_method, address=None, address_data=None):
+    """
+    Оформляет корзину в заказ. Возвращает (order, changes).
+    Если цены или остатки изменились, заказ не создаётся (order=None),
+    корзина пересчитывается, а changes описывает изменения.
+    """
+    cart = get_cart(user, lock=True)
+    lines = list(cart.lines.select_related('product'))
+    if not lines:
+        raise ValidationError('Корзина пуста')
+
+    changes = reprice(cart, stale_lines(lines))
+    if changes:
+        return None, changes
+
+    if address is None:
+        address = user.addresses.create(**address_data)
+
+    order = Orders.objects.create(
+        user=user,
+        address=address,
+        payment_method=payment_method,
+        status='new',   # товар НЕ списан
+        order_sum=sum(line.line_total for line in lines),
+    )
+    OrderItems.objects.bulk_create([
+        OrderItems(
+            order=order,
+            product_id=line.product_id,
+            warehouse_id=line.warehouse_id,
+            category_id=line.product.category_id,
+            price_per_unit=line.price_per_unit,
+            quantity=line.quantity,
+            total_price=line.line_total,
+        )
+        for line in lines
+    ])
+
+    cart.lines.all().delete()
+    Cart.objects.filter(pk=cart.pk).update(total=0, updated_at=timezone.now())
+    return order, []
@@ -0,0 +1,130 @@
+"""
+Очередь подтверждения заказов без внешнего брокера.
+
+Админка ставит заказы в очередь (enqueue), воркеры (manage.py confirm_orders_worker)
+разбирают её пачками:
+
+    BEGIN
+    SELECT ... FROM orders_confirmationtask WHERE status = 'pending'
+        ORDER BY id LIMIT n FOR UPDATE SKIP LOCKED
+    transition(<заказы пачки>, 'confirm')  -- списание остатков сгруппировано на пачку
+    UPDATE orders_confirmationtask ...      -- результат по каждому заказу
+    COMMIT
+
+Параллельные воркеры берут разные пачки. Если воркер упал посреди пачки,
+транзакция откатывается, и задачи снова доступны — очередь переживает рестарты.
+"""
+import logging
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, QuerySet
+from django.utils import timezone
+
+from .models import ConfirmationTask
+from .state_machine import transition
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(orders, user=None):
+    """Ставит заказы в очередь; уже стоящие в очереди пропускаются. Возвращает число поставленных."""
+    if isinstance(orders, QuerySet):
+        order_ids = list(orders.values_list('pk', flat=True))
+    else:
+        order_ids = [getattr(order, 'pk', order) for order in orders]
+    if user is not None and not user.is_authenticated:
+        user = None
+
+    pending = set(
+        ConfirmationTask.objects.filter(order_id__in=order_ids, status=ConfirmationTask.STATUS_PENDING)
+        .values_list('order_id', flat=True)
+    )
+    new_ids = [order_id for order_id in dict.fromkeys(order_ids) if order_id not in pending]
+    # ignore_conflicts — на случай параллельного enqueue тех же заказов между чтением и вставкой
+    ConfirmationTask.objects.bulk_create(
+        [ConfirmationTask(order_id=order_id, requested_by=user) for order_id in new_ids],
+        ignore_conflicts=True,
+    )
+    return len(new_ids)
+
+
+def _claim(batch_size):
+    return list(
+        ConfirmationTask.objects.select_for_update(skip_locked=True, of=('self',))
+        .filter(status=ConfirmationTask.STATUS_PENDING)
+        .select_related('requested_by')
+        .order_by('id')[:batch_size]
+    )
+
+
+@transaction.atomic
+def process_batch(batch_size=None):
+    """Обрабатывает одну пачку задач. Возвращает число обработанных задач (0 — очередь пуста)."""
+    tasks = _claim(batch_size or settings.CONFIRMATION_BATCH_SIZE)
+    if not tasks:
+        return 0
+
+    # Переход пишет автора в OrderTransition — группируем по тому, кто поставил задачу
+    by_user = defaultdict(list)
+    for task in tasks:
+        by_user[task.requested_by_id].append(task)
+
+    now = timezone.now()
+    for user_tasks in by_user.values():
+        result = transition([task.order_id for task in user_tasks], 'confirm', user=user_tasks[0].requested_by)
+        done = set(result.done)
+        for task in user_tasks:
+            task.attempts += 1
+            task.finished_at = now
+            if task.order_id in done:
+                task.status, task.message = ConfirmationTask.STATUS_DONE, ''
+            elif task.order_id in result.failed:
+                task.status, task.message = ConfirmationTask.STATUS_FAILED, result.failed[task.order_id]
+            else:
+                # Заказ уже не «новый» или исчез (архив)
+                task.status = ConfirmationTask.STATUS_SKIPPED
+                task.message = result.skipped.get(task.order_id, 'Заказ не найден')
+
+    ConfirmationTask.objects.bulk_update(tasks, ['status', 'message', 'attempts', 'finished_at'])
+    return len(tasks)
+
+
+def _give_up_or_retry(batch_size, error):
+    """
+    Пачка упала целиком (ошибка БД и т.п.): считаем попытку первым задачам очереди;
+    исчерпавшие CONFIRMATION_MAX_ATTEMPTS помечаются ошибкой, чтобы не блокировать очередь.
+    """
+    with transaction.atomic():
+        ids = [task.pk for task in _claim(batch_size)]
+        ConfirmationTask.objects.filter(pk__in=ids).update(attempts=F('attempts') + 1, message=str(error)[:1000])
+        ConfirmationTask.objects.filter(
+            pk__in=ids, attempts__gte=settings.CONFIRMATION_MAX_ATTEMPTS
+        ).update(status=ConfirmationTask.STATUS_FAILED, finished_at=timezone.now())
+
+
+def run_worker(batch_size=None, idle_sleep=None, stop_when_empty=False, should_stop=lambda: False):
+    """Цикл воркера: пачка за пачкой, при пустой очереди — пауза idle_sleep. Возвращает число задач."""
+    batch_size = batch_size or settings.CONFIRMATION_BATCH_SIZE
+    idle_sleep = settings.CONFIRMATION_IDLE_SLEEP if idle_sleep is None else idle_sleep
+    processed = 0
+    while not should_stop():
+        try:
+            count = process_batch(batch_size)
+        except Exception as e:
+            logger.exception('Сбой пачки подтверждения')
+            try:
+                _give_up_or_retry(batch_size, e)
+            except Exception:
+                # БД недоступна или занята — задачи остались pending, повторим после паузы
+                logger.exception('Не удалось записать сбой пачки')
+            count = -1
+        if count > 0:
+            processed += count
+            continue
+        if count == 0 and stop_when_empty:
+            break
+        time.sleep(idle_sleep)
+    return processed
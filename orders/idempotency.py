@@ -0,0 +1,165 @@
+"""
+Поддержка заголовка Idempotency-Key для POST-эндпоинтов заказов.
+
+Первый запрос с ключом выполняется и сохраняет ответ; повтор с тем же ключом
+получает сохранённый ответ за один индексный запрос. Параллельный дубль ждёт
+завершения первого запроса и получает его ответ.
+
+Ответ записывается в той же транзакции, что и изменения view: заказ без
+сохранённого ответа (или ответ без заказа) не закоммитится. Ключ «в работе»
+арендован на IDEMPOTENCY_LEASE секунд; если воркер упал, повтор после аренды
+перехватывает ключ и выполняет запрос заново. Запрос, у которого аренду
+перехватили, откатывает свои изменения.
+
+Декоратор должен стоять снаружи @transaction.atomic, чтобы запись
+о начале обработки была видна параллельным запросам.
+"""
+import functools
+import hashlib
+import json
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+POLL_INTERVAL = 0.1
+
+
+def request_hash(request):
+    """Хэш метода, пути и тела: один ключ нельзя переиспользовать для другого запроса"""
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    raw = f"{request.method}:{request.path}:{body}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class LeaseLost(Exception):
+    """Аренду ключа перехватил повтор — изменения этого запроса откатываются"""
+
+
+def _lease():
+    return timezone.now() + timedelta(seconds=settings.IDEMPOTENCY_LEASE)
+
+
+def _take_over(record, hash_):
+    """Перехват ключа, чья аренда истекла (обработавший его воркер упал)"""
+    if record.status != IdempotencyKey.STATUS_IN_PROGRESS or record.request_hash != hash_:
+        return False
+    if record.locked_until and record.locked_until > timezone.now():
+        return False
+    locked_until = _lease()
+    taken = IdempotencyKey.objects.filter(
+        pk=record.pk, status=IdempotencyKey.STATUS_IN_PROGRESS, locked_until=record.locked_until,
+    ).update(locked_until=locked_until)
+    record.locked_until = locked_until
+    return bool(taken)
+
+
+def _claim(user, key, hash_):
+    """Возвращает (запись, захвачена_ли_сейчас)"""
+    record = IdempotencyKey.objects.filter(user=user, key=key).first()
+    if record and record.is_expired():
+        record.delete()
+        record = None
+    if record:
+        return record, _take_over(record, hash_)
+
+    try:
+        with transaction.atomic():
+            record = IdempotencyKey.objects.create(
+                user=user,
+                key=key,
+                request_hash=hash_,
+                locked_until=_lease(),
+                expires_at=timezone.now() + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL),
+            )
+        return record, True
+    except IntegrityError:
+        # Параллельный запрос успел занять ключ
+        return IdempotencyKey.objects.filter(user=user, key=key).first(), False
+
+
+def _held(record):
+    """Ключ, всё ещё арендованный этим запросом"""
+    return IdempotencyKey.objects.filter(
+        pk=record.pk, status=IdempotencyKey.STATUS_IN_PROGRESS, locked_until=record.locked_until,
+    )
+
+
+def _finish(record, response):
+    """Сохраняет ответ в транзакции view; LeaseLost, если ключ уже перехвачен"""
+    if not _held(record).update(
+        status=IdempotencyKey.STATUS_DONE,
+        response_status=response.status_code,
+        response_body=response.data,
+    ):
+        raise LeaseLost
+
+
+def _wait(record):
+    """Ждёт, пока параллельный запрос с тем же ключом завершится"""
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_TIMEOUT
+    while record and record.status == IdempotencyKey.STATUS_IN_PROGRESS and time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        record = IdempotencyKey.objects.filter(pk=record.pk).first()
+    return record
+
+
+def _replay(record, hash_):
+    if record.request_hash != hash_:
+        return Response(
+            {'error': f'{HEADER} уже использован для другого запроса'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+
+    record = _wait(record)
+    if record is None or record.status == IdempotencyKey.STATUS_IN_PROGRESS:
+        # Первый запрос упал или ещё выполняется — клиенту стоит повторить позже
+        return Response(
+            {'error': 'Запрос с этим ключом ещё обрабатывается'},
+            status=status.HTTP_409_CONFLICT,
+            headers={'Retry-After': '1'},
+        )
+
+    return Response(record.response_body, status=record.response_status, headers={'Idempotent-Replayed': 'true'})
+
+
+def idempotent(view_method):
+    """Декоратор метода post() у APIView"""
+
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return view_method(self, request, *args, **kwargs)
+        if len(key) > 255:
+            return Response({'error': f'{HEADER} длиннее 255 символов'}, status=status.HTTP_400_BAD_REQUEST)
+
+        hash_ = request_hash(request)
+        record, created = _claim(request.user, key, hash_)
+        if not created:
+            return _replay(record, hash_)
+
+        try:
+            with transaction.atomic():
+                response = view_method(self, request, *args, **kwargs)
+                if response.status_code < 500:
+                    _finish(record, response)
+        except LeaseLost:
+            return _replay(IdempotencyKey.objects.filter(pk=record.pk).first() or record, hash_)
+        except Exception:
+            _held(record).delete()
+            raise
+
+        if response.status_code >= 500:
+            # Ошибку сервера не запоминаем — повтор должен выполниться заново
+            _held(record).delete()
+        return response
+
+    return wrapper
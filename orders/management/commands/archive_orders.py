@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from orders.archive import archive_orders
+
+
+class Command(BaseCommand):
+    help = 'Переносит доставленные и отменённые заказы в архив (запускать по расписанию, например раз в сутки)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=settings.ORDER_ARCHIVE_AFTER_DAYS,
+            help='Возраст заказа в днях (по умолчанию ORDER_ARCHIVE_AFTER_DAYS)',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.ORDER_ARCHIVE_BATCH_SIZE,
+            help='Заказов в одной транзакции',
+        )
+        parser.add_argument('--max-batches', type=int, default=None, help='Ограничить число пачек за запуск')
+
+    def handle(self, *args, **options):
+        moved = archive_orders(options['days'], options['batch_size'], options['max_batches'])
+        self.stdout.write(self.style.SUCCESS(f'Перенесено в архив заказов: {moved}'))
@@ -0,0 +1,65 @@
+import multiprocessing
+import signal
+
+from django.core.management.base import BaseCommand
+
+
+def _process_main(batch_size, idle_sleep, stop_when_empty, stop_event):
+    """Точка входа процесса-воркера (совместима и с fork, и со spawn)"""
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+    from django.db import connections
+    from orders.confirmation import run_worker
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # останавливает родитель через stop_event
+    try:
+        return run_worker(batch_size, idle_sleep, stop_when_empty, should_stop=stop_event.is_set)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = (
+        'Пул процессов, разбирающих очередь подтверждения заказов (orders.confirmation). '
+        'Можно запускать на нескольких машинах: задачи делятся через FOR UPDATE SKIP LOCKED.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=2, help='Число процессов-воркеров')
+        parser.add_argument('--batch-size', type=int, default=None, help='Заказов в одной транзакции')
+        parser.add_argument('--idle-sleep', type=float, default=None, help='Пауза при пустой очереди, сек')
+        parser.add_argument('--once', action='store_true', help='Разобрать очередь и выйти')
+
+    def handle(self, *args, **options):
+        from django.db import connections
+
+        # Соединения родителя не должны достаться дочерним процессам
+        connections.close_all()
+        stop_event = multiprocessing.Event()
+        workers = [
+            multiprocessing.Process(
+                target=_process_main,
+                args=(options['batch_size'], options['idle_sleep'], options['once'], stop_event),
+                name=f'confirm-worker-{i}',
+            )
+            for i in range(max(options['processes'], 1))
+        ]
+        for worker in workers:
+            worker.start()
+        self.stdout.write(f'Запущено воркеров: {len(workers)}')
+
+        def stop(signum, frame):
+            stop_event.set()
+
+        signal.signal(signal.SIGTERM, stop)
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            stop_event.set()
+            for worker in workers:
+                worker.join()
+
+        self.stdout.write(self.style.SUCCESS('Воркеры остановлены'))
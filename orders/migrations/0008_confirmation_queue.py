@@ -0,0 +1,40 @@
+# Generated by Django 5.0.3 on 2026-10-19 00:01
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0007_order_archive'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConfirmationTask',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('done', 'Подтверждён'), ('skipped', 'Пропущен'), ('failed', 'Ошибка')], default='pending', max_length=10, verbose_name='Статус')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Попыток')),
+                ('message', models.TextField(blank=True, verbose_name='Результат')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Поставлена')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Обработана')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='confirmation_tasks', to='orders.orders', verbose_name='Заказ')),
+                ('requested_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Кто поставил')),
+            ],
+            options={
+                'verbose_name': 'Задача подтверждения',
+                'verbose_name_plural': 'Очередь подтверждения',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['status', 'id'], name='orders_conf_status_48adcc_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='confirmationtask',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'pending')), fields=('order',), name='orders_confirmationtask_pending_uniq'),
+        ),
+    ]
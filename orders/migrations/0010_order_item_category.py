@@ -0,0 +1,37 @@
+# Generated by Django 5.0.3 on 2026-10-19 01:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def current_categories(apps, schema_editor):
+    """Существующим позициям — текущая категория товара (роллапы были собраны по ней же)"""
+    Product = apps.get_model('products', 'Product')
+    for name in ('OrderItems', 'ArchivedOrderItem'):
+        apps.get_model('orders', name).objects.filter(category__isnull=True).update(
+            category_id=models.Subquery(
+                Product.objects.filter(pk=models.OuterRef('product_id')).values('category_id')[:1]
+            )
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0009_idempotency_lease'),
+        ('products', '0012_reference_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedorderitem',
+            name='category',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='products.category', verbose_name='Категория'),
+        ),
+        migrations.AddField(
+            model_name='orderitems',
+            name='category',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='products.category', verbose_name='Категория'),
+        ),
+        migrations.RunPython(current_categories, migrations.RunPython.noop),
+    ]
@@ -1,11 +1,13 @@
 from decimal import Decimal
-from django.db import models, transaction
+from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
 from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db.models import Sum
+from django.db.models.functions import Coalesce
 
-from products.models import Product, Warehouse, Stock, Price
+from products.models import Product, Category, Warehouse, Price
 
 
 class DeliveryAddress(models.Model):
@@ -63,6 +65,10 @@ class Orders(models.Model):
         verbose_name = 'Заказ'
         verbose_name_plural = 'Заказы'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+            models.Index(fields=['user', 'created_at']),
+        ]
 
     def __str__(self):
         return f"Заказ #{self.id or '—'} ({self.get_status_display()})"
@@ -74,77 +80,32 @@ class Orders(models.Model):
         self.save(update_fields=['order_sum'])
         return total
 
-    @transaction.atomic
-    def confirm(self):
-        """Подтверждение заказа — списание остатков"""
-        if self.status != 'new':
-            raise ValidationError("Только новый заказ можно подтвердить.")
-
-        for item in self.items.select_related('product'):
-            product = item.product
-            qty = item.quantity
-
-            # Проверяем наличие на складе
-            stock = Stock.objects.filter(product=product).first()
-            if not stock or stock.quantity < qty:
-                raise ValidationError(f"Недостаточно товара '{product.name}' на складе!")
-
-            # Списываем остаток
-            stock.quantity -= qty
-            stock.save()
-
-            # Обновляем кэш
-            product.stock_cache = product.stocks.aggregate(total=Sum('quantity'))['total'] or 0
-            product.save(update_fields=['stock_cache'])
-
-        self.status = 'confirmed'
-        self.save(update_fields=['status'])
-
-    @transaction.atomic
-    def cancel(self):
-        """Отмена заказа — возврат остатков"""
-        if self.status not in ['new', 'confirmed']:
-            raise ValidationError("Можно отменить только новый или подтверждённый заказ.")
-
-        for item in self.items.select_related('product'):
-            product = item.product
-            qty = item.quantity
-
-            stock = Stock.objects.filter(product=product).first()
-            if stock:
-                stock.quantity += qty
-                stock.save()
-
-            # Обновляем кэш
-            product.stock_cache = product.stocks.aggregate(total=Sum('quantity'))['total'] or 0
-            product.save(update_fields=['stock_cache'])
-
-        self.status = 'cancelled'
-        self.save(update_fields=['status'])
-
-    @transaction.atomic
-    def update_stock_on_confirm(self):
-        """
-        Списывает товары со склада при подтверждении заказа.
-        Использует блокировку строк, чтобы избежать гонок.
-        """
-        for item in self.items.select_related('product').select_for_update():
-            product = item.product
-            quantity = item.quantity
-
-            # Получаем основной склад, например первый
-            stock = Stock.objects.filter(product=product).select_for_update().first()
-            if not stock or stock.quantity < quantity:
-                raise ValueError(f"Недостаточно товара '{product.name}' на складе")
-
-            # Списываем со склада
-            stock.quantity -= quantity
-            stock.save(update_fields=['quantity'])
-
-            # Обновляем кэш остатка в продукте
-            total = product.stocks.aggregate(total=Sum('quantity'))['total'] or 0
-            product.stock_cache = total
-            product.save(update_fields=['stock_cache'])
+    @classmethod
+    def recalc_totals(cls, order_ids):
+        """Пересчитать суммы набора заказов одним UPDATE"""
+        totals = (
+            OrderItems.objects.filter(order_id=models.OuterRef('pk'))
+            .values('order_id')
+            .annotate(total=Sum('total_price'))
+            .values('total')
+        )
+        return cls.objects.filter(pk__in=order_ids).update(
+            order_sum=Coalesce(models.Subquery(totals), Decimal('0.00'), output_field=cls._meta.get_field('order_sum'))
+        )
+
+    def confirm(self, user=None):
+        """Подтверждение заказа — списание остатков (см. orders.state_machine)"""
+        self._transition('confirm', user)
+
+    def cancel(self, user=None):
+        """Отмена заказа — возврат остатков, если заказ был подтверждён"""
+        self._transition('cancel', user)
+
+    def _transition(self, event, user=None):
+        from .state_machine import TRANSITIONS, transition
+
+        transition([self.pk], event, user=user).raise_for(self.pk)
+        self.status = TRANSITIONS[event].target
 
 
 class OrderItems(models.Model):
@@ -152,6 +113,12 @@ class OrderItems(models.Model):
     order = models.ForeignKey('Orders', on_delete=models.CASCADE, related_name='items', verbose_name='Заказ')
     product = models.ForeignKey(Product, on_delete=models.PROTECT, related_name='order_items', verbose_name='Товар')
     warehouse = models.ForeignKey(Warehouse, on_delete=models.SET_NULL, null=True, blank=True, verbose_name='Склад')
+    # Категория товара на момент заказа: по ней ключуются роллапы продаж (analytics.rollups),
+    # смена категории товара не переносит уже учтённые продажи
+    category = models.ForeignKey(
+        Category, on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='+',
+        verbose_name='Категория',
+    )
     price_per_unit = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='Цена за единицу', editable=False)
     quantity = models.PositiveIntegerField(default=1, verbose_name='Количество')
     total_price = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name='Сумма позиции', editable=False)
@@ -196,7 +163,6 @@ class OrderItems(models.Model):
     # -----------------------------
     # 🔹 Сохранение
     # -----------------------------
-    @transaction.atomic
     def save(self, *args, **kwargs):
         # 1️⃣ Устанавливаем цену, если не задана
         if not self.price_per_unit:
@@ -205,16 +171,204 @@ class OrderItems(models.Model):
         # 2️⃣ Пересчитываем сумму позиции
         self.total_price = (self.price_per_unit or 0) * self.quantity
 
-        # 3️⃣ Сохраняем саму позицию
+        if self.category_id is None and self.product_id:
+            self.category_id = self.product.category_id
+
+        # 3️⃣ Сохраняем саму позицию.
+        # Сумму заказа пересчитывает сигнал update_order_total — один раз на заказ (orders.totals)
         super().save(*args, **kwargs)
 
-        # 4️⃣ Пересчитываем общую сумму заказа
-        if self.order_id:
-            total = self.order.items.aggregate(total=Sum('total_price'))['total'] or 0
-            self.order.order_sum = total
-            self.order.save(update_fields=['order_sum'])
 
-        # 5️⃣ Обновляем кеш остатка (чтобы в админке показывало верно)
-        total_stock = self.product.stocks.aggregate(total=Sum('quantity'))['total'] or 0
-        self.product.stock_cache = total_stock
-        self.product.save(update_fields=['stock_cache'])
+class ArchivedOrder(models.Model):
+    """
+    Архив завершённых заказов (доставленных и отменённых), см. orders.archive.
+    id совпадает с id исходного заказа, поэтому ссылки на заказ остаются валидными.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_orders', verbose_name='Пользователь')
+    address = models.ForeignKey(
+        DeliveryAddress, on_delete=models.SET_NULL, null=True, blank=True, verbose_name='Адрес доставки'
+    )
+    payment_method = models.CharField(max_length=20, choices=Orders.PAYMENT_CHOICES, verbose_name='Метод оплаты')
+    status = models.CharField(max_length=20, choices=Orders.STATUS_CHOICES, verbose_name='Статус')
+    order_sum = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name='Сумма заказа')
+    created_at = models.DateTimeField(verbose_name='Создан')
+    updated_at = models.DateTimeField(verbose_name='Обновлён')
+    archived_at = models.DateTimeField(default=timezone.now, verbose_name='В архиве с')
+    transitions = models.JSONField(default=list, blank=True, encoder=DjangoJSONEncoder, verbose_name='История статусов')
+
+    class Meta:
+        verbose_name = 'Архивный заказ'
+        verbose_name_plural = 'Архив заказов'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"Заказ #{self.id} ({self.get_status_display()}, архив)"
+
+
+class ArchivedOrderItem(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    order = models.ForeignKey('ArchivedOrder', on_delete=models.CASCADE, related_name='items', verbose_name='Заказ')
+    product = models.ForeignKey(Product, on_delete=models.PROTECT, related_name='+', verbose_name='Товар')
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.SET_NULL, null=True, blank=True, verbose_name='Склад')
+    category = models.ForeignKey(
+        Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', verbose_name='Категория',
+    )
+    price_per_unit = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='Цена за единицу')
+    quantity = models.PositiveIntegerField(default=1, verbose_name='Количество')
+    total_price = models.DecimalField(max_digits=12, decimal_places=2, verbose_name='Сумма позиции')
+
+    class Meta:
+        verbose_name = 'Позиция архивного заказа'
+        verbose_name_plural = 'Позиции архивных заказов'
+
+    def __str__(self):
+        return f"{self.product_id} × {self.quantity}"
+
+
+class Cart(models.Model):
+    """Корзина пользователя на сервере; сумма поддерживается инкрементально (orders.cart)"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='cart', verbose_name='Пользователь')
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name='Сумма')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Обновлена')
+
+    class Meta:
+        verbose_name = 'Корзина'
+        verbose_name_plural = 'Корзины'
+
+    def __str__(self):
+        return f"Корзина {self.user_id}: {self.total} ₽"
+
+
+class CartLine(models.Model):
+    """
+    Строка корзины со снапшотом цены.
+    price_id + priced_at — версия цены: при оформлении перечитываются
+    только строки, чьи цены или остатки менялись после priced_at.
+    """
+    cart = models.ForeignKey('Cart', on_delete=models.CASCADE, related_name='lines', verbose_name='Корзина')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+', verbose_name='Товар')
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.SET_NULL, null=True, blank=True, verbose_name='Склад')
+    quantity = models.PositiveIntegerField(default=1, verbose_name='Количество')
+    price = models.ForeignKey(Price, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    price_per_unit = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='Цена за единицу')
+    line_total = models.DecimalField(max_digits=12, decimal_places=2, verbose_name='Сумма строки')
+    priced_at = models.DateTimeField(default=timezone.now, verbose_name='Цена снята')
+
+    class Meta:
+        verbose_name = 'Строка корзины'
+        verbose_name_plural = 'Строки корзины'
+        ordering = ['id']
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'product'], name='orders_cartline_cart_product_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} × {self.quantity}"
+
+
+class OrderTransition(models.Model):
+    """Запись о смене статуса заказа (пишется orders.state_machine)"""
+    order = models.ForeignKey('Orders', on_delete=models.CASCADE, related_name='transitions', verbose_name='Заказ')
+    event = models.CharField(max_length=20, verbose_name='Событие')
+    from_status = models.CharField(max_length=20, choices=Orders.STATUS_CHOICES, verbose_name='Из статуса')
+    to_status = models.CharField(max_length=20, choices=Orders.STATUS_CHOICES, verbose_name='В статус')
+    user = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', verbose_name='Кто'
+    )
+    created_at = models.DateTimeField(default=timezone.now, verbose_name='Когда')
+
+    class Meta:
+        verbose_name = 'Смена статуса'
+        verbose_name_plural = 'Смены статусов'
+        ordering = ['id']
+
+    def __str__(self):
+        return f"#{self.order_id}: {self.from_status} → {self.to_status}"
+
+
+class ConfirmationTask(models.Model):
+    """
+    Очередь подтверждения заказов в БД (orders.confirmation).
+    Воркеры забирают задачи через SELECT ... FOR UPDATE SKIP LOCKED;
+    задача остаётся pending, пока транзакция пачки не закоммитится.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_DONE = 'done'
+    STATUS_SKIPPED = 'skipped'
+    STATUS_FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'В очереди'),
+        (STATUS_DONE, 'Подтверждён'),
+        (STATUS_SKIPPED, 'Пропущен'),
+        (STATUS_FAILED, 'Ошибка'),
+    ]
+
+    order = models.ForeignKey('Orders', on_delete=models.CASCADE, related_name='confirmation_tasks', verbose_name='Заказ')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING, verbose_name='Статус')
+    requested_by = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', verbose_name='Кто поставил'
+    )
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name='Попыток')
+    message = models.TextField(blank=True, verbose_name='Результат')
+    created_at = models.DateTimeField(default=timezone.now, verbose_name='Поставлена')
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name='Обработана')
+
+    class Meta:
+        verbose_name = 'Задача подтверждения'
+        verbose_name_plural = 'Очередь подтверждения'
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'id']),
+        ]
+        constraints = [
+            # Один заказ не стоит в очереди дважды
+            models.UniqueConstraint(
+                fields=['order'],
+                condition=models.Q(status='pending'),
+                name='orders_confirmationtask_pending_uniq',
+            ),
+        ]
+
+    def __str__(self):
+        return f"#{self.order_id}: {self.get_status_display()}"
+
+
+class IdempotencyKey(models.Model):
+    """Ключ идемпотентности (заголовок Idempotency-Key) и сохранённый ответ для повтора"""
+
+    STATUS_IN_PROGRESS = 'in_progress'
+    STATUS_DONE = 'done'
+
+    STATUS_CHOICES = [
+        (STATUS_IN_PROGRESS, 'Выполняется'),
+        (STATUS_DONE, 'Выполнен'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+', verbose_name='Пользователь')
+    key = models.CharField(max_length=255, verbose_name='Ключ')
+    request_hash = models.CharField(max_length=64, verbose_name='Хэш запроса')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_IN_PROGRESS)
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    # Аренда ключа обрабатывающим запросом: по истечении ключ «в работе» можно перехватить
+    locked_until = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        verbose_name = 'Ключ идемпотентности'
+        verbose_name_plural = 'Ключи идемпотентности'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='orders_idempotency_user_key_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.key} ({self.get_status_display()})"
+
+    def is_expired(self):
+        return self.expires_at <= timezone.now()
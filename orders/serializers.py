@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
-from .models import Orders, OrderItems, DeliveryAddress
+from .models import Orders, OrderItems, DeliveryAddress, Cart, CartLine, ArchivedOrder, ArchivedOrderItem
+from . import totals as order_totals
 from products.models import Product
 
 
@@ -36,7 +37,8 @@ class OrdersSerializer(serializers.ModelSerializer):
             'id', 'user', 'address', 'status', 'order_sum', 'payment_method',
             'created_at', 'updated_at', 'items'
         ]
-        read_only_fields = ['order_sum', 'created_at', 'updated_at']
+        # Статус меняется только через orders.state_machine.transition()
+        read_only_fields = ['status', 'order_sum', 'created_at', 'updated_at']
 
     def create(self, validated_data):
         items_data = validated_data.pop('items', [])
@@ -73,32 +75,86 @@ class OrdersSerializer(serializers.ModelSerializer):
 
     def update(self, instance, validated_data):
         nested_data = validated_data.pop('items', None)
-        instance.status = validated_data.get('status', instance.status)
         instance.save()
 
         if nested_data:
             existing_item_ids = []
-            total_sum = 0
-
-            for nested_item in nested_data:
-                nested_id = nested_item.get('id')
-                total_sum += float(nested_item['total_price'])
-
-                if nested_id:
-                    try:
-                        nested_instance = instance.items.get(id=nested_id)
-                        for attr, value in nested_item.items():
-                            setattr(nested_instance, attr, value)
-                        nested_instance.save()
-                        existing_item_ids.append(nested_id)
-                    except OrderItems.DoesNotExist:
-                        raise ValidationError(f"Элемент с ID {nested_id} не найден.")
-                else:
-                    new_item = OrderItems.objects.create(order=instance, **nested_item)
-                    existing_item_ids.append(new_item.id)
-
-            instance.items.exclude(id__in=existing_item_ids).delete()
-            instance.order_sum = total_sum
-            instance.save()
+
+            # Сумма заказа пересчитывается один раз на выходе из batch()
+            with order_totals.batch():
+                for nested_item in nested_data:
+                    nested_id = nested_item.get('id')
+
+                    if nested_id:
+                        try:
+                            nested_instance = instance.items.get(id=nested_id)
+                            for attr, value in nested_item.items():
+                                setattr(nested_instance, attr, value)
+                            nested_instance.save()
+                            existing_item_ids.append(nested_id)
+                        except OrderItems.DoesNotExist:
+                            raise ValidationError(f"Элемент с ID {nested_id} не найден.")
+                    else:
+                        new_item = OrderItems.objects.create(order=instance, **nested_item)
+                        existing_item_ids.append(new_item.id)
+
+                instance.items.exclude(id__in=existing_item_ids).delete()
+
+            instance.refresh_from_db(fields=['order_sum'])
 
         return instance
+
+
+class ArchivedOrderItemSerializer(serializers.ModelSerializer):
+    product_name = serializers.CharField(source='product.name', read_only=True)
+
+    class Meta:
+        model = ArchivedOrderItem
+        fields = ['id', 'product', 'product_name', 'price_per_unit', 'quantity', 'total_price']
+
+
+class ArchivedOrderSerializer(serializers.ModelSerializer):
+    """Архивный заказ в том же виде, что и OrdersSerializer (только чтение)"""
+    items = ArchivedOrderItemSerializer(many=True, read_only=True)
+    address = DeliveryAddressSerializer(read_only=True)
+
+    class Meta:
+        model = ArchivedOrder
+        fields = [
+            'id', 'user', 'address', 'status', 'order_sum', 'payment_method',
+            'created_at', 'updated_at', 'items'
+        ]
+        read_only_fields = fields
+
+
+def serialize_order(order, **kwargs):
+    """Сериализует заказ из горячей таблицы или архива"""
+    serializer_class = ArchivedOrderSerializer if isinstance(order, ArchivedOrder) else OrdersSerializer
+    return serializer_class(order, **kwargs).data
+
+
+class CartLineSerializer(serializers.ModelSerializer):
+    product_name = serializers.CharField(source='product.name', read_only=True)
+
+    class Meta:
+        model = CartLine
+        fields = ['product', 'product_name', 'warehouse', 'quantity', 'price_per_unit', 'line_total', 'priced_at']
+
+
+class CartSerializer(serializers.ModelSerializer):
+    lines = CartLineSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Cart
+        fields = ['total', 'updated_at', 'lines']
+
+
+class CartLineInputSerializer(serializers.Serializer):
+    product_id = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=1, default=1)
+    warehouse_id = serializers.IntegerField(min_value=1, required=False, allow_null=True)
+
+
+class CartMergeSerializer(serializers.Serializer):
+    """Корзина, собранная до входа"""
+    items = CartLineInputSerializer(many=True, allow_empty=False, max_length=200)
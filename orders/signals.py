@@ -1,10 +1,15 @@
 from django.db.models.signals import post_save, post_delete
-from django.dispatch import receiver
+from django.dispatch import receiver, Signal
 from .models import OrderItems
+from . import totals
+
+# Отправляется orders.state_machine после смены статуса пачки заказов.
+# kwargs: event, transitions — список OrderTransition
+order_status_changed = Signal()
 
 
 @receiver([post_save, post_delete], sender=OrderItems)
 def update_order_total(sender, instance, **kwargs):
-    """Автоматически пересчитывает сумму заказа при изменении позиций"""
+    """Помечает заказ для пересчёта суммы (один раз на заказ, см. orders.totals)"""
     if instance.order_id:
-        instance.order.recalc_total()
\ No newline at end of file
+        totals.mark_dirty(instance.order_id)
@@ -0,0 +1,228 @@
+"""
+Машина состояний заказа.
+
+Все смены статуса (методы модели, API, действия админки) идут через
+transition(): объявленные переходы, побочные эффекты по остаткам и запись
+OrderTransition на каждый заказ. Работает пачкой: остатки меняются
+сгруппированно одним UPDATE, статус — одним UPDATE на целевой статус.
+
+    result = transition(Orders.objects.filter(...), 'confirm', user=request.user)
+    result.done      # id заказов, сменивших статус
+    result.skipped   # {id: причина} — переход не объявлен для текущего статуса
+    result.failed    # {id: причина} — отказ побочного эффекта (не хватило остатков)
+"""
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import QuerySet
+from django.utils import timezone
+
+from products.models import Stock, StockMovement
+from products.stock_ledger import apply_stock_deltas, movement, record_movements
+from .models import Orders, OrderItems, OrderTransition
+from .signals import order_status_changed
+
+
+@dataclass
+class TransitionResult:
+    done: list = field(default_factory=list)
+    skipped: dict = field(default_factory=dict)
+    failed: dict = field(default_factory=dict)
+
+    def raise_for(self, order_id):
+        """Для одиночного перехода: ValidationError, если заказ не сменил статус"""
+        error = self.failed.get(order_id) or self.skipped.get(order_id)
+        if error:
+            raise ValidationError(error)
+
+
+# -----------------------------
+# 🔹 Побочные эффекты
+# -----------------------------
+def _stock_picker(items):
+    """
+    Строки Stock для позиций одним запросом с блокировкой:
+    склад позиции, а если он не задан — первый склад товара.
+    """
+    stocks = (
+        Stock.objects.select_for_update()
+        .filter(product_id__in={item.product_id for item in items})
+        .order_by('product_id', 'id')
+    )
+    by_pair, first = {}, {}
+    for stock in stocks:
+        by_pair[(stock.product_id, stock.warehouse_id)] = stock
+        first.setdefault(stock.product_id, stock)
+
+    def pick(item):
+        if item.warehouse_id:
+            return by_pair.get((item.product_id, item.warehouse_id))
+        return first.get(item.product_id)
+
+    return pick
+
+
+def deduct_stock(orders, items_by_order, result):
+    """Списание остатков при подтверждении. Заказы, которым не хватило остатков, отклоняются целиком."""
+    all_items = [item for order in orders for item in items_by_order[order.pk]]
+    pick = _stock_picker(all_items)
+    names = {item.product_id: item.product.name for item in all_items}
+
+    available = {}
+    deltas = defaultdict(int)
+    movements = []
+    assigned = []
+    passed = []
+
+    for order in orders:
+        need = defaultdict(int)
+        error = None
+        for item in items_by_order[order.pk]:
+            stock = pick(item)
+            if stock is None:
+                error = f"Недостаточно товара '{item.product.name}' на складе!"
+                break
+            need[stock] += item.quantity
+
+        if error is None:
+            for stock, qty in need.items():
+                if available.setdefault(stock, stock.quantity) < qty:
+                    error = f"Недостаточно товара '{names[stock.product_id]}' на складе!"
+                    break
+
+        if error:
+            result.failed[order.pk] = f"Заказ #{order.pk}: {error}"
+            continue
+
+        for stock, qty in need.items():
+            available[stock] -= qty
+            deltas[stock] -= qty
+            movements.append(movement(
+                stock.product_id, stock.warehouse_id, -qty, StockMovement.REASON_ORDER_CONFIRM, f"order:{order.pk}"
+            ))
+        # Запоминаем склад списания, чтобы отмена вернула остаток туда же
+        for item in items_by_order[order.pk]:
+            if not item.warehouse_id:
+                item.warehouse_id = pick(item).warehouse_id
+                assigned.append(item)
+        passed.append(order)
+
+    apply_stock_deltas(deltas)
+    record_movements(movements)
+    if assigned:
+        OrderItems.objects.bulk_update(assigned, ['warehouse'])
+    return passed
+
+
+def return_stock(orders, items_by_order, result):
+    """Возврат остатков при отмене — только для уже подтверждённых заказов"""
+    restock = [order for order in orders if order.status == 'confirmed']
+    all_items = [item for order in restock for item in items_by_order[order.pk]]
+    if not all_items:
+        return orders
+    pick = _stock_picker(all_items)
+
+    # Склад позиции мог остаться без строки Stock — создаём её
+    missing = {}
+    for item in all_items:
+        if pick(item) is None and item.warehouse_id:
+            missing.setdefault((item.product_id, item.warehouse_id), Stock(
+                product_id=item.product_id,
+                warehouse_id=item.warehouse_id,
+                unit_id=item.product.unit_id,
+                quantity=0,
+            ))
+    if missing:
+        Stock.objects.bulk_create(missing.values())
+
+    deltas = defaultdict(int)
+    movements = []
+    for order in restock:
+        for item in items_by_order[order.pk]:
+            stock = pick(item) or missing.get((item.product_id, item.warehouse_id))
+            if stock is None:
+                continue
+            deltas[stock] += item.quantity
+            movements.append(movement(
+                stock.product_id, stock.warehouse_id, item.quantity,
+                StockMovement.REASON_ORDER_CANCEL, f"order:{order.pk}"
+            ))
+
+    apply_stock_deltas(deltas)
+    record_movements(movements)
+    return orders
+
+
+@dataclass(frozen=True)
+class Transition:
+    sources: tuple
+    target: str
+    effect: object = None
+
+
+TRANSITIONS = {
+    'confirm': Transition(sources=('new',), target='confirmed', effect=deduct_stock),
+    'ship': Transition(sources=('confirmed',), target='shipped'),
+    'deliver': Transition(sources=('shipped',), target='delivered'),
+    'cancel': Transition(sources=('new', 'confirmed', 'shipped'), target='cancelled', effect=return_stock),
+}
+
+
+# -----------------------------
+# 🔹 Переход
+# -----------------------------
+@transaction.atomic
+def transition(orders, event, user=None):
+    """
+    Переводит заказы (queryset, список заказов или id) по событию event.
+    Заказы блокируются на время перехода; переходы пишутся в OrderTransition.
+    """
+    spec = TRANSITIONS[event]
+    if isinstance(orders, QuerySet):
+        order_ids = list(orders.values_list('pk', flat=True))
+    else:
+        order_ids = [getattr(order, 'pk', order) for order in orders]
+    if user is not None and not user.is_authenticated:
+        user = None
+
+    result = TransitionResult()
+    locked = Orders.objects.select_for_update().filter(pk__in=order_ids).order_by('pk').only('pk', 'status')
+
+    eligible = []
+    for order in locked:
+        if order.status in spec.sources:
+            eligible.append(order)
+        else:
+            result.skipped[order.pk] = (
+                f"Заказ #{order.pk}: переход «{event}» невозможен из статуса «{order.get_status_display()}»."
+            )
+
+    if eligible and spec.effect:
+        items_by_order = defaultdict(list)
+        items = OrderItems.objects.filter(order_id__in=[o.pk for o in eligible]).select_related('product')
+        for item in items:
+            items_by_order[item.order_id].append(item)
+        eligible = spec.effect(eligible, items_by_order, result)
+
+    if not eligible:
+        return result
+
+    now = timezone.now()
+    Orders.objects.filter(pk__in=[o.pk for o in eligible]).update(status=spec.target, updated_at=now)
+    transitions = OrderTransition.objects.bulk_create([
+        OrderTransition(
+            order_id=order.pk,
+            event=event,
+            from_status=order.status,
+            to_status=spec.target,
+            user=user,
+            created_at=now,
+        )
+        for order in eligible
+    ])
+    order_status_changed.send(sender=Orders, event=event, transitions=transitions)
+
+    result.done = [order.pk for order in eligible]
+    return result
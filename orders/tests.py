@@ -1,3 +1,454 @@
-from django.test import TestCase
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from products import refcache, stock_ledger
+from products.models import Category, Price, PriceType, Product, Stock, StockMovement, Unit, Warehouse
+
+from . import confirmation, idempotency
+from .archive import archive_orders, find_order
+from .models import ArchivedOrder, Cart, ConfirmationTask, DeliveryAddress, IdempotencyKey, OrderItems, Orders, OrderTransition
+from .serializers import OrdersSerializer
+from .state_machine import transition
+
+
+class ShopTestCase(TestCase):
+    """Покупатель, склад и товары с ценой и остатком"""
+
+    def setUp(self):
+        refcache.clear()
+        self.addCleanup(refcache.clear)
+        self.user = get_user_model().objects.create_user('buyer', password='secret1')
+        self.address = DeliveryAddress.objects.create(user=self.user, city='Москва', street='Тверская', house='1')
+        self.kg = Unit.objects.create(code='kg', name='кг')
+        self.fish = Category.objects.create(name='Рыба', slug='fish')
+        self.store = Warehouse.objects.create(name='Основной')
+        self.retail = PriceType.objects.create(name='Розничная', code='retail')
+        self.products = [self.make_product(number) for number in range(3)]
+
+    def make_product(self, number, price=100, quantity=50):
+        product = Product.objects.create(
+            name=f'Форель {number}', slug=f'trout-{number}', sku=f'T-{number}', category=self.fish, unit=self.kg,
+        )
+        Price.objects.create(product=product, price_type=self.retail, value=price)
+        Stock.objects.create(product=product, warehouse=self.store, quantity=quantity, unit=self.kg)
+        product.refresh_stock_cache([product.pk])
+        return product
+
+    def make_order(self, *lines, status='new'):
+        """lines — (товар, количество)"""
+        order = Orders.objects.create(user=self.user, address=self.address, status=status)
+        OrderItems.objects.bulk_create([
+            OrderItems(
+                order=order, product=product, category_id=product.category_id, quantity=quantity,
+                price_per_unit=Decimal(100), total_price=Decimal(100) * quantity,
+            )
+            for product, quantity in lines
+        ])
+        return order
+
+    def stock(self, product):
+        return Stock.objects.get(product=product, warehouse=self.store).quantity
+
+
+class StockLedgerTests(ShopTestCase):
+    def test_confirm_and_cancel_write_matching_movements(self):
+        trout, salmon, _ = self.products
+        order = self.make_order((trout, 3), (salmon, 2))
+
+        transition([order], 'confirm').raise_for(order.pk)
+        self.assertEqual((self.stock(trout), self.stock(salmon)), (47, 48))
+        transition([order], 'cancel').raise_for(order.pk)
+        self.assertEqual((self.stock(trout), self.stock(salmon)), (50, 50))
+
+        movements = StockMovement.objects.filter(reference=f'order:{order.pk}').order_by('id')
+        self.assertEqual(
+            sorted(movements.values_list('product_id', 'delta', 'reason')),
+            sorted([
+                (trout.pk, -3, 'order_confirm'), (salmon.pk, -2, 'order_confirm'),
+                (trout.pk, 3, 'order_cancel'), (salmon.pk, 2, 'order_cancel'),
+            ]),
+        )
+
+    def test_ledger_reconciles_with_stock_after_snapshot(self):
+        for product in self.products:
+            # Начальные остатки — тоже движения журнала
+            stock_ledger.record_movements([
+                stock_ledger.movement(product.pk, self.store.pk, 50, StockMovement.REASON_ADMIN)
+            ])
+        transition([self.make_order((self.products[0], 5))], 'confirm')
+        stock_ledger.take_snapshots()
+        transition([self.make_order((self.products[0], 1), (self.products[1], 4))], 'confirm')
+
+        self.assertEqual(
+            stock_ledger.balances(),
+            {(s.product_id, s.warehouse_id): s.quantity for s in Stock.objects.all()},
+        )
+
+
+class AdminQueryTests(ShopTestCase):
+    """Число запросов админки заказов не зависит от числа строк"""
+
+    def setUp(self):
+        super().setUp()
+        admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'pass')
+        self.client.force_login(admin)
+        self.count = 0
+
+    def add_orders(self, n):
+        for _ in range(n):
+            self.count += 1
+            self.user = get_user_model().objects.create_user(f'buyer-{self.count}')
+            self.address = DeliveryAddress.objects.create(user=self.user, city='Москва', street='Тверская', house='1')
+            self.make_order(*[(product, 1) for product in self.products])
+
+    def queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelists(self):
+        urls = [
+            reverse(f'admin:orders_{model}_changelist')
+            for model in ('orders', 'orderitems', 'deliveryaddress')
+        ]
+        self.add_orders(3)
+        self.client.get(urls[0])  # autodiscover админки
+        before = {url: self.queries(url) for url in urls}
+        self.add_orders(3)
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.queries(url), before[url])
+
+
+class OrderApiTestCase(ShopTestCase):
+    def setUp(self):
+        super().setUp()
+        self.products += [self.make_product(number) for number in range(3, 10)]
+        self.client.force_login(self.user)
+
+    def create(self, products, **extra):
+        return self.client.post(reverse('create-order'), {
+            'address_id': self.address.pk,
+            'items': [{'product_id': product.pk, 'quantity': 2} for product in products],
+        }, content_type='application/json', **extra)
+
+
+class CreateOrderTests(OrderApiTestCase):
+    def test_query_count_does_not_depend_on_items(self):
+        for products in (self.products[:1], self.products):
+            # сессия, пользователь, адрес, товары, цены, остатки, заказ, позиции + savepoint
+            with self.assertNumQueries(10):
+                response = self.create(products)
+            self.assertEqual(response.status_code, 201)
+
+        order = Orders.objects.get(pk=response.json()['order_id'])
+        self.assertEqual(order.items.count(), 10)
+        self.assertEqual(order.order_sum, Decimal(2000))
+        self.assertEqual(response.json()['order_sum'], 2000)
+
+
+class OrderTotalsTests(ShopTestCase):
+    def recalcs(self, queries):
+        return [q for q in queries.captured_queries if q['sql'].startswith('UPDATE "orders_orders"')]
+
+    def test_one_recalculation_per_transaction(self):
+        order = self.make_order()
+        with self.captureOnCommitCallbacks() as callbacks:
+            items = [
+                OrderItems.objects.create(order=order, product=product, quantity=2, price_per_unit=Decimal(150))
+                for product in self.products
+            ]
+            items[0].quantity = 1
+            items[0].save()
+            items[1].delete()
+        order.refresh_from_db()
+        self.assertEqual(order.order_sum, 0)  # до коммита сумма не пересчитывается
+
+        with CaptureQueriesContext(connection) as queries:
+            for callback in callbacks:
+                callback()
+        self.assertEqual(len(self.recalcs(queries)), 1)
+        order.refresh_from_db()
+        self.assertEqual(order.order_sum, Decimal(450))
+
+    def test_rollback_skips_recalculation(self):
+        order = self.make_order()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                OrderItems.objects.create(order=order, product=self.products[0], quantity=2, price_per_unit=Decimal(150))
+                raise RuntimeError
+        self.assertEqual(callbacks, [])
+        order.refresh_from_db()
+        self.assertEqual(order.order_sum, 0)
+
+
+class IdempotencyTests(OrderApiTestCase):
+    def create_with_key(self, products, key='order-1'):
+        return self.create(products, HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_replay_returns_stored_response(self):
+        first = self.create_with_key(self.products[:2])
+        self.assertEqual(first.status_code, 201)
+        again = self.create_with_key(self.products[:2])
+        self.assertEqual(again.status_code, 201)
+        self.assertEqual(again.json(), first.json())
+        self.assertEqual(again['Idempotent-Replayed'], 'true')
+        self.assertEqual(Orders.objects.count(), 1)
+
+    def test_same_key_different_body_is_rejected(self):
+        self.create_with_key(self.products[:2])
+        self.assertEqual(self.create_with_key(self.products[:1]).status_code, 422)
+        self.assertEqual(Orders.objects.count(), 1)
+
+    @override_settings(IDEMPOTENCY_WAIT_TIMEOUT=0)
+    def test_in_progress_key_conflicts_until_lease_expires(self):
+        products = self.products[:2]
+        response = self.create_with_key(products)
+        # Воркер занял ключ и упал до коммита заказа: ключ «в работе», заказа нет
+        Orders.objects.all().delete()
+        IdempotencyKey.objects.update(
+            status=IdempotencyKey.STATUS_IN_PROGRESS, response_status=None, response_body=None,
+        )
+
+        response = self.create_with_key(products)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Orders.objects.count(), 0)
+
+        IdempotencyKey.objects.update(locked_until=timezone.now() - timedelta(seconds=1))
+        response = self.create_with_key(products)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Orders.objects.count(), 1)
+        self.assertEqual(IdempotencyKey.objects.get().status, IdempotencyKey.STATUS_DONE)
+
+    def test_lost_lease_rolls_back_order(self):
+        original = idempotency._finish
+
+        def taken_over(record, response):
+            # Пока запрос выполнялся, аренду перехватил повтор
+            IdempotencyKey.objects.filter(pk=record.pk).update(locked_until=timezone.now())
+            original(record, response)
+
+        with override_settings(IDEMPOTENCY_WAIT_TIMEOUT=0), mock.patch.object(idempotency, '_finish', taken_over):
+            response = self.create_with_key(self.products[:2])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Orders.objects.count(), 0)
+
+
+class StateMachineTests(ShopTestCase):
+    def test_illegal_transition_is_rejected(self):
+        order = self.make_order((self.products[0], 2))
+        result = transition([order], 'ship')
+        self.assertEqual(result.done, [])
+        with self.assertRaises(ValidationError):
+            result.raise_for(order.pk)
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'new')
+        self.assertFalse(OrderTransition.objects.exists())
+
+    def test_legal_transition_writes_history_and_runs_effect(self):
+        order = self.make_order((self.products[0], 2))
+        order.confirm(user=self.user)
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'confirmed')
+        self.assertEqual(self.stock(self.products[0]), 48)
+        self.assertEqual(
+            list(order.transitions.values_list('event', 'from_status', 'to_status', 'user')),
+            [('confirm', 'new', 'confirmed', self.user.pk)],
+        )
+
+    def test_serializer_and_admin_do_not_set_status(self):
+        order = self.make_order((self.products[0], 2))
+        serializer = OrdersSerializer(order, data={'status': 'delivered'}, partial=True)
+        self.assertTrue(serializer.is_valid())
+        serializer.save()
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'new')
+
+        admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'pass')
+        self.client.force_login(admin)
+        response = self.client.get(reverse('admin:orders_orders_add'))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('name="status"', response.content.decode())
+
+
+class CartTests(ShopTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def post(self, name, data, *args):
+        return self.client.post(reverse(name, args=args), data, content_type='application/json')
+
+    def test_add_update_remove_keep_total(self):
+        trout, salmon, _ = self.products
+        self.post('cart-lines', {'product_id': trout.pk, 'quantity': 2})
+        response = self.post('cart-lines', {'product_id': trout.pk, 'quantity': 1})
+        self.assertEqual(response.json()['total'], '300.00')
+        self.post('cart-lines', {'product_id': salmon.pk})
+
+        response = self.client.patch(
+            reverse('cart-line', args=[trout.pk]), {'quantity': 5}, content_type='application/json',
+        )
+        self.assertEqual(response.json()['total'], '600.00')
+        response = self.client.delete(reverse('cart-line', args=[salmon.pk]))
+        self.assertEqual(response.json()['total'], '500.00')
+        self.assertEqual([line['quantity'] for line in response.json()['lines']], [5])
+
+        response = self.client.patch(
+            reverse('cart-line', args=[trout.pk]), {'quantity': 51}, content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Cart.objects.get(user=self.user).total, Decimal(500))
+
+    def test_merge_guest_cart_after_login(self):
+        trout, salmon, _ = self.products
+        self.post('cart-lines', {'product_id': trout.pk, 'quantity': 1})
+        response = self.post('cart-merge', {'items': [
+            {'product_id': trout.pk, 'quantity': 2},
+            {'product_id': salmon.pk, 'quantity': 1},
+            {'product_id': 999, 'quantity': 1},
+        ]})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual({line['product']: line['quantity'] for line in data['lines']}, {trout.pk: 3, salmon.pk: 1})
+        self.assertEqual(data['total'], '400.00')
+        self.assertEqual(data['errors'], [{'product_id': 999, 'error': 'Товар не найден'}])
+
+    def test_checkout_turns_cart_into_order(self):
+        trout, salmon, _ = self.products
+        self.post('cart-lines', {'product_id': trout.pk, 'quantity': 2})
+        self.post('cart-lines', {'product_id': salmon.pk, 'quantity': 1})
+
+        response = self.post('cart-checkout', {'address_id': self.address.pk})
+        self.assertEqual(response.status_code, 201)
+        order = Orders.objects.get(pk=response.json()['order_id'])
+        self.assertEqual(order.order_sum, Decimal(300))
+        self.assertEqual(
+            sorted(order.items.values_list('product_id', 'quantity', 'total_price')),
+            [(trout.pk, 2, Decimal(200)), (salmon.pk, 1, Decimal(100))],
+        )
+        cart = Cart.objects.get(user=self.user)
+        self.assertEqual((cart.total, cart.lines.count()), (0, 0))
+
+    def test_checkout_rejects_changed_prices(self):
+        trout = self.products[0]
+        self.post('cart-lines', {'product_id': trout.pk, 'quantity': 2})
+        price = Price.objects.get(product=trout)
+        price.value = 120
+        price.save()
+
+        response = self.post('cart-checkout', {'address_id': self.address.pk})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['details'][0]['new_price'], '120.00')
+        self.assertEqual(response.json()['cart']['total'], '240.00')
+        self.assertFalse(Orders.objects.exists())
+
+
+@override_settings(ORDER_ARCHIVE_AFTER_DAYS=30)
+class ArchiveTests(ShopTestCase):
+    def make_old(self, *orders):
+        Orders.objects.filter(pk__in=[o.pk for o in orders]).update(
+            created_at=timezone.now() - timedelta(days=60), updated_at=timezone.now() - timedelta(days=40),
+        )
+
+    def test_finished_orders_move_with_items_and_history(self):
+        trout, salmon, _ = self.products
+        delivered = self.make_order((trout, 2), (salmon, 1))
+        for event in ('confirm', 'ship', 'deliver'):
+            transition([delivered], event, user=self.user)
+        cancelled = self.make_order((trout, 1))
+        transition([cancelled], 'cancel')
+        active = self.make_order((salmon, 1))
+        recent = self.make_order((salmon, 1))
+        transition([recent], 'cancel')
+        self.make_old(delivered, cancelled, active)
+        item_ids = set(delivered.items.values_list('pk', flat=True))
+
+        self.assertEqual(archive_orders(batch_size=1), 2)
+
+        self.assertEqual(set(Orders.objects.values_list('pk', flat=True)), {active.pk, recent.pk})
+        self.assertFalse(OrderItems.objects.filter(order_id__in=[delivered.pk, cancelled.pk]).exists())
+        self.assertFalse(OrderTransition.objects.filter(order_id__in=[delivered.pk, cancelled.pk]).exists())
+
+        archived = ArchivedOrder.objects.get(pk=delivered.pk)
+        self.assertEqual(set(archived.items.values_list('pk', flat=True)), item_ids)
+        self.assertEqual(
+            [(t['event'], t['user_id']) for t in archived.transitions],
+            [('confirm', self.user.pk), ('ship', self.user.pk), ('deliver', self.user.pk)],
+        )
+        self.assertEqual(archived.status, 'delivered')
+
+    def test_archived_order_is_readable(self):
+        order = self.make_order((self.products[0], 2))
+        transition([order], 'cancel')
+        self.make_old(order)
+        archive_orders()
+        self.client.force_login(self.user)
+
+        # Имена order-detail/order-list заняты и роутером OrderViewSet — пути явно
+        response = self.client.get(f'/orders/orders/{order.pk}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'cancelled')
+        self.assertEqual([item['quantity'] for item in response.json()['items']], [2])
+
+        response = self.client.get('/orders/orders/')
+        self.assertEqual([o['id'] for o in response.json()], [order.pk])
+        self.assertIsInstance(find_order(self.user, order.pk), ArchivedOrder)
+
+
+class ConfirmationQueueTests(ShopTestCase):
+    def test_enqueue_counts_only_new_tasks(self):
+        first, second = self.make_order((self.products[0], 1)), self.make_order((self.products[1], 1))
+        self.assertEqual(confirmation.enqueue([first], user=self.user), 1)
+        self.assertEqual(confirmation.enqueue(Orders.objects.all(), user=self.user), 1)
+        self.assertEqual(confirmation.enqueue([first, second]), 0)
+        self.assertEqual(ConfirmationTask.objects.count(), 2)
+
+    def test_worker_confirms_and_reports_failures(self):
+        ok = self.make_order((self.products[0], 2))
+        short = self.make_order((self.products[1], 51))
+        confirmation.enqueue([ok, short], user=self.user)
+
+        self.assertEqual(confirmation.run_worker(batch_size=1, stop_when_empty=True), 2)
+
+        tasks = {task.order_id: task for task in ConfirmationTask.objects.all()}
+        self.assertEqual((tasks[ok.pk].status, tasks[ok.pk].attempts), (ConfirmationTask.STATUS_DONE, 1))
+        self.assertEqual(tasks[short.pk].status, ConfirmationTask.STATUS_FAILED)
+        self.assertIn('Недостаточно', tasks[short.pk].message)
+        self.assertEqual(Orders.objects.get(pk=ok.pk).status, 'confirmed')
+        self.assertEqual(self.stock(self.products[0]), 48)
+        self.assertEqual(ok.transitions.get().user, self.user)
+        # Заказ снова можно поставить в очередь после завершения задачи
+        self.assertEqual(confirmation.enqueue([short]), 1)
+
+    @override_settings(CONFIRMATION_MAX_ATTEMPTS=2)
+    def test_failed_batch_is_retried_then_given_up(self):
+        order = self.make_order((self.products[0], 2))
+        confirmation.enqueue([order])
+        rounds = iter(range(3))
+
+        with mock.patch.object(confirmation, 'transition', side_effect=RuntimeError('БД недоступна')), \
+                self.assertLogs('orders.confirmation', 'ERROR'):
+            confirmation.run_worker(idle_sleep=0, should_stop=lambda: next(rounds) == 1)
+        task = ConfirmationTask.objects.get()
+        self.assertEqual((task.status, task.attempts, task.message), (ConfirmationTask.STATUS_PENDING, 1, 'БД недоступна'))
+
+        with mock.patch.object(confirmation, 'transition', side_effect=RuntimeError('БД недоступна')), \
+                self.assertLogs('orders.confirmation', 'ERROR'):
+            confirmation.run_worker(idle_sleep=0, stop_when_empty=True)
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), (ConfirmationTask.STATUS_FAILED, 2))
+
+        # Сбой не оставил следов: заказ по-прежнему новый, остатки на месте
+        self.assertEqual(Orders.objects.get(pk=order.pk).status, 'new')
+        self.assertEqual(self.stock(self.products[0]), 50)
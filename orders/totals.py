@@ -0,0 +1,64 @@
+"""
+Отложенный пересчёт сумм заказов.
+
+Запись или удаление позиции только помечает заказ «грязным».
+Сумма пересчитывается один раз на заказ и одним UPDATE на все заказы:
+в transaction.on_commit либо на выходе из явного batch().
+"""
+import threading
+from contextlib import contextmanager
+
+from django.db import transaction
+
+_state = threading.local()
+
+
+def _get_state():
+    if not hasattr(_state, 'dirty'):
+        _state.dirty = set()
+        _state.depth = 0
+    return _state
+
+
+def mark_dirty(order_id):
+    """Пометить заказ для пересчёта суммы"""
+    state = _get_state()
+    state.dirty.add(order_id)
+    if state.depth == 0:
+        # Повторные колбэки в той же транзакции ничего не делают — множество уже пусто
+        transaction.on_commit(flush)
+
+
+def flush():
+    """Пересчитать все помеченные заказы одним UPDATE"""
+    from .models import Orders
+
+    state = _get_state()
+    if not state.dirty:
+        return 0
+    order_ids, state.dirty = state.dirty, set()
+    return Orders.recalc_totals(order_ids)
+
+
+@contextmanager
+def batch():
+    """
+    Явная пачка записей позиций: суммы пересчитываются один раз на выходе.
+
+        with order_totals.batch():
+            for data in items:
+                OrderItems.objects.create(...)
+    """
+    state = _get_state()
+    state.depth += 1
+    try:
+        yield
+    except Exception:
+        state.depth -= 1
+        if state.depth == 0:
+            # При откате транзакции колбэк отбросится вместе с ней
+            transaction.on_commit(flush)
+        raise
+    state.depth -= 1
+    if state.depth == 0:
+        flush()
@@ -1,6 +1,9 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import CreateOrderView, OrderRepeatView, OrderViewSet, OrderListView, OrderDetailView, cancel_order
+from .views import (
+    CreateOrderView, OrderRepeatView, OrderViewSet, OrderListView, OrderDetailView, cancel_order,
+    CartView, CartLineView, CartMergeView, CartCheckoutView,
+)
 
 router = DefaultRouter()
 router.register(r'orders', OrderViewSet, basename='order')
@@ -11,5 +14,10 @@ urlpatterns = [
     path('<int:pk>/repeat/', OrderRepeatView.as_view(), name='order-repeat'),
     path('orders/', OrderListView.as_view(), name='order-list'),
     path('orders/<int:pk>/', OrderDetailView.as_view(), name='order-detail'),
+    path('cart/', CartView.as_view(), name='cart'),
+    path('cart/lines/', CartLineView.as_view(), name='cart-lines'),
+    path('cart/lines/<int:product_id>/', CartLineView.as_view(), name='cart-line'),
+    path('cart/merge/', CartMergeView.as_view(), name='cart-merge'),
+    path('cart/checkout/', CartCheckoutView.as_view(), name='cart-checkout'),
     path('api/', include(router.urls)),
 ]
@@ -1,5 +1,5 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.db import transaction
-from django.db.models import F, Sum
 from django.shortcuts import get_object_or_404
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
@@ -7,26 +7,40 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework import status, viewsets, generics, permissions
 
-from products.models import Product, Price, Stock
-from .models import Orders, OrderItems, DeliveryAddress
+from products import refcache
+from products.models import Product, Price, PriceType
+from products.availability import load_stocks, pick_stock
+from . import cart as carts
+from .archive import orders_history, find_order
+from .idempotency import idempotent
+from .state_machine import transition
+from .models import Orders, OrderItems, DeliveryAddress, Cart
 from .permissions import IsOwnerOrAdmin
-from .serializers import OrdersSerializer
+from .serializers import OrdersSerializer, CartSerializer, CartLineInputSerializer, CartMergeSerializer, serialize_order
 
 
 class OrderListView(generics.ListAPIView):
+    """История заказов пользователя: горячая таблица и архив (orders.archive)"""
     serializer_class = OrdersSerializer
     permission_classes = [permissions.IsAuthenticated]
 
-    def get_queryset(self):
-        return Orders.objects.filter(user=self.request.user).order_by('-created_at')
+    def list(self, request, *args, **kwargs):
+        context = self.get_serializer_context()
+        return Response([
+            serialize_order(order, context=context)
+            for order in orders_history(request.user)
+        ])
 
 
 class OrderDetailView(generics.RetrieveAPIView):
     serializer_class = OrdersSerializer
     permission_classes = [permissions.IsAuthenticated]
 
-    def get_queryset(self):
-        return Orders.objects.filter(user=self.request.user)
+    def retrieve(self, request, pk, *args, **kwargs):
+        order = find_order(request.user, pk)
+        if order is None:
+            return Response({'error': 'Заказ не найден.'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(serialize_order(order, context=self.get_serializer_context()))
 
 
 class OrderViewSet(viewsets.ReadOnlyModelViewSet):
@@ -46,10 +60,15 @@ class CreateOrderView(APIView):
     Никакого списания товара здесь НЕ происходит.
     Только запись, валидация и проверка остатков.
     Реальное списание происходит только при подтверждении заказа в админке.
+
+    Число запросов не зависит от размера корзины: товары, цены и остатки
+    читаются тремя запросами, позиции пишутся одним bulk_create.
     """
 
     permission_classes = [permissions.IsAuthenticated]
+    throttle_scope = 'order-create'  # цена запроса — core/throttling.py
 
+    @idempotent
     @transaction.atomic
     def post(self, request):
         data = request.data
@@ -64,76 +83,93 @@ class CreateOrderView(APIView):
         address_id = data.get('address_id')
         address_data = data.get('address', {})
 
+        address = None
         if address_id:
             address = get_object_or_404(DeliveryAddress, id=address_id, user=user)
-        elif address_data:
-            address = DeliveryAddress.objects.create(user=user, **address_data)
-        else:
+        elif not address_data:
             return Response({'error': 'Не указан адрес'}, status=status.HTTP_400_BAD_REQUEST)
 
-        # === Создаём заказ ===
-        order = Orders.objects.create(
-            user=user,
-            address=address,
-            payment_method=payment_method,
-            status='new'   # товар НЕ списан
-        )
-
         # === Позиции ===
         items = data.get('items', [])
         if not items:
             return Response({'error': 'Пустой заказ'}, status=status.HTTP_400_BAD_REQUEST)
 
+        try:
+            lines = [
+                (int(item.get('product_id')), int(item.get('quantity', 1)), item.get('warehouse_id'))
+                for item in items
+            ]
+        except (TypeError, ValueError):
+            return Response({'error': 'Неверный формат позиций'}, status=status.HTTP_400_BAD_REQUEST)
+        if any(quantity <= 0 for _, quantity, _ in lines):
+            return Response({'error': 'Количество должно быть больше нуля'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Три запроса на весь заказ: товары, актуальные цены, остатки
+        product_ids = {product_id for product_id, _, _ in lines}
+        products = Product.objects.filter(is_active=True).in_bulk(product_ids)
+        missing = product_ids - set(products)
+        if missing:
+            return Response(
+                {'error': 'Товар не найден', 'details': sorted(missing)},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        prices = Price.get_current_prices(products)
+        stocks = load_stocks(list(products))
+
+        order_items = []
         order_total = 0
         insufficient = []
+        reserved = {}  # stock.pk -> уже зарезервировано строками этого заказа
 
-        for item in items:
-            product_id = item.get('product_id')
-            quantity = int(item.get('quantity', 1))
-            warehouse_id = item.get('warehouse_id')
+        for product_id, quantity, warehouse_id in lines:
+            product = products[product_id]
 
-            product = get_object_or_404(Product, id=product_id, is_active=True)
-
-            # Цена
-            price_obj = product.prices.first()
+            # Цена (те же правила, что и в /products/availability/)
+            price_obj = prices.get(product_id)
             if not price_obj:
                 return Response({'error': f'У товара "{product.name}" нет цены'}, status=status.HTTP_400_BAD_REQUEST)
 
             price = price_obj.value
 
             # Проверка остатков, БЕЗ списания
-            stock_qs = Stock.objects.filter(product=product)
-            if warehouse_id:
-                stock_qs = stock_qs.filter(warehouse_id=warehouse_id)
-
-            stock = stock_qs.first()
-            if not stock or stock.quantity < quantity:
+            stock = pick_stock(stocks.get(product_id, []), warehouse_id)
+            if not stock or stock.quantity < reserved.get(stock.pk, 0) + quantity:
                 insufficient.append(product.name)
                 continue
+            reserved[stock.pk] = reserved.get(stock.pk, 0) + quantity
 
             total_price = price * quantity
-
-            OrderItems.objects.create(
-                order=order,
+            order_items.append(OrderItems(
                 product=product,
-                warehouse=stock.warehouse,
+                warehouse_id=stock.warehouse_id,
+                category_id=product.category_id,
                 price_per_unit=price,
                 quantity=quantity,
                 total_price=total_price
-            )
+            ))
 
             order_total += total_price
 
         if insufficient:
-            order.delete()
             return Response({
                 'error': 'Недостаточно остатков',
                 'details': insufficient
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        # Записываем сумму заказа
-        order.order_sum = order_total
-        order.save()
+        if address is None:
+            address = DeliveryAddress.objects.create(user=user, **address_data)
+
+        # === Создаём заказ сразу с итоговой суммой ===
+        order = Orders.objects.create(
+            user=user,
+            address=address,
+            payment_method=payment_method,
+            status='new',   # товар НЕ списан
+            order_sum=order_total,
+        )
+        for order_item in order_items:
+            order_item.order = order
+        OrderItems.objects.bulk_create(order_items)
 
         return Response({
             'success': True,
@@ -148,11 +184,12 @@ class OrderRepeatView(APIView):
     Повтор заказа: товаров НЕ списывает.
     """
     permission_classes = [permissions.IsAuthenticated]
+    throttle_scope = 'order-repeat'
 
+    @idempotent
     def post(self, request, pk):
-        try:
-            original = Orders.objects.get(user=request.user, pk=pk)
-        except Orders.DoesNotExist:
+        original = find_order(request.user, pk)
+        if original is None:
             return Response({'error': 'Заказ не найден.'}, status=status.HTTP_404_NOT_FOUND)
 
         with transaction.atomic():
@@ -165,6 +202,7 @@ class OrderRepeatView(APIView):
 
             total = 0
             skipped = []
+            retail = refcache.lookup(PriceType, 'name', "Розничная")
 
             for item in original.items.all():
                 product = item.product
@@ -179,11 +217,11 @@ class OrderRepeatView(APIView):
                     continue
 
                 price = (
-                    Price.objects.filter(product=product, price_type__name="Розничная")
+                    Price.objects.filter(product=product, price_type=retail)
                     .order_by('-updated_at')
                     .values_list('value', flat=True)
                     .first()
-                )
+                ) if retail else None
 
                 if price is None:
                     skipped.append(f"{product.name} (нет цены)")
@@ -223,7 +261,6 @@ class OrderRepeatView(APIView):
 
 @api_view(['PATCH'])
 @permission_classes([IsAuthenticated])
-@transaction.atomic
 def cancel_order(request, pk):
     """
     Отменяет заказ. Возврат остатков происходит ТОЛЬКО если заказ был подтверждён.
@@ -242,35 +279,130 @@ def cancel_order(request, pk):
     if order.status in ['delivered', 'completed']:
         return Response({'error': 'Доставленные заказы нельзя отменить'}, status=status.HTTP_400_BAD_REQUEST)
 
-    # === Возврат остатков ТОЛЬКО если заказ был подтверждён ===
-    if order.status == 'confirmed':
-
-        for item in order.items.select_related('product', 'warehouse'):
-            product = item.product
-            qty = item.quantity
-
-            stock = Stock.objects.select_for_update().filter(
-                product=product,
-                warehouse=item.warehouse
-            ).first()
-
-            if stock:
-                stock.quantity = F('quantity') + qty
-                stock.save(update_fields=['quantity'])
-
-            # Пересчёт общего остатка
-            total = product.stocks.aggregate(total=Sum('quantity'))['total'] or 0
-            product.stock_cache = total
-            product.save(update_fields=['stock_cache'])
-
-    # Меняем статус
-    order.status = 'cancelled'
-    order.save(update_fields=['status'])
+    was_confirmed = order.status == 'confirmed'
+    result = transition([order.pk], 'cancel', user=user)
+    if order.pk not in result.done:
+        error = result.failed.get(order.pk) or result.skipped.get(order.pk)
+        return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
 
     return Response({
         'success': True,
         'message': (
             f'Заказ #{order.id} отменён.'
-            + (' Остатки возвращены на склад.' if order.status == "confirmed" else '')
+            + (' Остатки возвращены на склад.' if was_confirmed else '')
         )
     }, status=status.HTTP_200_OK)
+
+
+# -----------------------------
+# 🔹 Корзина
+# -----------------------------
+def cart_data(user):
+    cart = carts.get_cart(user)
+    cart = Cart.objects.prefetch_related('lines__product').get(pk=cart.pk)
+    return CartSerializer(cart).data
+
+
+def cart_response(user):
+    return Response(cart_data(user))
+
+
+class CartView(APIView):
+    """Корзина текущего пользователя: просмотр и очистка"""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        return cart_response(request.user)
+
+    def delete(self, request):
+        carts.clear(request.user)
+        return cart_response(request.user)
+
+
+class CartLineView(APIView):
+    """
+    POST   /cart/lines/                — добавить товар (количество прибавляется)
+    PATCH  /cart/lines/<product_id>/   — задать количество
+    DELETE /cart/lines/<product_id>/   — убрать товар
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def _set(self, request, data, add):
+        serializer = CartLineInputSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            carts.set_line(request.user, add=add, **serializer.validated_data)
+        except Product.DoesNotExist:
+            return Response({'error': 'Товар не найден'}, status=status.HTTP_404_NOT_FOUND)
+        except DjangoValidationError as e:
+            return Response({'error': e.messages[0]}, status=status.HTTP_400_BAD_REQUEST)
+        return cart_response(request.user)
+
+    def post(self, request, product_id=None):
+        return self._set(request, request.data, add=True)
+
+    def patch(self, request, product_id):
+        return self._set(request, {**request.data, 'product_id': product_id}, add=False)
+
+    def delete(self, request, product_id):
+        if not carts.remove_line(request.user, product_id):
+            return Response({'error': 'Товара нет в корзине'}, status=status.HTTP_404_NOT_FOUND)
+        return cart_response(request.user)
+
+
+class CartMergeView(APIView):
+    """
+    POST /cart/merge/ {"items": [{"product_id", "quantity", "warehouse_id"?}, ...]}
+    Вызывается клиентом сразу после входа: корзина гостя добавляется к серверной.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        serializer = CartMergeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        errors = carts.merge(request.user, serializer.validated_data['items'])
+        return Response({**cart_data(request.user), 'errors': errors})
+
+
+class CartCheckoutView(APIView):
+    """
+    Оформление корзины в заказ (без списания остатков).
+    Если цены или остатки изменились с момента снапшота — 409 с пересчитанной корзиной.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    @idempotent
+    @transaction.atomic
+    def post(self, request):
+        data = request.data
+        user = request.user
+
+        payment_method = data.get('payment_method', 'cash')
+        if payment_method not in dict(Orders.PAYMENT_CHOICES):
+            return Response({'error': 'Неверный метод оплаты'}, status=status.HTTP_400_BAD_REQUEST)
+
+        address_id = data.get('address_id')
+        address_data = data.get('address', {})
+        address = None
+        if address_id:
+            address = get_object_or_404(DeliveryAddress, id=address_id, user=user)
+        elif not address_data:
+            return Response({'error': 'Не указан адрес'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            order, changes = carts.checkout(user, payment_method, address=address, address_data=address_data)
+        except DjangoValidationError as e:
+            return Response({'error': e.messages[0]}, status=status.HTTP_400_BAD_REQUEST)
+
+        if order is None:
+            return Response(
+                {'error': 'Корзина изменилась', 'details': changes, 'cart': cart_data(user)},
+                status=status.HTTP_409_CONFLICT,
+            )
+
+        return Response({
+            'success': True,
+            'order_id': order.id,
+            'order_sum': float(order.order_sum),
+            'status': order.status
+        }, status=status.HTTP_201_CREATED)
@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.utils.text import slugify
 from django.utils.html import format_html
-from django.db.models import Sum
+from django.db.models import Count
 from django.utils import timezone
 
 from import_export.admin import ImportExportModelAdmin
@@ -10,9 +10,28 @@ from import_export.widgets import ForeignKeyWidget, ManyToManyWidget
 
 from .models import (
     Category, Tag, Unit, Product, ProductImage,
-    Warehouse, Stock, PriceType, Price
+    Warehouse, Stock, PriceType, Price, StockMovement, StockSnapshot, stock_total_subquery
 )
 from .admin_resources import ProductResource, StockResource, PriceResource
+from .stock_ledger import movement, record_movements
+
+
+def admin_stock_movements(stock, initial, deleted=False, reference=''):
+    """Движения для ручной правки строки Stock (initial — данные формы до изменения)"""
+    old_qty = initial.get('quantity') or 0
+    old_warehouse = initial.get('warehouse')
+    old_warehouse_id = getattr(old_warehouse, 'pk', old_warehouse)
+
+    if deleted:
+        warehouse_id = old_warehouse_id or stock.warehouse_id
+        return [movement(stock.product_id, warehouse_id, -old_qty, StockMovement.REASON_ADMIN, reference)]
+    if old_warehouse_id and old_warehouse_id != stock.warehouse_id:
+        # Строку перенесли на другой склад
+        return [
+            movement(stock.product_id, old_warehouse_id, -old_qty, StockMovement.REASON_ADMIN, reference),
+            movement(stock.product_id, stock.warehouse_id, stock.quantity, StockMovement.REASON_ADMIN, reference),
+        ]
+    return [movement(stock.product_id, stock.warehouse_id, stock.quantity - old_qty, StockMovement.REASON_ADMIN, reference)]
 
 
 # -------------------- Inlines --------------------
@@ -62,10 +81,14 @@ class ProductAdmin(ImportExportModelAdmin):
     readonly_fields = ('synced_at',)
     inlines = [PriceInline, StockInline, ProductImageInline]
     actions = ['recalculate_stock_cache']
+    list_select_related = ('category', 'unit')
 
-    @admin.display(description='Остаток')
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(stock_total=stock_total_subquery())
+
+    @admin.display(description='Остаток', ordering='stock_total')
     def stock_status(self, obj):
-        total = obj.stocks.aggregate(total=Sum('quantity'))['total'] or 0
+        total = obj.stock_total
         if total > 10:
             status = '✅ В наличии'
         elif total > 0:
@@ -78,13 +101,34 @@ class ProductAdmin(ImportExportModelAdmin):
     def stock_cache(self, obj):
         return obj.stock_cache
 
+    def save_model(self, request, obj, form, change):
+        # Правка из админки уходит в МойСклад (manage.py moysklad_push)
+        obj.changed_locally = True
+        super().save_model(request, obj, form, change)
+
+    def save_formset(self, request, form, formset, change):
+        if formset.model is not Stock:
+            return super().save_formset(request, form, formset, change)
+
+        reference = f"admin:{request.user.username}"
+        changed = [
+            f for f in formset.forms
+            if f.has_changed() and f not in formset.deleted_forms and f.cleaned_data
+        ]
+        deleted = [(f.instance, f.initial) for f in formset.deleted_forms if f.instance.pk]
+        super().save_formset(request, form, formset, change)
+
+        movements = []
+        for stock, initial in deleted:
+            movements += admin_stock_movements(stock, initial, deleted=True, reference=reference)
+        for f in changed:
+            movements += admin_stock_movements(f.instance, f.initial, reference=reference)
+        record_movements(movements)
+
     @admin.action(description='Пересчитать stock_cache по выбранным товарам')
     def recalculate_stock_cache(self, request, queryset):
-        for p in queryset:
-            total = p.stocks.aggregate(total=Sum('quantity'))['total'] or 0
-            p.stock_cache = total
-            p.save(update_fields=['stock_cache'])
-        self.message_user(request, f'Пересчитано для {queryset.count()} товаров.')
+        updated = Product.refresh_stock_cache(queryset.values('pk'))
+        self.message_user(request, f'Пересчитано для {updated} товаров.')
 
 
 # -------------------- ProductImage Admin --------------------
@@ -93,6 +137,7 @@ class ProductAdmin(ImportExportModelAdmin):
 class ProductImageAdmin(admin.ModelAdmin):
     list_display = ('product', 'is_main', 'image_preview')
     readonly_fields = ('image_preview',)
+    list_select_related = ('product',)
 
     def image_preview(self, obj):
         if not obj or not obj.image:
@@ -108,9 +153,12 @@ class CategoryAdmin(admin.ModelAdmin):
     list_display = ('name', 'slug', 'product_count', 'ms_uuid')
     prepopulated_fields = {'slug': ('name',)}
 
-    @admin.display(description='Товаров')
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(products_total=Count('products'))
+
+    @admin.display(description='Товаров', ordering='products_total')
     def product_count(self, obj):
-        return obj.products.count()
+        return obj.products_total
 
 
 @admin.register(Tag)
@@ -137,6 +185,61 @@ class StockAdmin(ImportExportModelAdmin):
     list_display = ('product', 'warehouse', 'quantity', 'unit', 'updated_at')
     list_filter = ('warehouse',)
     search_fields = ('product__name', 'warehouse__name')
+    list_select_related = ('product', 'warehouse', 'unit')
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        initial = form.initial if change else {}
+        record_movements(admin_stock_movements(obj, initial, reference=f"admin:{request.user.username}"))
+
+    def delete_model(self, request, obj):
+        initial = {'quantity': obj.quantity, 'warehouse': obj.warehouse_id}
+        super().delete_model(request, obj)
+        record_movements(admin_stock_movements(
+            obj, initial, deleted=True, reference=f"admin:{request.user.username}"
+        ))
+
+    def delete_queryset(self, request, queryset):
+        reference = f"admin:{request.user.username}"
+        movements = [
+            movement(s.product_id, s.warehouse_id, -s.quantity, StockMovement.REASON_ADMIN, reference)
+            for s in queryset
+        ]
+        super().delete_queryset(request, queryset)
+        record_movements(movements)
+
+
+@admin.register(StockMovement)
+class StockMovementAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'product', 'warehouse', 'delta', 'reason', 'reference')
+    list_filter = ('reason', 'warehouse')
+    search_fields = ('product__name', 'product__sku', 'reference')
+    date_hierarchy = 'created_at'
+    list_select_related = ('product', 'warehouse')
+
+    # Журнал только на чтение
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(StockSnapshot)
+class StockSnapshotAdmin(admin.ModelAdmin):
+    list_display = ('taken_at', 'product', 'warehouse', 'quantity', 'movement_id')
+    list_filter = ('warehouse',)
+    search_fields = ('product__name', 'product__sku')
+    list_select_related = ('product', 'warehouse')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
 
 
 # -------------------- PriceType / Price Admin --------------------
@@ -165,11 +268,12 @@ class PriceAdmin(ImportExportModelAdmin):
     readonly_fields = ('updated_at',)
     ordering = ('-is_active', '-priority', '-start_date')
     actions = ['activate_selected', 'deactivate_selected']
+    list_select_related = ('product', 'price_type')
 
-    @admin.display(description='Товар')
+    @admin.display(description='Товар', ordering='product__name')
     def product_link(self, obj):
-        url = f"/admin/products/product/{obj.product.id}/change/"
-        return format_html(f'<a href="{url}" style="font-weight:500;">{obj.product.name}</a>')
+        url = f"/admin/products/product/{obj.product_id}/change/"
+        return format_html('<a href="{}" style="font-weight:500;">{}</a>', url, obj.product.name)
 
     @admin.display(description='Цена')
     def value_display(self, obj):
@@ -194,14 +298,24 @@ class PriceAdmin(ImportExportModelAdmin):
             Price.objects.filter(
                 product=obj.product,
                 price_type=obj.price_type
-            ).exclude(pk=obj.pk).update(is_active=False)
+            ).exclude(pk=obj.pk).update(is_active=False, updated_at=timezone.now())
+        Product.objects.filter(pk=obj.product_id).update(changed_locally=True, updated_at=timezone.now())
 
     @admin.action(description='Активировать выбранные')
     def activate_selected(self, request, queryset):
-        updated = queryset.update(is_active=True)
+        updated = queryset.update(is_active=True, updated_at=timezone.now())
+        self._mark_products(queryset)
         self.message_user(request, f'Активировано {updated} цен.')
 
     @admin.action(description='Деактивировать выбранные')
     def deactivate_selected(self, request, queryset):
-        updated = queryset.update(is_active=False)
+        updated = queryset.update(is_active=False, updated_at=timezone.now())
+        self._mark_products(queryset)
         self.message_user(request, f'Деактивировано {updated} цен.')
+
+    @staticmethod
+    def _mark_products(queryset):
+        """Цены товаров изменились — товары уйдут в МойСклад при следующей выгрузке"""
+        Product.objects.filter(pk__in=queryset.values('product_id')).update(
+            changed_locally=True, updated_at=timezone.now()
+        )
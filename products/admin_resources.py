@@ -1,6 +1,8 @@
+from django.utils import timezone
 from import_export import resources, fields
 from import_export.widgets import ForeignKeyWidget, ManyToManyWidget
-from .models import Product, Category, Tag, Unit, Warehouse, Stock, Price, PriceType
+from .models import Product, Category, Tag, Unit, Warehouse, Stock, Price, PriceType, StockMovement
+from .stock_ledger import movement, record_movements
 
 
 class ProductResource(resources.ModelResource):
@@ -41,6 +43,11 @@ class ProductResource(resources.ModelResource):
             "ms_uuid",
         )
 
+    def before_save_instance(self, instance, row, **kwargs):
+        super().before_save_instance(instance, row, **kwargs)
+        # Импортированные правки уходят в МойСклад (manage.py moysklad_push)
+        instance.changed_locally = True
+
 
 class StockResource(resources.ModelResource):
     product = fields.Field(
@@ -64,6 +71,30 @@ class StockResource(resources.ModelResource):
         import_id_fields = ("product", "warehouse")
         fields = ("product", "warehouse", "quantity", "unit")
 
+    def before_import(self, dataset, **kwargs):
+        super().before_import(dataset, **kwargs)
+        self._movements = []
+
+    def before_save_instance(self, instance, row, **kwargs):
+        super().before_save_instance(instance, row, **kwargs)
+        old_qty = 0
+        if instance.pk:
+            old_qty = Stock.objects.filter(pk=instance.pk).values_list("quantity", flat=True).first() or 0
+        instance._old_quantity = old_qty
+
+    def after_save_instance(self, instance, row, **kwargs):
+        super().after_save_instance(instance, row, **kwargs)
+        self._movements.append(movement(
+            instance.product_id, instance.warehouse_id,
+            instance.quantity - instance._old_quantity,
+            StockMovement.REASON_IMPORT, "import:admin",
+        ))
+
+    def after_import(self, dataset, result, **kwargs):
+        super().after_import(dataset, result, **kwargs)
+        # При dry_run транзакция импорта откатывается вместе с журналом
+        record_movements(self._movements)
+
 
 class PriceResource(resources.ModelResource):
     product = fields.Field(
@@ -89,3 +120,9 @@ class PriceResource(resources.ModelResource):
             "priority",
             "updated_at",
         )
+
+    def after_import(self, dataset, result, **kwargs):
+        super().after_import(dataset, result, **kwargs)
+        # Товары с изменёнными ценами уйдут в МойСклад при следующей выгрузке
+        skus = {row.get("product") for row in dataset.dict if row.get("product")}
+        Product.objects.filter(sku__in=skus).update(changed_locally=True, updated_at=timezone.now())
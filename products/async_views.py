@@ -0,0 +1,206 @@
+"""
+Async-версии чтения каталога для ASGI (uvicorn mysite.asgi:application).
+
+Список и карточка товара, категории, типы цен и проверка корзины. Запросы идут
+через async ORM, а пока они ждут БД, процесс обслуживает другие запросы —
+медленный запрос не держит поток воркера. Ответы совпадают с синхронными
+эндпоинтами DRF (те же сериализаторы и параметры), запись остаётся за ними.
+
+Сериализаторы вызываются в цикле событий без запросов к БД: цены товаров
+загружаются заранее (context['prices']), справочники — refcache.aload(),
+фото и теги — prefetch_related.
+
+Аутентификация как у DRF по умолчанию: Authorization: Bearer <jwt>, Token <key>,
+затем сессия (для небезопасных методов с сессией проверяется CSRF).
+"""
+import json
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.http import JsonResponse
+from django.utils.translation import gettext_lazy as _
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework import exceptions
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.utils.encoders import JSONEncoder
+
+from core import db_router
+from users.authentication import StatelessJWTAuthentication
+
+from . import refcache
+from .availability import acheck_availability, cache_key
+from .models import Product, Category, Unit, PriceType, Price
+from .serializers import ProductSerializer, CategorySerializer, PriceTypeSerializer, AvailabilityRequestSerializer
+from .views import ProductViewSet, CategoryViewSet, PriceTypeViewSet
+
+
+# -----------------------------
+# 🔹 Аутентификация и ответы
+# -----------------------------
+async def authenticate(request):
+    """(user, через сессию?) или (None, False). Неверный токен — AuthenticationFailed."""
+    # JWT проверяется без БД — прямо в цикле событий
+    result = StatelessJWTAuthentication().authenticate(request)
+    if result is not None:
+        return result[0], False
+
+    header = request.headers.get('Authorization', '').split()
+    if header and header[0].lower() == 'token':
+        if len(header) != 2:
+            raise exceptions.AuthenticationFailed(_('Invalid token header. No credentials provided.'))
+        try:
+            token = await Token.objects.select_related('user').aget(key=header[1])
+        except Token.DoesNotExist:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        return token.user, False
+
+    user = await request.auser()
+    if user.is_authenticated and user.is_active:
+        return user, True
+    return None, False
+
+
+def respond(data, status=200):
+    return JsonResponse(data, status=status, safe=False, encoder=JSONEncoder, json_dumps_params={'ensure_ascii': False})
+
+
+def error_response(exc):
+    """Ответ на исключение DRF в том же виде, что у rest_framework.views.exception_handler"""
+    data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+    response = respond(data, status=exc.status_code)
+    if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+        response.status_code = 401
+        response['WWW-Authenticate'] = StatelessJWTAuthentication().authenticate_header(None)
+    return response
+
+
+def async_api(view=None, *, replica=False):
+    """
+    Обёртка async-представления: аутентификация (только для вошедших, как
+    IsAuthenticated), ошибки DRF в JSON, чтение с реплики при replica=True.
+    """
+    def decorator(view):
+        @csrf_exempt
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            try:
+                user, via_session = await authenticate(request)
+                if user is None:
+                    raise exceptions.NotAuthenticated()
+                if via_session and request.method not in SAFE_METHODS:
+                    SessionAuthentication().enforce_csrf(request)
+                request.user = user
+                if replica and request.method in SAFE_METHODS and not await db_router.ais_pinned(request, user):
+                    db_router.use_replica()
+                return await view(request, *args, **kwargs)
+            except exceptions.APIException as e:
+                return error_response(e)
+        return wrapper
+
+    return decorator(view) if view is not None else decorator
+
+
+# -----------------------------
+# 🔹 Товары
+# -----------------------------
+def filter_products(queryset, params):
+    """Фильтры, поиск и сортировка ProductViewSet с теми же параметрами запроса"""
+    filters = {field: params[field] for field in ProductViewSet.filterset_fields if params.get(field)}
+    if filters:
+        queryset = queryset.filter(**filters)
+
+    for term in params.get('search', '').replace(',', ' ').split():
+        condition = Q()
+        for field in ProductViewSet.search_fields:
+            condition |= Q(**{f'{field}__icontains': term})
+        queryset = queryset.filter(condition)
+
+    ordering = [
+        field.strip() for field in params.get('ordering', '').split(',')
+        if field.strip().lstrip('-') in ProductViewSet.ordering_fields
+    ]
+    if ordering:
+        queryset = queryset.order_by(*ordering)
+    return queryset
+
+
+async def serialize_products(products, request, many=True):
+    """ProductSerializer без запросов в цикле событий: цены одним запросом, справочники из refcache"""
+    prices = {}
+    async for price in Price.current_prices_query([product.pk for product in products]):
+        prices.setdefault(price.product_id, []).append(price)
+    await refcache.aload(Category, Unit, PriceType)
+
+    serializer = ProductSerializer(
+        products if many else products[0], many=many, context={'request': request, 'prices': prices}
+    )
+    return serializer.data
+
+
+@require_GET
+@async_api(replica=True)
+async def product_list(request):
+    queryset = filter_products(ProductViewSet.queryset.all(), request.GET)
+    products = [product async for product in queryset]
+    return respond(await serialize_products(products, request))
+
+
+@require_GET
+@async_api(replica=True)
+async def product_detail(request, pk):
+    try:
+        product = await ProductViewSet.queryset.aget(pk=pk)
+    except Product.DoesNotExist:
+        raise exceptions.NotFound()
+    return respond(await serialize_products([product], request, many=False))
+
+
+# -----------------------------
+# 🔹 Справочники
+# -----------------------------
+@require_GET
+@async_api(replica=True)
+async def category_list(request):
+    categories = [category async for category in CategoryViewSet.queryset.all()]
+    return respond(CategorySerializer(categories, many=True).data)
+
+
+@require_GET
+@async_api(replica=True)
+async def price_type_list(request):
+    price_types = [price_type async for price_type in PriceTypeViewSet.queryset.all()]
+    return respond(PriceTypeSerializer(price_types, many=True).data)
+
+
+# -----------------------------
+# 🔹 Корзина
+# -----------------------------
+@require_POST
+@async_api
+async def availability(request):
+    """Как AvailabilityView: POST {"items": [...]} -> цены и наличие по строкам"""
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        raise exceptions.ParseError()
+    serializer = AvailabilityRequestSerializer(data=data)
+    serializer.is_valid(raise_exception=True)
+    items = serializer.validated_data['items']
+
+    key = cache_key(items)
+    lines = await cache.aget(key)
+    if lines is None:
+        lines = await acheck_availability(items)
+        await cache.aset(key, lines, settings.AVAILABILITY_CACHE_TIMEOUT)
+
+    return respond({
+        'items': lines,
+        'available': all(line['available'] for line in lines),
+    })
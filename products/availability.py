@@ -0,0 +1,132 @@
+"""
+Цены и остатки для строк корзины за фиксированное число запросов.
+
+Используется эндпоинтом /products/availability/ и оформлением заказа,
+чтобы правила цены и наличия были одинаковыми. acheck_availability — те же
+запросы через async ORM для async-эндпоинта.
+"""
+import hashlib
+import json
+
+from django.db.models import Q
+
+from . import refcache
+from .models import Product, Stock, Price, Warehouse
+
+
+def cache_key(items):
+    """Ключ короткого кэша ответа для одинаковых корзин"""
+    raw = json.dumps(items, sort_keys=True, default=str)
+    return 'availability:' + hashlib.sha1(raw.encode()).hexdigest()
+
+
+def products_query(items):
+    """Активные товары по product_id/sku из строк или None, если искать нечего"""
+    ids = {item['product_id'] for item in items if item.get('product_id')}
+    skus = {item['sku'] for item in items if item.get('sku')}
+    if not ids and not skus:
+        return None
+    return Product.objects.filter(Q(id__in=ids) | Q(sku__in=skus), is_active=True)
+
+
+def load_products(items):
+    """Активные товары по product_id/sku из строк: ({id: Product}, {sku: Product}). Один запрос."""
+    query = products_query(items)
+    return index_products(query if query is not None else [])
+
+
+def index_products(products):
+    by_id, by_sku = {}, {}
+    for product in products:
+        by_id[product.id] = product
+        by_sku[product.sku] = product
+    return by_id, by_sku
+
+
+def stocks_query(product_ids):
+    return Stock.objects.filter(product_id__in=product_ids).order_by('-quantity', 'id')
+
+
+def load_stocks(product_ids):
+    """Остатки по складам: {product_id: [Stock, ...]}. Один запрос."""
+    stocks = {}
+    for stock in stocks_query(product_ids):
+        stocks.setdefault(stock.product_id, []).append(stock)
+    return stocks
+
+
+def pick_stock(stocks, warehouse_id=None):
+    """Строка остатка, с которой будет собираться позиция: указанный склад или склад с наибольшим остатком"""
+    if warehouse_id:
+        return next((s for s in stocks if s.warehouse_id == warehouse_id), None)
+    return stocks[0] if stocks else None
+
+
+def check_availability(items):
+    """
+    items: [{'product_id' | 'sku', 'quantity', 'warehouse_id'?}, ...]
+    Возвращает список строк в том же порядке. Три запроса на любой размер корзины.
+    """
+    by_id, by_sku = load_products(items)
+    product_ids = list(by_id)
+    return build_lines(items, by_id, by_sku, Price.get_current_prices(product_ids), load_stocks(product_ids))
+
+
+async def acheck_availability(items):
+    """check_availability для async-кода: те же три запроса через async ORM"""
+    query = products_query(items)
+    by_id, by_sku = index_products([product async for product in query] if query is not None else [])
+    product_ids = list(by_id)
+
+    prices = {}
+    async for price in Price.current_prices_query(product_ids):
+        prices.setdefault(price.product_id, price)
+    stocks = {}
+    async for stock in stocks_query(product_ids):
+        stocks.setdefault(stock.product_id, []).append(stock)
+
+    await refcache.aload(Warehouse)
+    return build_lines(items, by_id, by_sku, prices, stocks)
+
+
+def build_lines(items, by_id, by_sku, prices, stocks):
+    """Строки ответа по загруженным товарам, ценам ({product_id: Price}) и остаткам — без запросов"""
+    lines = []
+    for item in items:
+        product = by_id.get(item.get('product_id')) or by_sku.get(item.get('sku'))
+        quantity = item.get('quantity', 1)
+        if product is None:
+            lines.append({
+                'product_id': item.get('product_id'),
+                'sku': item.get('sku'),
+                'requested': quantity,
+                'available': False,
+                'error': 'Товар не найден',
+            })
+            continue
+
+        product_stocks = stocks.get(product.id, [])
+        stock = pick_stock(product_stocks, item.get('warehouse_id'))
+        max_quantity = max(stock.quantity, 0) if stock else 0
+
+        price = prices.get(product.id)
+        lines.append({
+            'product_id': product.id,
+            'sku': product.sku,
+            'name': product.name,
+            'requested': quantity,
+            'price': {
+                'value': str(price.value),
+                'price_type_code': price.price_type.code,
+                'currency': 'RUB',
+            } if price else None,
+            'line_total': str(price.value * quantity) if price else None,
+            'warehouses': [
+                {'warehouse_id': s.warehouse_id, 'name': refcache.get(Warehouse, s.warehouse_id).name, 'quantity': s.quantity}
+                for s in product_stocks
+            ],
+            'warehouse_id': stock.warehouse_id if stock else None,
+            'max_quantity': max_quantity,
+            'available': price is not None and max_quantity >= quantity,
+        })
+    return lines
@@ -0,0 +1,187 @@
+"""
+Массовая загрузка фото товаров: zip или пачка файлов multipart.
+
+Привязка к товару по пути: «SKU/любое_имя.jpg», «SKU.jpg» или «SKU--2.jpg»
+(для multipart можно передать sku списком той же длины, что и files).
+
+    1. Каждый файл хешируется (sha256) и проверяется Pillow.
+    2. Тот же файл у того же товара — пропуск; уже лежащий в хранилище у другого
+       товара — переиспользуется без повторной загрузки (с его копиями).
+    3. Новые файлы грузятся в хранилище из пула потоков
+       (PRODUCT_IMAGE_UPLOAD_THREADS) под именем по хешу — повтор безопасен.
+    4. В одной транзакции строки товаров блокируются, ProductImage создаются
+       одним bulk_create; у товара остаётся ровно одно главное фото.
+    5. После коммита копии (image_variants) строятся в фоне.
+"""
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from .image_variants import schedule
+from .imaging import content_hash, inspect_image
+from .models import Product, ProductImage
+
+EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp', 'GIF': 'gif'}
+
+
+class UploadError(ValueError):
+    """Загрузка отклонена целиком (битый архив, превышены лимиты)"""
+
+
+def sku_from_path(path):
+    """'SKU/фото.jpg' -> 'SKU'; 'SKU.jpg', 'SKU--2.jpg' -> 'SKU'"""
+    parts = [part for part in path.replace('\\', '/').split('/') if part]
+    if len(parts) >= 2:
+        return parts[-2].strip()
+    return os.path.splitext(parts[-1])[0].split('--', 1)[0].strip()
+
+
+def _check_limits(entries_count, total):
+    if entries_count > settings.PRODUCT_IMAGE_UPLOAD_MAX_FILES:
+        raise UploadError(f'Больше {settings.PRODUCT_IMAGE_UPLOAD_MAX_FILES} файлов за раз')
+    if total > settings.PRODUCT_IMAGE_UPLOAD_MAX_TOTAL:
+        raise UploadError('Слишком большой объём загрузки')
+
+
+def read_zip(file):
+    """[(sku, имя, байты)] из архива; служебные файлы пропускаются, размеры проверяются до распаковки"""
+    try:
+        archive = zipfile.ZipFile(file)
+    except zipfile.BadZipFile:
+        raise UploadError('Файл не является zip-архивом')
+    with archive:
+        members = [
+            info for info in archive.infolist()
+            if not info.is_dir()
+            and '__MACOSX' not in info.filename
+            and not os.path.basename(info.filename).startswith('.')
+        ]
+        # file_size из заголовка — защита от zip-бомб до чтения
+        _check_limits(len(members), sum(info.file_size for info in members))
+        return [
+            (
+                sku_from_path(info.filename),
+                info.filename,
+                archive.read(info) if info.file_size <= settings.PRODUCT_IMAGE_UPLOAD_MAX_SIZE else None,
+            )
+            for info in members
+        ]
+
+
+def read_files(files, skus=None):
+    """[(sku, имя, байты)] из multipart; skus — явная привязка по порядку файлов"""
+    _check_limits(len(files), sum(f.size for f in files))
+    if skus and len(skus) != len(files):
+        raise UploadError('Число sku не совпадает с числом файлов')
+    return [
+        (
+            (skus[i].strip() if skus else sku_from_path(f.name)),
+            f.name,
+            f.read() if f.size <= settings.PRODUCT_IMAGE_UPLOAD_MAX_SIZE else None,
+        )
+        for i, f in enumerate(files)
+    ]
+
+
+def _store(name, data):
+    # Имя — хеш содержимого: если объект уже есть, он тот же самый
+    if not default_storage.exists(name):
+        name = default_storage.save(name, ContentFile(data))
+    return name
+
+
+def upload_images(entries, set_main=False):
+    """
+    Загружает [(sku, имя, байты)]. set_main — первое новое фото товара становится главным,
+    иначе главным оно становится, только если у товара главного ещё нет.
+    Возвращает {'created': [...], 'skipped': [...], 'errors': [...]}.
+    """
+    created, skipped, errors = [], [], []
+    products = dict(Product.objects.filter(sku__in={sku for sku, _, _ in entries}).values_list('sku', 'pk'))
+
+    files = []  # (product_id, sku, имя, хеш, формат, ширина, высота, байты)
+    for sku, name, data in sorted(entries, key=lambda entry: (entry[0], entry[1])):
+        if sku not in products:
+            errors.append({'file': name, 'error': f'Товар с SKU {sku!r} не найден'})
+            continue
+        if data is None:
+            errors.append({'file': name, 'error': 'Файл больше допустимого размера'})
+            continue
+        try:
+            fmt, width, height = inspect_image(data)
+        except ValueError as e:
+            errors.append({'file': name, 'error': str(e)})
+            continue
+        if fmt not in EXTENSIONS:
+            errors.append({'file': name, 'error': f'Формат {fmt} не поддерживается'})
+            continue
+        files.append((products[sku], sku, name, content_hash(data), fmt, width, height, data))
+
+    # Что уже лежит в хранилище: по хешу — имя файла и готовые копии
+    stored, attached = {}, set()
+    for product_id, digest, image, variants in ProductImage.objects.filter(
+        content_hash__in={f[3] for f in files}
+    ).values_list('product_id', 'content_hash', 'image', 'variants'):
+        stored.setdefault(digest, (image, variants))
+        attached.add((product_id, digest))
+
+    new_files, to_upload = [], {}
+    for f in files:
+        product_id, sku, name, digest = f[:4]
+        if (product_id, digest) in attached:
+            skipped.append({'file': name, 'sku': sku, 'reason': 'Уже загружено'})
+            continue
+        attached.add((product_id, digest))
+        new_files.append(f)
+        if digest not in stored and digest not in to_upload:
+            to_upload[digest] = (f'product_images/{digest[:32]}.{EXTENSIONS[f[4]]}', f[7])
+
+    with ThreadPoolExecutor(max_workers=settings.PRODUCT_IMAGE_UPLOAD_THREADS) as pool:
+        futures = {digest: pool.submit(_store, *args) for digest, args in to_upload.items()}
+        for digest, future in futures.items():
+            try:
+                stored[digest] = (future.result(), [])
+            except Exception as e:
+                stored[digest] = None
+                errors.extend(
+                    {'file': f[2], 'error': f'Ошибка загрузки в хранилище: {e}'}
+                    for f in new_files if f[3] == digest
+                )
+    new_files = [f for f in new_files if stored.get(f[3])]
+    if not new_files:
+        return {'created': created, 'skipped': skipped, 'errors': errors}
+
+    with transaction.atomic():
+        product_ids = {f[0] for f in new_files}
+        # Блокировка товаров: параллельная загрузка не назначит второе главное фото
+        list(Product.objects.select_for_update().filter(pk__in=product_ids).values_list('pk'))
+        with_main = set(
+            ProductImage.objects.filter(product_id__in=product_ids, is_main=True).values_list('product_id', flat=True)
+        )
+
+        images, main_for = [], set()
+        for product_id, sku, name, digest, fmt, width, height, _ in new_files:
+            is_main = product_id not in main_for and (set_main or product_id not in with_main)
+            if is_main:
+                main_for.add(product_id)
+            image_name, variants = stored[digest]
+            images.append(ProductImage(
+                product_id=product_id, image=image_name, is_main=is_main,
+                width=width, height=height, content_hash=digest, variants=variants,
+            ))
+        if set_main:
+            ProductImage.objects.filter(product_id__in=main_for, is_main=True).update(is_main=False)
+        ProductImage.objects.bulk_create(images)
+
+        # Одна сборка на файл: копии общего оригинала получат все его строки (save_result)
+        pending = list({image.image.name: image for image in images if not image.variants}.values())
+        transaction.on_commit(lambda: [schedule(image) for image in pending])
+
+    for image, f in zip(images, new_files):
+        created.append({'id': image.pk, 'sku': f[1], 'file': f[2], 'is_main': image.is_main})
+    return {'created': created, 'skipped': skipped, 'errors': errors}
@@ -0,0 +1,176 @@
+"""
+Уменьшенные копии ProductImage (WebP и JPEG фиксированных ширин для srcset).
+
+Пиксели считаются в пуле процессов (products/imaging.py, Pillow): декодирование
+и ресайз упираются в CPU и GIL. Чтение оригинала и запись копий в хранилище (S3)
+идут в потоках основного процесса, в БД пишет только вызывающий поток.
+
+- при загрузке: сигнал post_save -> transaction.on_commit -> фоновый поток
+  (копии появляются через секунды, до этого сериализатор отдаёт оригинал);
+- для существующих и потерянных при рестарте задач — manage.py build_image_variants.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections
+from django.db.models import Q
+
+from .imaging import content_hash, render_variants
+from .models import ProductImage
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONS = {'webp': 'webp', 'jpeg': 'jpg'}
+
+_lock = threading.Lock()
+_processes = None
+_threads = None
+
+
+def process_pool():
+    """Общий пул процессов (spawn: форк многопоточного веб-процесса небезопасен)"""
+    global _processes
+    with _lock:
+        if _processes is None:
+            _processes = ProcessPoolExecutor(
+                max_workers=settings.PRODUCT_IMAGE_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _processes
+
+
+def _thread_pool():
+    global _threads
+    with _lock:
+        if _threads is None:
+            _threads = ThreadPoolExecutor(max_workers=settings.PRODUCT_IMAGE_WORKERS, thread_name_prefix='image-variants')
+        return _threads
+
+
+def variant_name(image_name, width, fmt):
+    """product_images/foo.png -> product_images/variants/foo_400w.webp"""
+    folder, filename = os.path.split(image_name)
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(folder, 'variants', f'{stem}_{width}w.{EXTENSIONS[fmt]}')
+
+
+def build(image_name, processes=None):
+    """
+    Копии одного оригинала: чтение из хранилища, рендер в пуле процессов, запись копий.
+    К БД не обращается. Возвращает {'width', 'height', 'content_hash', 'variants'} для записи в ProductImage.
+    """
+    with default_storage.open(image_name, 'rb') as f:
+        data = f.read()
+    width, height, rendered = (processes or process_pool()).submit(
+        render_variants, data,
+        settings.PRODUCT_IMAGE_WIDTHS, settings.PRODUCT_IMAGE_FORMATS, settings.PRODUCT_IMAGE_QUALITY,
+    ).result()
+
+    variants = []
+    for variant_width, variant_height, fmt, content in rendered:
+        name = variant_name(image_name, variant_width, fmt)
+        if default_storage.exists(name):
+            default_storage.delete(name)
+        variants.append({
+            'width': variant_width,
+            'height': variant_height,
+            'format': fmt,
+            'name': default_storage.save(name, ContentFile(content)),
+        })
+    return {'width': width, 'height': height, 'content_hash': content_hash(data), 'variants': variants}
+
+
+def delete_files(variants):
+    for variant in variants or ():
+        try:
+            default_storage.delete(variant['name'])
+        except Exception:
+            logger.warning('Не удалось удалить копию %s', variant.get('name'), exc_info=True)
+
+
+def delete_unused(variants, digest=''):
+    """
+    Удаляет копии, на которые больше не ссылается ни одна строка. Оригинал и копии
+    бывают общими у нескольких товаров (image_upload): у таких строк тот же хеш
+    содержимого, без хеша (загружены до его появления) сверяются все строки с копиями.
+    """
+    if not variants:
+        return
+    rows = ProductImage.objects.exclude(variants=[])
+    rows = rows.filter(content_hash=digest) if digest else rows
+    used = {variant['name'] for row_variants in rows.values_list('variants', flat=True) for variant in row_variants}
+    delete_files([variant for variant in variants if variant['name'] not in used])
+
+
+def save_result(image_id, image_name, result):
+    """
+    Пишет копии в строку image_id и во все строки без копий с тем же оригиналом.
+    Если оригинал заменили, пока копии считались, и на него никто не ссылается — копии удаляются.
+    """
+    updated = ProductImage.objects.filter(Q(pk=image_id) | Q(variants=[]), image=image_name).update(**result)
+    if not updated and not ProductImage.objects.filter(image=image_name).exists():
+        delete_files(result['variants'])
+    return updated
+
+
+def _build_in_background(image_id, image_name):
+    try:
+        save_result(image_id, image_name, build(image_name))
+    except Exception:
+        logger.exception('Не удалось построить копии изображения #%s', image_id)
+    finally:
+        close_old_connections()
+
+
+def schedule(image):
+    """
+    Построить копии в фоне (вызывается после коммита загрузки). Один вызов на оригинал:
+    save_result раздаст копии всем строкам с тем же файлом.
+    """
+    _thread_pool().submit(_build_in_background, image.pk, image.image.name)
+
+
+def backfill(queryset=None, batch_size=50, log=None):
+    """
+    Копии для изображений без них: пачками, чтение/запись файлов — в потоках,
+    рендер — в пуле процессов, в БД пишет только текущий поток. Возвращает число изображений.
+    """
+    log = log or (lambda message: None)
+    if queryset is None:
+        # Изображения не шире самой узкой копии не уменьшаются; без хеша — загружены до его появления
+        queryset = ProductImage.objects.filter(
+            Q(variants=[], width__isnull=True)
+            | Q(variants=[], width__gt=min(settings.PRODUCT_IMAGE_WIDTHS))
+            | Q(content_hash='')
+        )
+    processes = process_pool()
+    done, last_pk = 0, 0
+    with ThreadPoolExecutor(max_workers=settings.PRODUCT_IMAGE_WORKERS * 2) as threads:
+        while True:
+            batch = list(
+                queryset.filter(pk__gt=last_pk).exclude(image='')
+                .order_by('pk').values_list('pk', 'image')[:batch_size]
+            )
+            if not batch:
+                break
+            last_pk = batch[-1][0]
+            # Общий оригинал строится один раз: параллельные build() писали бы в одни и те же имена копий
+            first = {}
+            for pk, name in batch:
+                first.setdefault(name, pk)
+            futures = {name: threads.submit(build, name, processes) for name in first}
+            for name, pk in first.items():
+                try:
+                    result = futures[name].result()
+                except Exception as e:
+                    log(f'#{pk} {name}: {e}')
+                    continue
+                done += save_result(pk, name, result)
+            log(f'Обработано: {done}')
+    return done
@@ -0,0 +1,103 @@
+"""
+Уменьшенные копии изображений на чистом Pillow.
+
+Модуль не импортирует Django: render_variants выполняется в дочерних процессах
+ProcessPoolExecutor (см. products/image_variants.py) и получает/возвращает байты.
+"""
+import hashlib
+import io
+
+from PIL import Image, ImageOps
+
+ORIENTATION_TAG = 0x0112
+
+SAVE_OPTIONS = {
+    'webp': {'format': 'WEBP', 'method': 4},
+    'jpeg': {'format': 'JPEG', 'optimize': True, 'progressive': True},
+}
+
+
+def _flatten(image, background=(255, 255, 255)):
+    """RGB без прозрачности (для JPEG): прозрачное — на белый фон"""
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        flat = Image.new('RGB', image.size, background)
+        flat.paste(image, mask=image.getchannel('A'))
+        return flat
+    return image.convert('RGB')
+
+
+def _oriented_size(image):
+    """Размер с учётом EXIF-поворота (ориентации 5–8 меняют ширину и высоту местами)"""
+    width, height = image.size
+    if image.getexif().get(ORIENTATION_TAG) in (5, 6, 7, 8):
+        return height, width
+    return width, height
+
+
+def image_size(file):
+    """Размер изображения из файла или байтов (читается только заголовок)"""
+    if isinstance(file, bytes):
+        file = io.BytesIO(file)
+    position = file.tell()
+    try:
+        with Image.open(file) as image:
+            return _oriented_size(image)
+    finally:
+        file.seek(position)
+
+
+def inspect_image(data):
+    """(формат Pillow, ширина, высота) для байтов; ValueError, если это не изображение"""
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image.verify()
+        with Image.open(io.BytesIO(data)) as image:
+            return (image.format, *_oriented_size(image))
+    except (OSError, SyntaxError, Image.DecompressionBombError) as e:
+        raise ValueError(f'не изображение: {e}')
+
+
+def content_hash(file):
+    """sha256 содержимого файла или байтов (позиция файла сохраняется)"""
+    if isinstance(file, bytes):
+        return hashlib.sha256(file).hexdigest()
+    position = file.tell()
+    file.seek(0)
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: file.read(1 << 16), b''):
+        digest.update(chunk)
+    file.seek(position)
+    return digest.hexdigest()
+
+
+def render_variants(data, widths, formats, quality=80):
+    """
+    Копии оригинала (байты) шириной из widths в форматах formats.
+    Ширины не больше оригинала (без увеличения). Возвращает
+    (width, height, [(ширина, высота, формат, байты), ...]) — размер оригинала и копии.
+    """
+    image = Image.open(io.BytesIO(data))
+    width, height = _oriented_size(image)
+    targets = sorted({w for w in widths if w < width}, reverse=True)
+    if not targets:
+        return width, height, []
+
+    # JPEG декодируется сразу в уменьшенном масштабе (1/2, 1/4, 1/8), если его хватает для самой широкой копии
+    request = (targets[0], targets[0] * height // width)
+    image.draft('RGB', request if image.size == (width, height) else request[::-1])
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+
+    results = []
+    for target in targets:
+        size = (target, max(1, round(height * target / width)))
+        # Следующая копия уменьшается из предыдущей — дешевле, чем каждый раз из оригинала
+        image = image.resize(size, Image.LANCZOS, reducing_gap=3.0)
+        for fmt in formats:
+            out = io.BytesIO()
+            frame = image if fmt == 'webp' else _flatten(image)
+            frame.save(out, quality=quality, **SAVE_OPTIONS[fmt])
+            results.append((size[0], size[1], fmt, out.getvalue()))
+    return width, height, results
@@ -0,0 +1,140 @@
+import argparse
+import socketserver
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import get_internal_wsgi_application
+from rest_framework.authtoken.models import Token
+
+# Один и тот же ответ: синхронный DRF-эндпоинт и его async-версия
+ENDPOINTS = {
+    'products': ('/products/products/', '/products/async/products/'),
+    'categories': ('/products/categories/', '/products/async/categories/'),
+    'price-types': ('/products/price-types/', '/products/async/price-types/'),
+}
+
+
+class PooledWSGIServer(socketserver.ThreadingMixIn, WSGIServer):
+    """WSGI-процесс с фиксированным числом потоков, как gunicorn --threads N"""
+    request_queue_size = 2048
+    pool = None
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self.process_request_thread, request, client_address)
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Конкурентность одного процесса: синхронный эндпоинт каталога под WSGI (--threads потоков) '
+        'против async-версии под uvicorn (один воркер). Серверы запускаются на localhost на время замера. '
+        'Выигрыш async виден, когда запросы ждут БД по сети; на локальной SQLite цикл событий даёт лишь накладные расходы.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--endpoint', choices=sorted(ENDPOINTS), default='products')
+        parser.add_argument('--requests', type=int, default=500, help='Запросов на каждый сервер')
+        parser.add_argument('--concurrency', type=int, default=64, help='Одновременных клиентов')
+        parser.add_argument('--threads', type=int, default=4, help='Потоков WSGI-процесса')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--username', default='benchmark', help='Пользователь для токена (создаётся при отсутствии)')
+        parser.add_argument('--serve-wsgi', action='store_true', help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        port = options['port']
+        if options['serve_wsgi']:
+            return self.serve_wsgi(port, options['threads'])
+
+        try:
+            import uvicorn  # noqa: F401
+        except ImportError:
+            raise CommandError('Нужен uvicorn: pip install uvicorn')
+
+        user, _ = get_user_model().objects.get_or_create(username=options['username'])
+        token, _ = Token.objects.get_or_create(user=user)
+        sync_path, async_path = ENDPOINTS[options['endpoint']]
+        manage = str(settings.BASE_DIR / 'manage.py')
+        servers = [
+            (f'WSGI, {options["threads"]} потока', sync_path,
+             [sys.executable, manage, 'benchmark_asgi', '--serve-wsgi', '--port', str(port),
+              '--threads', str(options['threads'])]),
+            ('ASGI uvicorn, 1 воркер', async_path,
+             [sys.executable, '-m', 'uvicorn', 'mysite.asgi:application', '--port', str(port),
+              '--workers', '1', '--log-level', 'warning', '--no-access-log']),
+        ]
+
+        results = []
+        for label, path, command in servers:
+            url = f'http://localhost:{port}{path}'
+            process = subprocess.Popen(command)
+            try:
+                self.wait_ready(url, token.key)
+                results.append((label, path, self.load(url, token.key, options['requests'], options['concurrency'])))
+            finally:
+                process.terminate()
+                process.wait()
+
+        self.stdout.write(
+            f'{options["requests"]} запросов, {options["concurrency"]} клиентов одновременно\n'
+            f'{"сервер":<24} {"эндпоинт":<28} {"запр/с":>8} {"p50 мс":>8} {"p95 мс":>8} {"ошибок":>7}'
+        )
+        for label, path, (rps, p50, p95, errors) in results:
+            self.stdout.write(f'{label:<24} {path:<28} {rps:8.1f} {p50:8.1f} {p95:8.1f} {errors:7}')
+        wsgi_rps, asgi_rps = results[0][2][0], results[1][2][0]
+        self.stdout.write(self.style.SUCCESS(f'ASGI / WSGI: x{asgi_rps / wsgi_rps:.2f} по пропускной способности'))
+
+    def serve_wsgi(self, port, threads):
+        server = PooledWSGIServer(('localhost', port), QuietHandler)
+        server.pool = ThreadPoolExecutor(threads)
+        server.set_app(get_internal_wsgi_application())
+        server.serve_forever()
+
+    def wait_ready(self, url, token, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                self.fetch(url, token)
+                return
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.2)
+        raise CommandError(f'Сервер не ответил за {timeout} сек: {url}')
+
+    @staticmethod
+    def fetch(url, token):
+        request = urllib.request.Request(url, headers={'Authorization': f'Token {token}'})
+        with urllib.request.urlopen(request, timeout=60) as response:
+            response.read()
+
+    def load(self, url, token, count, concurrency):
+        """(запросов в секунду, p50 мс, p95 мс, ошибок)"""
+        def one(_):
+            started = time.perf_counter()
+            try:
+                self.fetch(url, token)
+            except (urllib.error.URLError, ConnectionError, TimeoutError):
+                return None
+            return (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            timings = list(pool.map(one, range(count)))
+        elapsed = time.perf_counter() - started
+
+        ok = sorted(t for t in timings if t is not None)
+        if not ok:
+            raise CommandError(f'Все запросы к {url} завершились ошибкой')
+        p95 = ok[min(len(ok) - 1, int(len(ok) * 0.95))]
+        return len(ok) / elapsed, statistics.median(ok), p95, count - len(ok)
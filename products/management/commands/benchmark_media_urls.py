@@ -0,0 +1,46 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+
+from products.media_urls import media_url, public_base
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает стоимость ссылок на фото: storage.url() S3 (подпись SigV4) + build_absolute_uri '
+        'против products.media_urls. Сеть не нужна: подпись считается локально.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=5000, help='Ссылок в замере')
+
+    def handle(self, *args, **options):
+        from storages.backends.s3boto3 import S3Boto3Storage
+
+        count = options['count']
+        # Без ключей в окружении подпись всё равно считается — берём фиктивные
+        storage = S3Boto3Storage(
+            access_key=settings.AWS_ACCESS_KEY_ID or 'benchmark',
+            secret_key=settings.AWS_SECRET_ACCESS_KEY or 'benchmark',
+            bucket_name=settings.AWS_STORAGE_BUCKET_NAME or 'benchmark',
+        )
+        names = [f'product_images/photo_{i}.jpg' for i in range(count)]
+        version = 'a' * 64
+        storage.url(names[0])  # клиент boto3 создаётся лениво — не включаем в замер
+
+        def run(label, build):
+            request = RequestFactory().get('/products/')
+            started = time.perf_counter()
+            for name in names:
+                build(name, request)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f'{label:<38} {elapsed * 1000:9.1f} мс  {elapsed / count * 1e6:8.1f} мкс/ссылка')
+            return elapsed
+
+        signed = run('storage.url + build_absolute_uri', lambda name, request: request.build_absolute_uri(storage.url(name)))
+        public_base(storage)
+        built = run('media_url (публичная, ?v=)', lambda name, request: media_url(name, version, request, storage))
+        self.stdout.write(self.style.SUCCESS(f'Ускорение: x{signed / built:.0f} на {count} ссылках'))
+        self.stdout.write(f'Пример: {media_url(names[0], version, storage=storage)}')
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from products.image_variants import backfill
+from products.models import ProductImage
+
+
+class Command(BaseCommand):
+    help = (
+        'Строит уменьшенные копии (WebP/JPEG, PRODUCT_IMAGE_WIDTHS) для фото товаров без них. '
+        '--all перестраивает все (например, после смены ширин или качества).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Перестроить копии всех изображений')
+        parser.add_argument('--batch-size', type=int, default=50, help='Изображений за пачку')
+
+    def handle(self, *args, **options):
+        queryset = ProductImage.objects.all() if options['all'] else None
+        done = backfill(queryset, batch_size=options['batch_size'], log=self.stdout.write)
+        self.stdout.write(self.style.SUCCESS(f'Готово изображений: {done}'))
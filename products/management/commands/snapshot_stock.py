@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from products.stock_ledger import take_snapshots
+
+
+class Command(BaseCommand):
+    help = 'Снапшот остатков по журналу движений (запускать по расписанию, например раз в час)'
+
+    def handle(self, *args, **options):
+        created = take_snapshots()
+        self.stdout.write(self.style.SUCCESS(f'Создано снапшотов: {created}'))
@@ -0,0 +1,84 @@
+"""
+Дешёвые ссылки на медиа товаров.
+
+storage.url() у S3Boto3Storage на каждый файл считает подписанную ссылку
+(SigV4: HMAC-цепочка + сборка запроса boto3) — на странице каталога это сотни
+вызовов. Фото товаров лежат в публично читаемых префиксах бакета
+(settings.MEDIA_PUBLIC_PREFIXES), поэтому ссылка на них — просто строка:
+
+    <база>/<имя файла>?v=<хеш содержимого>
+
+База вычисляется один раз: MEDIA_CDN_URL, если задан, иначе адрес бакета
+(path-style, как в AWS_S3_ADDRESSING_STYLE) или MEDIA_URL локального хранилища.
+?v= меняется вместе с содержимым — CDN и браузеры кешируют надолго без риска
+отдать старое фото после перезаливки под тем же именем.
+Файлы вне публичных префиксов по-прежнему получают подписанную ссылку хранилища.
+"""
+from functools import lru_cache
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+
+@lru_cache(maxsize=None)
+def public_base(storage):
+    """Префикс публичных ссылок для хранилища (с завершающим /)"""
+    if settings.MEDIA_CDN_URL:
+        base = settings.MEDIA_CDN_URL
+    elif getattr(storage, 'bucket_name', None):
+        # S3: ссылка без подписи, как у storage.url() при querystring_auth=False
+        if storage.custom_domain:
+            base = f'{storage.url_protocol}//{storage.custom_domain}/'
+        else:
+            base = f"{storage.endpoint_url.rstrip('/')}/{storage.bucket_name}/"
+        if storage.location:
+            base += storage.location.strip('/') + '/'
+    else:
+        base = storage.url('')
+    return base if base.endswith('/') else base + '/'
+
+
+@receiver(setting_changed)
+def _reset_base(**kwargs):
+    public_base.cache_clear()
+
+
+def is_public(name):
+    return name.startswith(tuple(settings.MEDIA_PUBLIC_PREFIXES))
+
+
+def media_url(name, version='', request=None, storage=None):
+    """
+    Ссылка на файл хранилища. Публичные — строкой от закешированной базы
+    (version -> ?v=), остальные — storage.url() (подпись). Относительные
+    ссылки (локальное хранилище) с request становятся абсолютными.
+    """
+    if not name:
+        return None
+    storage = storage or default_storage
+    if not is_public(name):
+        url = storage.url(name)
+    else:
+        url = public_base(storage) + quote(name.replace('\\', '/'), safe="/~!*()'")
+        if version:
+            url += f'?v={version[:12]}'
+    if request is not None and url.startswith('/'):
+        url = _origin(request) + url
+    return url
+
+
+def _origin(request):
+    """scheme://host запроса — один раз на запрос, а не build_absolute_uri на каждую ссылку"""
+    if not hasattr(request, '_media_origin'):
+        request._media_origin = request.build_absolute_uri('/')[:-1]
+    return request._media_origin
+
+
+def image_url(image, name=None, request=None):
+    """Ссылка на оригинал ProductImage или его копию (name) с версией по хешу содержимого"""
+    if not image.image:
+        return None
+    return media_url(name or image.image.name, image.content_hash, request, image.image.storage)
@@ -0,0 +1,81 @@
+# Generated by Django 5.0.3 on 2026-10-18 23:44
+
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+from django.db import migrations, models
+
+
+def opening_snapshots(apps, schema_editor):
+    """Начальные снапшоты из текущих остатков, чтобы журнал начинался с верного баланса"""
+    Stock = apps.get_model('products', 'Stock')
+    StockSnapshot = apps.get_model('products', 'StockSnapshot')
+    now = django.utils.timezone.now()
+    StockSnapshot.objects.bulk_create(
+        [
+            StockSnapshot(
+                product_id=s.product_id,
+                warehouse_id=s.warehouse_id,
+                quantity=s.quantity,
+                movement_id=0,
+                taken_at=now,
+            )
+            for s in Stock.objects.all().iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_pricetype_code_alter_pricetype_ms_uuid_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='sku',
+            field=models.CharField(default=uuid.uuid4, max_length=255, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='slug',
+            field=models.SlugField(max_length=255, unique=True),
+        ),
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('delta', models.IntegerField(verbose_name='Изменение')),
+                ('reason', models.CharField(choices=[('import', 'Импорт'), ('order_confirm', 'Подтверждение заказа'), ('order_cancel', 'Отмена заказа'), ('admin', 'Ручная правка'), ('sync', 'Синхронизация')], max_length=20, verbose_name='Причина')),
+                ('reference', models.CharField(blank=True, max_length=255, verbose_name='Источник')),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Время')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_movements', to='products.product')),
+                ('warehouse', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_movements', to='products.warehouse')),
+            ],
+            options={
+                'verbose_name': 'Движение остатка',
+                'verbose_name_plural': 'Движения остатков',
+                'ordering': ['-id'],
+                'indexes': [models.Index(fields=['product', 'warehouse', 'id'], name='products_st_product_9c88b6_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.IntegerField()),
+                ('movement_id', models.BigIntegerField(default=0)),
+                ('taken_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_snapshots', to='products.product')),
+                ('warehouse', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_snapshots', to='products.warehouse')),
+            ],
+            options={
+                'verbose_name': 'Снапшот остатка',
+                'verbose_name_plural': 'Снапшоты остатков',
+                'indexes': [models.Index(fields=['product', 'warehouse', 'movement_id'], name='products_st_product_14865a_idx'), models.Index(fields=['taken_at'], name='products_st_taken_a_00ea05_idx')],
+            },
+        ),
+        migrations.RunPython(opening_snapshots, migrations.RunPython.noop),
+    ]
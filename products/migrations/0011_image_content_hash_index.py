@@ -0,0 +1,18 @@
+# Generated by Django 5.0.3 on 2026-10-19 00:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0010_image_content_hash'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='productimage',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=64),
+        ),
+    ]
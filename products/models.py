@@ -2,8 +2,22 @@ import uuid
 
 from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 
+from .imaging import content_hash, image_size
+
+
+def stock_total_subquery(product_ref='pk'):
+    """Сумма остатков товара по всем складам как подзапрос (для annotate/update)"""
+    totals = (
+        Stock.objects.filter(product_id=models.OuterRef(product_ref))
+        .values('product_id')
+        .annotate(total=models.Sum('quantity'))
+        .values('total')
+    )
+    return Coalesce(models.Subquery(totals), 0)
+
 
 class Category(models.Model):
     name = models.CharField(max_length=255)
@@ -65,6 +79,11 @@ class Product(models.Model):
     def __str__(self):
         return self.name
 
+    @classmethod
+    def refresh_stock_cache(cls, product_ids):
+        """Пересчитать stock_cache для набора товаров одним UPDATE"""
+        return cls.objects.filter(pk__in=product_ids).update(stock_cache=stock_total_subquery())
+
 
 class ProductImage(models.Model):
     product = models.ForeignKey('products.Product', on_delete=models.CASCADE, related_name='images')
@@ -72,9 +91,29 @@ class ProductImage(models.Model):
     alt_text = models.CharField(max_length=255, blank=True)
     is_main = models.BooleanField(default=False)
 
+    # Размеры оригинала — при загрузке (не через width_field: тот читает файл
+    # из хранилища при каждой загрузке модели, пока поля пустые)
+    width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    # Уменьшенные копии: [{"width", "height", "format", "name"}], см. products/image_variants.py
+    variants = models.JSONField(default=list, blank=True, editable=False)
+    # sha256 содержимого: версия в ссылке (?v=) для сброса кеша CDN при перезаливке под тем же именем
+    content_hash = models.CharField(max_length=64, blank=True, editable=False, db_index=True)
+
     def __str__(self):
         return f"Image for {self.product.name}"
 
+    def save(self, *args, **kwargs):
+        # Новый файл: размеры читаются из заголовка загрузки, старые копии больше не годятся
+        self._image_uploaded = bool(self.image) and not self.image._committed
+        if self._image_uploaded:
+            self.width, self.height = image_size(self.image.file)
+            # Хеш прежнего файла — по нему ищутся строки, у которых те же копии
+            self._stale_hash = self.content_hash
+            self.content_hash = content_hash(self.image.file)
+            self._stale_variants, self.variants = self.variants, []
+        super().save(*args, **kwargs)
+
 
 class Warehouse(models.Model):
     name = models.CharField(max_length=255)
@@ -186,11 +225,10 @@ class Price(models.Model):
         )
 
     @classmethod
-    def get_current_price(cls, product, price_type=None):
-        """Возвращает актуальную цену для товара (учитывает приоритет, даты и тип цены)"""
+    def current(cls, price_type=None):
+        """Цены, действующие сейчас (активные и попадающие в период)"""
         now = timezone.now()
         qs = cls.objects.filter(
-            product=product,
             is_active=True,
             start_date__lte=now
         ).filter(
@@ -200,5 +238,106 @@ class Price(models.Model):
         if price_type:
             qs = qs.filter(price_type=price_type)
 
-        return qs.order_by('-priority', '-start_date').first()
-    
\ No newline at end of file
+        return qs
+
+    @classmethod
+    def get_current_price(cls, product, price_type=None):
+        """Возвращает актуальную цену для товара (учитывает приоритет, даты и тип цены)"""
+        return cls.current(price_type).filter(product=product).order_by('-priority', '-start_date').first()
+
+    @classmethod
+    def get_current_prices(cls, products, price_type=None):
+        """
+        Актуальные цены для набора товаров одним запросом.
+        Правила те же, что у get_current_price. Возвращает {product_id: Price}.
+        """
+        prices = {}
+        for price in cls.current_prices_query(products, price_type):
+            prices.setdefault(price.product_id, price)
+        return prices
+
+    @classmethod
+    def current_prices_query(cls, products, price_type=None):
+        """Действующие цены набора товаров: по товару, затем по убыванию приоритета и даты"""
+        return (
+            cls.current(price_type).filter(product__in=products).select_related('price_type')
+            .order_by('product_id', '-priority', '-start_date')
+        )
+    
+
+class StockMovement(models.Model):
+    """Журнал движений остатков (append-only): каждое изменение Stock.quantity"""
+
+    REASON_IMPORT = 'import'
+    REASON_ORDER_CONFIRM = 'order_confirm'
+    REASON_ORDER_CANCEL = 'order_cancel'
+    REASON_ADMIN = 'admin'
+    REASON_SYNC = 'sync'
+
+    REASON_CHOICES = [
+        (REASON_IMPORT, 'Импорт'),
+        (REASON_ORDER_CONFIRM, 'Подтверждение заказа'),
+        (REASON_ORDER_CANCEL, 'Отмена заказа'),
+        (REASON_ADMIN, 'Ручная правка'),
+        (REASON_SYNC, 'Синхронизация'),
+    ]
+
+    product = models.ForeignKey('products.Product', on_delete=models.CASCADE, related_name='stock_movements')
+    warehouse = models.ForeignKey('products.Warehouse', on_delete=models.CASCADE, related_name='stock_movements')
+    delta = models.IntegerField(verbose_name='Изменение')
+    reason = models.CharField(max_length=20, choices=REASON_CHOICES, verbose_name='Причина')
+    # Ссылка на источник: "order:15", "import:<файл>", "admin:<username>"
+    reference = models.CharField(max_length=255, blank=True, verbose_name='Источник')
+    created_at = models.DateTimeField(default=timezone.now, db_index=True, verbose_name='Время')
+
+    class Meta:
+        verbose_name = 'Движение остатка'
+        verbose_name_plural = 'Движения остатков'
+        ordering = ['-id']
+        indexes = [
+            models.Index(fields=['product', 'warehouse', 'id']),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id}@{self.warehouse_id}: {self.delta:+d} ({self.reason})"
+
+
+class StockSnapshot(models.Model):
+    """
+    Снапшот остатка по паре (товар, склад).
+    Учитывает все движения с id <= movement_id; остаток на момент времени
+    считается как снапшот + хвост движений после него.
+    """
+    product = models.ForeignKey('products.Product', on_delete=models.CASCADE, related_name='stock_snapshots')
+    warehouse = models.ForeignKey('products.Warehouse', on_delete=models.CASCADE, related_name='stock_snapshots')
+    quantity = models.IntegerField()
+    movement_id = models.BigIntegerField(default=0)
+    taken_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = 'Снапшот остатка'
+        verbose_name_plural = 'Снапшоты остатков'
+        indexes = [
+            models.Index(fields=['product', 'warehouse', 'movement_id']),
+            models.Index(fields=['taken_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id}@{self.warehouse_id}: {self.quantity} на {self.taken_at:%Y-%m-%d %H:%M}"
+
+
+class ReferenceVersion(models.Model):
+    """
+    Версия справочника (Unit, PriceType, Category, Tag, Warehouse) для кеша в памяти
+    процессов (products/refcache.py): любое изменение справочника увеличивает version,
+    процессы сверяют версии и перечитывают устаревшие таблицы.
+    """
+    name = models.CharField(max_length=100, unique=True, verbose_name='Справочник')
+    version = models.PositiveBigIntegerField(default=0, verbose_name='Версия')
+
+    class Meta:
+        verbose_name = 'Версия справочника'
+        verbose_name_plural = 'Версии справочников'
+
+    def __str__(self):
+        return f"{self.name} v{self.version}"
@@ -0,0 +1,151 @@
+"""
+Кеш справочников в памяти процесса: Unit, PriceType, Category, Tag, Warehouse.
+
+Таблицы крошечные и меняются редко, а читаются на каждой строке импорта,
+каждом заказе и каждом сериализованном товаре. Таблица загружается целиком
+одним запросом и индексируется по id, ms_uuid и естественным ключам (code/slug/name).
+
+Инвалидация — версия в БД (ReferenceVersion):
+- post_save/post_delete справочника (и массовые записи синхронизации) вызывают bump():
+  version + 1 в БД и сброс таблицы в своём процессе;
+- остальные процессы сверяют версии не чаще раза в REFERENCE_CACHE_CHECK_INTERVAL
+  секунд (один запрос на все справочники) и перечитывают изменившиеся.
+Между сверками поиск идёт без запросов к БД; промах get() по id сверяет версию
+справочника сразу (FK указывает на строку, которой кеш ещё не видел).
+
+Версия читается до строк: если между ними кто-то закоммитит изменение, при следующей
+сверке версия не совпадёт и таблица перечитается. Откат транзакции, в которой
+справочник менялся, тоже виден как расхождение версий.
+
+Возвращаемые объекты общие для всех потоков — только для чтения.
+
+Async-код (products/async_views.py) сначала вызывает aload(): таблицы загружаются
+и версии сверяются в потоке, а get/lookup в цикле событий к БД не ходят.
+"""
+import asyncio
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import F
+
+from .models import Unit, PriceType, Category, Tag, Warehouse, ReferenceVersion
+
+# Модель -> поля-ключи для lookup (кроме id)
+MODELS = {
+    Unit: ('code', 'ms_uuid', 'name'),
+    PriceType: ('code', 'ms_uuid', 'name'),
+    Category: ('slug', 'ms_uuid', 'name'),
+    Tag: ('slug', 'ms_uuid', 'name'),
+    Warehouse: ('ms_uuid', 'name'),
+}
+
+
+class _Table:
+    def __init__(self, version, rows, fields):
+        self.version = version
+        self.by_id = {row.pk: row for row in rows}
+        self.by = {field: {} for field in fields}
+        for row in rows:
+            for field in fields:
+                value = getattr(row, field)
+                if value not in (None, ''):
+                    # Имена не уникальны — побеждает строка с меньшим id
+                    self.by[field].setdefault(value, row)
+
+
+_tables = {}
+_lock = threading.Lock()
+_checked_at = 0.0
+
+
+def _label(model):
+    return model._meta.label_lower
+
+
+def _in_event_loop():
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def _check_versions():
+    global _checked_at
+    now = time.monotonic()
+    # В цикле событий синхронный запрос запрещён — сверка была в aload()
+    if now - _checked_at < settings.REFERENCE_CACHE_CHECK_INTERVAL or _in_event_loop():
+        return
+    _checked_at = now
+    versions = dict(ReferenceVersion.objects.values_list('name', 'version'))
+    for label, table in list(_tables.items()):
+        if versions.get(label, 0) != table.version:
+            _tables.pop(label, None)
+
+
+def table(model):
+    _check_versions()
+    label = _label(model)
+    cached = _tables.get(label)
+    if cached is None:
+        with _lock:
+            cached = _tables.get(label)
+            if cached is None:
+                version = ReferenceVersion.objects.filter(name=label).values_list('version', flat=True).first() or 0
+                cached = _tables[label] = _Table(version, list(model.objects.order_by('pk')), MODELS[model])
+    return cached
+
+
+def _refresh(model):
+    """Сверить версию одного справочника сейчас, не дожидаясь интервала"""
+    label = _label(model)
+    cached = _tables.get(label)
+    version = ReferenceVersion.objects.filter(name=label).values_list('version', flat=True).first() or 0
+    if cached is not None and cached.version != version:
+        _tables.pop(label, None)
+
+
+def get(model, pk):
+    """
+    Строка справочника по id или None. Промах по id — не повод отвечать None:
+    строку мог добавить другой процесс после последней сверки. Тогда версия
+    сверяется сразу, а если она ещё не поднята — строка читается из БД одна.
+    """
+    if pk is None:
+        return None
+    row = table(model).by_id.get(pk)
+    if row is None and not _in_event_loop():
+        _refresh(model)
+        row = table(model).by_id.get(pk)
+        if row is None:
+            row = model.objects.filter(pk=pk).first()
+    return row
+
+
+def lookup(model, field, value):
+    """Строка справочника по ключу (code, slug, ms_uuid, name) или None"""
+    return table(model).by[field].get(value)
+
+
+async def aload(*models):
+    """Сверка версий и загрузка таблиц из async-кода (в потоке)"""
+    await sync_to_async(lambda: [table(model) for model in models])()
+
+
+def bump(*models):
+    """Справочники изменились: новая версия в БД и сброс таблиц этого процесса"""
+    for model in models:
+        label = _label(model)
+        if not ReferenceVersion.objects.filter(name=label).update(version=F('version') + 1):
+            ReferenceVersion.objects.get_or_create(name=label)
+            ReferenceVersion.objects.filter(name=label).update(version=F('version') + 1)
+        _tables.pop(label, None)
+
+
+def clear():
+    """Сбросить кеш процесса целиком (тесты, отладка)"""
+    global _checked_at
+    _tables.clear()
+    _checked_at = 0.0
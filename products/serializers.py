@@ -1,30 +1,57 @@
 from django.utils import timezone
 from rest_framework import serializers
+from . import refcache
+from .media_urls import image_url
 from .models import Product, Category, Tag, ProductImage, Unit, PriceType, Price
 from django.db import models
 
 
+class RefField(serializers.Field):
+    """
+    Справочник по id из кеша процесса (refcache) вместо join/запроса:
+    RefField(Category, source='category_id') -> str(категории), attr='code' -> её код.
+    """
+
+    def __init__(self, model, attr=None, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+        self.model = model
+        self.attr = attr
+
+    def to_representation(self, pk):
+        row = refcache.get(self.model, pk)
+        if row is None:
+            return None
+        return getattr(row, self.attr) if self.attr else str(row)
+
+
 class ProductImageSerializer(serializers.ModelSerializer):
     image = serializers.SerializerMethodField()
+    srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = ProductImage
-        fields = ['id', 'image', 'alt_text', 'is_main']
+        fields = ['id', 'image', 'width', 'height', 'srcset', 'alt_text', 'is_main']
 
     def get_image(self, obj):
-        if not obj.image:
-            return None
-        request = self.context.get('request')
-        url = obj.image.url
-        if request:
-            return request.build_absolute_uri(url)
-        return url
+        return image_url(obj, request=self.context.get('request'))
+
+    def get_srcset(self, obj):
+        """
+        {'webp': '<url> 200w, <url> 400w', 'jpeg': '...'} — готовые значения для srcset.
+        Пока копии не построены — пустой словарь, клиент берёт image.
+        """
+        srcset = {}
+        for variant in sorted(obj.variants, key=lambda v: v['width']):
+            url = image_url(obj, variant['name'], request=self.context.get('request'))
+            srcset.setdefault(variant['format'], []).append(f"{url} {variant['width']}w")
+        return {fmt: ', '.join(items) for fmt, items in srcset.items()}
 
 
 class ProductPriceSerializer(serializers.ModelSerializer):
     """Сериализатор для цен товара"""
-    price_type = serializers.StringRelatedField()
-    price_type_code = serializers.CharField(source='price_type.code')
+    price_type = RefField(PriceType, source='price_type_id')
+    price_type_code = RefField(PriceType, attr='code', source='price_type_id')
 
     class Meta:
         model = Price
@@ -37,11 +64,11 @@ class ProductPriceSerializer(serializers.ModelSerializer):
 class ProductSerializer(serializers.ModelSerializer):
     images = ProductImageSerializer(many=True, read_only=True)
     tags = serializers.StringRelatedField(many=True)
-    category = serializers.StringRelatedField()
-    category_id = serializers.PrimaryKeyRelatedField(source='category', read_only=True)
+    category = RefField(Category, source='category_id')
+    category_id = serializers.IntegerField(read_only=True)
 
-    unit = serializers.StringRelatedField()
-    unit_id = serializers.PrimaryKeyRelatedField(source='unit', read_only=True)
+    unit = RefField(Unit, source='unit_id')
+    unit_id = serializers.IntegerField(read_only=True)
 
     # Добавляем поля для цен
     current_price = serializers.SerializerMethodField()
@@ -59,32 +86,55 @@ class ProductSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ('synced_at', 'changed_locally', 'stock_cache')
 
+    def preloaded_prices(self, obj):
+        """
+        Действующие цены товара из context['prices'] ({product_id: [Price, ...]} по убыванию
+        приоритета и даты) — так сериализатор работает без запросов, в том числе из async-кода.
+        None — цены не переданы, читаем из БД.
+        """
+        prices = self.context.get('prices')
+        return None if prices is None else prices.get(obj.pk, [])
+
     def get_current_price(self, obj):
         """Получить основную актуальную цену"""
-        price = Price.get_current_price(obj)
+        prices = self.preloaded_prices(obj)
+        if prices is None:
+            price = Price.get_current_price(obj)
+        else:
+            price = prices[0] if prices else None
         if price:
+            price_type = refcache.get(PriceType, price.price_type_id)
             return {
                 'value': str(price.value),
-                'price_type': price.price_type.name,
-                'price_type_code': price.price_type.code,
+                'price_type': price_type.name,
+                'price_type_code': price_type.code,
                 'currency': 'RUB'
             }
         return None
 
     def get_all_prices(self, obj):
         """Получить все актуальные цены по типам"""
+        prices = self.preloaded_prices(obj)
+        if prices is not None:
+            return ProductPriceSerializer(prices, many=True).data
+
         now = timezone.now()
         prices = obj.prices.filter(
             is_active=True,
             start_date__lte=now
         ).filter(
             models.Q(end_date__isnull=True) | models.Q(end_date__gte=now)
-        ).select_related('price_type')
+        )
 
         return ProductPriceSerializer(prices, many=True).data
 
     def get_price_types_available(self, obj):
         """Получить доступные типы цен для товара"""
+        prices = self.preloaded_prices(obj)
+        if prices is not None:
+            price_types = [refcache.get(PriceType, pk) for pk in sorted({p.price_type_id for p in prices})]
+            return [{'code': pt.code, 'name': pt.name} for pt in price_types]
+
         now = timezone.now()
         price_types = PriceType.objects.filter(
             prices__product=obj,
@@ -111,3 +161,20 @@ class PriceTypeSerializer(serializers.ModelSerializer):
 
 
 
+
+
+class AvailabilityItemSerializer(serializers.Serializer):
+    product_id = serializers.IntegerField(required=False)
+    sku = serializers.CharField(required=False)
+    quantity = serializers.IntegerField(min_value=1, default=1)
+    warehouse_id = serializers.IntegerField(required=False)
+
+    def validate(self, attrs):
+        if not attrs.get('product_id') and not attrs.get('sku'):
+            raise serializers.ValidationError('Нужно указать product_id или sku.')
+        return attrs
+
+
+class AvailabilityRequestSerializer(serializers.Serializer):
+    """Строки корзины для проверки цен и наличия"""
+    items = AvailabilityItemSerializer(many=True, allow_empty=False, max_length=200)
@@ -1,8 +1,11 @@
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
+from django.db import transaction
 from django.db.models import Sum
 
-from .models import Stock, Product
+from . import refcache
+from .image_variants import delete_unused, schedule
+from .models import Stock, Product, ProductImage
 
 
 @receiver(post_save, sender=Stock)
@@ -12,3 +15,29 @@ def update_product_stock_cache(sender, instance, **kwargs):
     total = product.stocks.aggregate(total=Sum('quantity'))['total'] or 0
     product.stock_cache = total
     product.save(update_fields=['stock_cache'])
+
+
+@receiver(post_save, sender=ProductImage)
+def build_image_variants(sender, instance, created, raw=False, **kwargs):
+    # Новый файл — копии строятся в фоне после коммита; старые удаляются, если они
+    # не общие с другими строками (тот же файл у нескольких товаров — см. image_upload)
+    if raw or not getattr(instance, '_image_uploaded', False):
+        return
+    stale, digest = getattr(instance, '_stale_variants', None), getattr(instance, '_stale_hash', '')
+    transaction.on_commit(lambda: (delete_unused(stale, digest), schedule(instance)))
+
+
+@receiver(post_delete, sender=ProductImage)
+def delete_image_variants(sender, instance, **kwargs):
+    # Файл (и копии) может быть общим у нескольких товаров — см. image_upload
+    if instance.variants and not ProductImage.objects.filter(image=instance.image.name).exists():
+        transaction.on_commit(lambda: delete_unused(instance.variants, instance.content_hash))
+
+
+def bump_reference_version(sender, **kwargs):
+    refcache.bump(sender)
+
+
+for _model in refcache.MODELS:
+    post_save.connect(bump_reference_version, sender=_model, dispatch_uid=f'refcache-save-{_model.__name__}')
+    post_delete.connect(bump_reference_version, sender=_model, dispatch_uid=f'refcache-delete-{_model.__name__}')
@@ -0,0 +1,196 @@
+"""
+Журнал движений остатков и снапшоты.
+
+Любое изменение Stock.quantity сопровождается строкой StockMovement.
+Остаток на любой момент считается как последний снапшот + хвост движений
+после него, без суммирования всей истории.
+"""
+from django.db import connection, transaction
+from django.db.models import Max, OuterRef, Subquery, Sum, F, Case, When, Value, IntegerField
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Product, Stock, StockMovement, StockSnapshot
+
+
+# Ключ advisory-блокировки журнала (PostgreSQL). Запись движений держит её
+# в разделяемом режиме до конца своей транзакции, снапшот берёт исключительно:
+# так id, выданный транзакции, которая ещё не закоммитилась, не окажется ниже
+# границы снапшота. Время создания для границы не годится — created_at ставится
+# при создании объекта, а не при коммите.
+LEDGER_LOCK = 7_260_026
+
+
+def movement(product_id, warehouse_id, delta, reason, reference=''):
+    """Несохранённая строка журнала (для record_movements)"""
+    return StockMovement(
+        product_id=product_id,
+        warehouse_id=warehouse_id,
+        delta=delta,
+        reason=reason,
+        reference=reference,
+    )
+
+
+def record_movements(movements):
+    """
+    Записывает пачку движений одним INSERT, пропуская нулевые.
+    Вызывать в той же транзакции, что и изменение Stock.
+    """
+    movements = [m for m in movements if m.delta]
+    if movements:
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT pg_advisory_xact_lock_shared(%s)', [LEDGER_LOCK])
+            StockMovement.objects.bulk_create(movements)
+    return movements
+
+
+def committed_watermark():
+    """
+    Наибольший id движения, ниже которого все движения закоммичены.
+    В PostgreSQL ждёт завершения транзакций, пишущих журнал (LEDGER_LOCK);
+    в SQLite запись и так идёт по одной транзакции, id выдаются по порядку коммитов.
+    """
+    if connection.vendor != 'postgresql':
+        return StockMovement.objects.aggregate(m=Max('id'))['m']
+    with connection.cursor() as cursor:
+        # Сессионная блокировка только на чтение границы: запись ждёт миллисекунды,
+        # а не весь пересчёт снапшотов
+        cursor.execute('SELECT pg_advisory_lock(%s)', [LEDGER_LOCK])
+        try:
+            # READ COMMITTED: каждый запрос видит всё, что закоммичено до его начала
+            return StockMovement.objects.aggregate(m=Max('id'))['m']
+        finally:
+            cursor.execute('SELECT pg_advisory_unlock(%s)', [LEDGER_LOCK])
+
+
+def apply_stock_deltas(deltas, refresh_cache=True):
+    """
+    Применяет изменения остатков {Stock: delta} одним UPDATE
+    и пересчитывает stock_cache затронутых товаров одним UPDATE
+    (refresh_cache=False — пересчёт делает вызывающий код).
+    Журнал движений пишет вызывающий код (record_movements).
+    """
+    deltas = {stock: delta for stock, delta in deltas.items() if delta}
+    if not deltas:
+        return 0
+
+    updated = Stock.objects.filter(pk__in=[stock.pk for stock in deltas]).update(
+        quantity=F('quantity') + Case(
+            *[When(pk=stock.pk, then=Value(delta)) for stock, delta in deltas.items()],
+            default=Value(0),
+            output_field=IntegerField(),
+        ),
+        updated_at=timezone.now(),
+    )
+    if refresh_cache:
+        Product.refresh_stock_cache({stock.product_id for stock in deltas})
+    return updated
+
+
+def _snapshots(at=None, upto_movement_id=None):
+    """Снапшоты, сделанные до момента at, от новых к старым"""
+    qs = StockSnapshot.objects.all()
+    if at is not None:
+        qs = qs.filter(taken_at__lte=at)
+    if upto_movement_id is not None:
+        qs = qs.filter(movement_id__lte=upto_movement_id)
+    return qs.order_by('-movement_id', '-id')
+
+
+def _latest_snapshots(at=None, upto_movement_id=None):
+    """Подзапрос: последний снапшот для пары (товар, склад) из OuterRef"""
+    return _snapshots(at, upto_movement_id).filter(
+        product_id=OuterRef('product_id'),
+        warehouse_id=OuterRef('warehouse_id'),
+    )
+
+
+def balances(product_ids=None, at=None, upto_movement_id=None):
+    """
+    Остатки по парам (товар, склад) из снапшотов и хвоста движений.
+    Возвращает {(product_id, warehouse_id): quantity}. Два запроса.
+    """
+    latest = _latest_snapshots(at, upto_movement_id)
+
+    snapshots = StockSnapshot.objects.filter(pk=Subquery(latest.values('pk')[:1]))
+    movements = StockMovement.objects.all()
+    if product_ids is not None:
+        snapshots = snapshots.filter(product_id__in=product_ids)
+        movements = movements.filter(product_id__in=product_ids)
+    if at is not None:
+        movements = movements.filter(created_at__lte=at)
+    if upto_movement_id is not None:
+        movements = movements.filter(id__lte=upto_movement_id)
+
+    result = {
+        (s['product_id'], s['warehouse_id']): s['quantity']
+        for s in snapshots.values('product_id', 'warehouse_id', 'quantity')
+    }
+
+    tail = (
+        movements
+        .annotate(base_id=Coalesce(Subquery(latest.values('movement_id')[:1]), 0))
+        .filter(id__gt=F('base_id'))
+        .values('product_id', 'warehouse_id')
+        .annotate(total=Sum('delta'))
+        .order_by()
+    )
+    for row in tail:
+        key = (row['product_id'], row['warehouse_id'])
+        result[key] = result.get(key, 0) + row['total']
+
+    return result
+
+
+def quantity_at(product_id, warehouse_id, at=None):
+    """Остаток пары (товар, склад) на момент at (по умолчанию — текущий)"""
+    latest = _snapshots(at).filter(
+        product_id=product_id, warehouse_id=warehouse_id
+    ).values('quantity', 'movement_id').first()
+    base, base_id = (latest['quantity'], latest['movement_id']) if latest else (0, 0)
+
+    movements = StockMovement.objects.filter(
+        product_id=product_id, warehouse_id=warehouse_id, id__gt=base_id
+    )
+    if at is not None:
+        movements = movements.filter(created_at__lte=at)
+    return base + (movements.aggregate(total=Sum('delta'))['total'] or 0)
+
+
+@transaction.atomic
+def take_snapshots():
+    """
+    Снапшот для пар, по которым были движения после предыдущего прогона.
+    Граница — committed_watermark(). Возвращает количество созданных снапшотов.
+    """
+    now = timezone.now()
+    watermark = committed_watermark()
+    previous = StockSnapshot.objects.aggregate(m=Max('movement_id'))['m'] or 0
+    if watermark is None or watermark <= previous:
+        return 0
+
+    changed = set(
+        StockMovement.objects.filter(id__gt=previous, id__lte=watermark)
+        .values_list('product_id', 'warehouse_id')
+        .distinct()
+    )
+    if not changed:
+        return 0
+
+    product_ids = {product_id for product_id, _ in changed}
+    current = balances(product_ids, upto_movement_id=watermark)
+
+    StockSnapshot.objects.bulk_create([
+        StockSnapshot(
+            product_id=product_id,
+            warehouse_id=warehouse_id,
+            quantity=current.get((product_id, warehouse_id), 0),
+            movement_id=watermark,
+            taken_at=now,
+        )
+        for product_id, warehouse_id in changed
+    ])
+    return len(changed)
@@ -1,3 +1,549 @@
-from django.test import TestCase
+import io
+import os
+import shutil
+import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from rest_framework.authtoken.models import Token
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+
+from . import image_variants, refcache, stock_ledger
+from .availability import check_availability
+from .media_urls import image_url
+from .models import Category, Unit, Product, ProductImage, ReferenceVersion, PriceType, Price, Tag, Warehouse, Stock, \
+    StockMovement, StockSnapshot
+
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+
+def photo(color, size=(640, 480), fmt='JPEG'):
+    buf = io.BytesIO()
+    Image.new('RGB', size, color).save(buf, fmt)
+    return buf.getvalue()
+
+
+def make_zip(files):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w') as archive:
+        for name, data in files.items():
+            archive.writestr(name, data)
+    buf.seek(0)
+    return SimpleUploadedFile('photos.zip', buf.getvalue(), 'application/zip')
+
+
+class ProductImageBulkUploadTests(TestCase):
+    def setUp(self):
+        # Локальное файловое хранилище вместо S3, своё на каждый тест
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        storage = override_settings(STORAGES=STORAGES, MEDIA_ROOT=self.media_root)
+        storage.enable()
+        self.addCleanup(storage.disable)
+
+        admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'pass')
+        self.client.force_login(admin)
+        category = Category.objects.create(name='Рыба', slug='fish')
+        unit = Unit.objects.create(code='pcs', name='шт')
+        self.trout = Product.objects.create(name='Форель', slug='trout', sku='A-1', category=category, unit=unit)
+        self.salmon = Product.objects.create(name='Сёмга', slug='salmon', sku='A-2', category=category, unit=unit)
+        self.url = reverse('product-images-bulk-upload')
+
+    def upload(self, **data):
+        return self.client.post(self.url, data)
+
+    def stored_files(self):
+        folder = os.path.join(self.media_root, 'product_images')
+        return sorted(os.listdir(folder)) if os.path.isdir(folder) else []
+
+    def test_zip_upload_maps_skus_dedups_and_sets_one_main(self):
+        red, blue = photo('red'), photo('blue')
+        response = self.upload(archive=make_zip({
+            'A-1/1.jpg': red,
+            'A-1/2.jpg': blue,
+            'A-1/copy.jpg': red,   # тот же файл у того же товара
+            'A-2.jpg': red,        # тот же файл у другого товара — без повторной загрузки
+            'B-9/x.jpg': red,      # нет такого товара
+            'A-2--2.jpg': b'not an image',
+        }))
+
+        self.assertEqual(response.status_code, 201)
+        body = response.json()
+        self.assertEqual(len(body['created']), 3)
+        self.assertEqual([s['file'] for s in body['skipped']], ['A-1/copy.jpg'])
+        self.assertEqual(len(body['errors']), 2)
+
+        self.assertEqual(len(self.stored_files()), 2)
+        self.assertEqual(self.trout.images.filter(is_main=True).count(), 1)
+        self.assertEqual(self.salmon.images.filter(is_main=True).count(), 1)
+        image = self.trout.images.get(is_main=True)
+        self.assertEqual((image.width, image.height), (640, 480))
+        self.assertEqual(len(image.content_hash), 64)
+
+        # Повторная загрузка того же архива ничего не создаёт
+        again = self.upload(archive=make_zip({'A-1/1.jpg': red, 'A-1/2.jpg': blue})).json()
+        self.assertEqual((len(again['created']), len(again['skipped'])), (0, 2))
+        self.assertEqual(ProductImage.objects.count(), 3)
+
+    def test_shared_file_is_built_once(self):
+        with mock.patch('products.image_upload.schedule') as schedule, self.captureOnCommitCallbacks(execute=True):
+            self.upload(archive=make_zip({'A-1/1.jpg': photo('red'), 'A-2.jpg': photo('red')}))
+
+        self.assertEqual(ProductImage.objects.count(), 2)
+        self.assertEqual(schedule.call_count, 1)
+
+    def test_existing_main_is_kept_unless_set_main(self):
+        self.upload(archive=make_zip({'A-1/1.jpg': photo('red')}))
+        first = self.trout.images.get()
+
+        self.upload(archive=make_zip({'A-1/2.jpg': photo('green')}))
+        self.assertEqual(list(self.trout.images.filter(is_main=True)), [first])
+
+        self.upload(archive=make_zip({'A-1/3.jpg': photo('blue')}), set_main='1')
+        main = self.trout.images.get(is_main=True)
+        self.assertNotEqual(main, first)
+        self.assertEqual(self.trout.images.count(), 3)
+
+    def test_multipart_files_with_explicit_skus(self):
+        response = self.client.post(self.url, {
+            'files': [
+                SimpleUploadedFile('IMG_1.png', photo('red', fmt='PNG'), 'image/png'),
+                SimpleUploadedFile('IMG_2.jpg', photo('blue'), 'image/jpeg'),
+            ],
+            'sku': ['A-1', 'A-2'],
+        })
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.trout.images.get().image.name.rsplit('.', 1)[-1], 'png')
+        self.assertTrue(self.salmon.images.get().is_main)
+
+    def test_rejects_non_admin_and_bad_archive(self):
+        self.assertEqual(self.upload(archive=SimpleUploadedFile('x.zip', b'garbage')).status_code, 400)
+        self.client.logout()
+        self.assertEqual(self.upload(archive=make_zip({'A-1/1.jpg': photo('red')})).status_code, 401)
+
+
+@override_settings(REFERENCE_CACHE_CHECK_INTERVAL=60)
+@override_settings(PRODUCT_IMAGE_WIDTHS=(200, 400, 800), PRODUCT_IMAGE_FORMATS=('webp', 'jpeg'))
+class ProductImageVariantTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        storage = override_settings(STORAGES=STORAGES, MEDIA_ROOT=self.media_root)
+        storage.enable()
+        self.addCleanup(storage.disable)
+
+        category = Category.objects.create(name='Рыба', slug='fish')
+        unit = Unit.objects.create(code='pcs', name='шт')
+        product = Product.objects.create(name='Форель', slug='trout', sku='A-1', category=category, unit=unit)
+        self.salmon = Product.objects.create(name='Сёмга', slug='salmon', sku='A-2', category=category, unit=unit)
+        self.image = ProductImage.objects.create(
+            product=product, image=SimpleUploadedFile('trout.jpg', photo('red'), 'image/jpeg'),
+        )
+        # Рендер в потоке: тот же render_variants без запуска процессов
+        self.pool = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(self.pool.shutdown)
+
+    def test_variants_are_built_at_configured_widths(self):
+        result = image_variants.build(self.image.image.name, self.pool)
+        image_variants.save_result(self.image.pk, self.image.image.name, result)
+
+        self.image.refresh_from_db()
+        # 800 шире оригинала (640) — не увеличивается
+        self.assertEqual(
+            sorted((v['width'], v['height'], v['format']) for v in self.image.variants),
+            [(200, 150, 'jpeg'), (200, 150, 'webp'), (400, 300, 'jpeg'), (400, 300, 'webp')],
+        )
+        for variant in self.image.variants:
+            self.assertTrue(default_storage.exists(variant['name']))
+            with default_storage.open(variant['name']) as f:
+                self.assertEqual(Image.open(f).size, (variant['width'], variant['height']))
+        self.assertEqual(
+            image_variants.variant_name('product_images/trout.jpg', 400, 'jpeg'), 'product_images/variants/trout_400w.jpg'
+        )
+
+    def test_replaced_original_discards_variants(self):
+        name = self.image.image.name
+        result = image_variants.build(name, self.pool)
+        # Пока копии считались, оригинал заменили
+        self.image.image = SimpleUploadedFile('other.jpg', photo('blue'), 'image/jpeg')
+        self.image.save()
+
+        self.assertEqual(image_variants.save_result(self.image.pk, name, result), 0)
+        for variant in result['variants']:
+            self.assertFalse(default_storage.exists(variant['name']))
+
+    def shared(self):
+        """Второй товар с тем же файлом — как после массовой загрузки одного фото на два SKU"""
+        return ProductImage.objects.create(
+            product=self.salmon, image=self.image.image.name, content_hash=self.image.content_hash,
+        )
+
+    def replace(self, image, color):
+        image.image = SimpleUploadedFile(f'{color}.jpg', photo(color), 'image/jpeg')
+        with mock.patch('products.signals.schedule'), self.captureOnCommitCallbacks(execute=True):
+            image.save()
+
+    def test_replacing_shared_image_keeps_variants_of_other_rows(self):
+        other = self.shared()
+        result = image_variants.build(self.image.image.name, self.pool)
+        # Одна сборка заполняет все строки с этим оригиналом
+        self.assertEqual(image_variants.save_result(self.image.pk, self.image.image.name, result), 2)
+        self.image.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(other.variants, self.image.variants)
+
+        self.replace(self.image, 'blue')
+        for variant in other.variants:
+            self.assertTrue(default_storage.exists(variant['name']))
+
+        # Последняя строка с этими копиями заменила файл — копии больше не нужны
+        self.replace(other, 'green')
+        for variant in result['variants']:
+            self.assertFalse(default_storage.exists(variant['name']))
+
+    def test_replaced_shared_original_gives_variants_to_other_rows(self):
+        other = self.shared()
+        name = self.image.image.name
+        result = image_variants.build(name, self.pool)
+        self.replace(self.image, 'blue')
+
+        self.assertEqual(image_variants.save_result(self.image.pk, name, result), 1)
+        other.refresh_from_db()
+        self.assertEqual(len(other.variants), 4)
+        for variant in other.variants:
+            self.assertTrue(default_storage.exists(variant['name']))
+
+
+class MediaUrlTests(TestCase):
+    def setUp(self):
+        self.image = ProductImage(image='product_images/trout.jpg', content_hash='ab' * 32)
+        self.request = RequestFactory().get('/api/products/', )
+
+    @override_settings(MEDIA_CDN_URL='https://cdn.example.com/media')
+    def test_cdn_url_is_absolute_with_version(self):
+        url = 'https://cdn.example.com/media/product_images/variants/trout_400w.webp?v=abababababab'
+        self.assertEqual(image_url(self.image, 'product_images/variants/trout_400w.webp'), url)
+        self.assertEqual(image_url(self.image, 'product_images/variants/trout_400w.webp', request=self.request), url)
+
+    @override_settings(MEDIA_CDN_URL='', STORAGES=STORAGES, MEDIA_URL='/media/')
+    def test_local_storage_url_is_made_absolute_with_request(self):
+        self.assertEqual(image_url(self.image), '/media/product_images/trout.jpg?v=abababababab')
+        self.assertEqual(
+            image_url(self.image, request=self.request), 'http://testserver/media/product_images/trout.jpg?v=abababababab'
+        )
+
+    @override_settings(
+        MEDIA_CDN_URL='', AWS_STORAGE_BUCKET_NAME='bench', AWS_ACCESS_KEY_ID='x', AWS_SECRET_ACCESS_KEY='x',
+        STORAGES={**STORAGES, 'default': {'BACKEND': 'storages.backends.s3boto3.S3Boto3Storage'}},
+    )
+    def test_bucket_url_is_unsigned(self):
+        url = 'https://storage.yandexcloud.net/bench/product_images/trout.jpg?v=abababababab'
+        self.assertEqual(image_url(self.image), url)
+        self.assertEqual(image_url(self.image, request=self.request), url)
+
+
+class ReferenceCacheTests(TestCase):
+    def setUp(self):
+        refcache.clear()
+        self.addCleanup(refcache.clear)
+        self.fish = Category.objects.create(name='Рыба', slug='fish')
+
+    def test_lookups_hit_memory_after_first_load(self):
+        self.assertEqual(refcache.get(Category, self.fish.pk).name, 'Рыба')
+        with self.assertNumQueries(0):
+            self.assertEqual(refcache.lookup(Category, 'slug', 'fish').pk, self.fish.pk)
+            self.assertIsNone(refcache.lookup(Category, 'name', 'Икра'))
+
+    def test_local_save_invalidates_immediately(self):
+        refcache.get(Category, self.fish.pk)
+        self.fish.name = 'Рыба охлаждённая'
+        self.fish.save()
+        self.assertEqual(refcache.get(Category, self.fish.pk).name, 'Рыба охлаждённая')
+
+    def test_other_process_change_is_seen_after_version_check(self):
+        refcache.get(Category, self.fish.pk)
+        # Другой процесс: строка и версия меняются в БД в обход сигналов этого процесса
+        Category.objects.filter(pk=self.fish.pk).update(name='Икра')
+        ReferenceVersion.objects.filter(name='products.category').update(version=999)
+        self.assertEqual(refcache.get(Category, self.fish.pk).name, 'Рыба')
+
+        with override_settings(REFERENCE_CACHE_CHECK_INTERVAL=0):
+            self.assertEqual(refcache.get(Category, self.fish.pk).name, 'Икра')
+
+
+    def test_row_added_by_other_process_is_found_by_id(self):
+        refcache.get(Category, self.fish.pk)
+        # Другой процесс: новая строка и новая версия, сверка по интервалу ещё не наступила
+        caviar, = Category.objects.bulk_create([Category(name='Икра', slug='caviar')])
+        ReferenceVersion.objects.update_or_create(name='products.category', defaults={'version': 999})
+
+        self.assertEqual(refcache.get(Category, caviar.pk).name, 'Икра')
+        with self.assertNumQueries(0):
+            self.assertEqual(refcache.lookup(Category, 'slug', 'caviar').pk, caviar.pk)
+
+    def test_row_added_before_version_bump_is_read_from_db(self):
+        refcache.get(Category, self.fish.pk)
+        caviar, = Category.objects.bulk_create([Category(name='Икра', slug='caviar')])
+
+        self.assertEqual(refcache.get(Category, caviar.pk).name, 'Икра')
+        self.assertIsNone(refcache.get(Category, caviar.pk + 1))
+
+class AsyncCatalogTests(TestCase):
+    """Async-эндпоинты отдают то же, что синхронные DRF"""
+
+    def setUp(self):
+        refcache.clear()
+        self.addCleanup(refcache.clear)
+        user = get_user_model().objects.create_user('buyer')
+        token = Token.objects.create(user=user).key
+        self.auth = {'HTTP_AUTHORIZATION': f'Token {token}'}
+        self.async_auth = {'headers': {'Authorization': f'Token {token}'}}
+
+        fish = Category.objects.create(name='Рыба', slug='fish')
+        kg = Unit.objects.create(code='kg', name='кг')
+        retail = PriceType.objects.create(name='Розничная', code='retail')
+        sale = PriceType.objects.create(name='Акция', code='sale')
+        chilled = Tag.objects.create(name='Охлаждённая', slug='chilled')
+        store = Warehouse.objects.create(name='Основной')
+        for number in range(3):
+            product = Product.objects.create(
+                name=f'Форель {number}', slug=f'trout-{number}', sku=f'T-{number}', category=fish, unit=kg,
+            )
+            product.tags.add(chilled)
+            Price.objects.create(product=product, price_type=retail, value=1000 + number)
+            if number:
+                Price.objects.create(product=product, price_type=sale, value=900, priority=1)
+            Stock.objects.create(product=product, warehouse=store, quantity=number, unit=kg)
+        self.product = product
+
+    def assertSameJson(self, sync_url, async_url):
+        expected = self.client.get(sync_url, **self.auth)
+        self.assertEqual(expected.status_code, 200)
+        response = self.client.get(async_url, **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), expected.json())
+
+    def test_responses_match_sync_endpoints(self):
+        self.assertSameJson('/products/products/', reverse('async-product-list'))
+        self.assertSameJson('/products/products/?ordering=-name&search=форель', reverse('async-product-list') + '?ordering=-name&search=форель')
+        self.assertSameJson('/products/products/?prices__price_type__code=sale', reverse('async-product-list') + '?prices__price_type__code=sale')
+        self.assertSameJson(f'/products/products/{self.product.pk}/', reverse('async-product-detail', args=[self.product.pk]))
+        self.assertSameJson('/products/categories/', reverse('async-category-list'))
+        self.assertSameJson('/products/price-types/', reverse('async-pricetype-list'))
+
+    def test_product_list_query_count_does_not_grow(self):
+        # Справочники грузятся один раз на процесс
+        self.client.get(reverse('async-product-list'), **self.auth)
+        # токен, товары, фото, теги, цены
+        with self.assertNumQueries(5):
+            self.client.get(reverse('async-product-list'), **self.auth)
+
+    async def test_availability(self):
+        body = {'items': [{'sku': 'T-2', 'quantity': 2}, {'sku': 'T-9'}]}
+        response = await self.async_client.post(
+            reverse('async-availability'), body, content_type='application/json', **self.async_auth
+        )
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertTrue(data['items'][0]['available'])
+        self.assertEqual(data['items'][0]['price']['price_type_code'], 'sale')
+        self.assertEqual(data['items'][0]['warehouses'][0]['name'], 'Основной')
+        self.assertFalse(data['available'])
+
+    async def test_requires_authentication(self):
+        response = await self.async_client.get(reverse('async-product-list'))
+        self.assertEqual(response.status_code, 401)
+        response = await self.async_client.get(reverse('async-product-list'), headers={'Authorization': 'Token nope'})
+        self.assertEqual(response.status_code, 401)
+        response = await self.async_client.get(reverse('async-product-detail', args=[999]), **self.async_auth)
+        self.assertEqual(response.status_code, 404)
+
+
+class StockLedgerTests(TestCase):
+    """Журнал движений сходится с Stock.quantity; снапшот + хвост = остаток"""
+
+    CSV_HEADER = 'SKU,Название,Описание,Категория,Теги,Единица,Активен,Происхождение,Срок годности,Цена (базовая),Склад,Остаток\n'
+
+    def setUp(self):
+        refcache.clear()
+        self.addCleanup(refcache.clear)
+        # Импорт стоит 30 токенов, а id админа повторяется от теста к тесту — ведро с чистого листа
+        cache.clear()
+        self.addCleanup(cache.clear)
+        admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'pass')
+        self.client.force_login(admin)
+        self.kg = Unit.objects.create(code='kg', name='кг')
+        self.store = Warehouse.objects.create(name='Основной')
+        fish = Category.objects.create(name='Рыба', slug='fish')
+        self.trout = Product.objects.create(name='Форель', slug='trout', sku='T-1', category=fish, unit=self.kg)
+
+    def import_rows(self, *rows):
+        body = self.CSV_HEADER + ''.join(
+            f'{sku},Товар {sku},-,Рыба,рыба,kg,1,Россия,2030-01-01,100,{warehouse},{qty}\n'
+            for sku, warehouse, qty in rows
+        )
+        file = SimpleUploadedFile('stock.csv', body.encode(), 'text/csv')
+        response = self.client.post(reverse('product-import'), {'file': file})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['errors'], [])
+
+    def assertLedgerMatchesStock(self):
+        expected = {
+            (s.product_id, s.warehouse_id): s.quantity
+            for s in Stock.objects.all()
+        }
+        self.assertEqual({k: v for k, v in stock_ledger.balances().items() if v or k in expected}, expected)
+        for (product_id, warehouse_id), quantity in expected.items():
+            self.assertEqual(stock_ledger.quantity_at(product_id, warehouse_id), quantity)
+
+    def test_import_writes_movements_with_stock(self):
+        self.import_rows(('T-1', 'Основной', 10), ('N-1', 'Дальний', 4))
+        self.import_rows(('T-1', 'Основной', 7))
+
+        deltas = list(
+            StockMovement.objects.filter(product=self.trout).order_by('id').values_list('delta', 'reason')
+        )
+        self.assertEqual(deltas, [(10, 'import'), (-3, 'import')])
+        self.assertLedgerMatchesStock()
+
+    def test_snapshot_plus_tail_equals_stock(self):
+        stock = Stock.objects.create(product=self.trout, warehouse=self.store, quantity=0, unit=self.kg)
+        for delta in (5, 3):
+            stock_ledger.apply_stock_deltas({stock: delta})
+            stock_ledger.record_movements([
+                stock_ledger.movement(self.trout.pk, self.store.pk, delta, StockMovement.REASON_ADMIN)
+            ])
+
+        # Граница — закоммиченный id, а не возраст движения: свежие движения тоже в снапшоте
+        self.assertEqual(stock_ledger.take_snapshots(), 1)
+        snapshot = StockSnapshot.objects.get()
+        self.assertEqual(snapshot.quantity, 8)
+        self.assertEqual(snapshot.movement_id, StockMovement.objects.latest('id').pk)
+        self.assertEqual(stock_ledger.take_snapshots(), 0)
+
+        stock_ledger.apply_stock_deltas({stock: -2})
+        stock_ledger.record_movements([
+            stock_ledger.movement(self.trout.pk, self.store.pk, -2, StockMovement.REASON_ADMIN)
+        ])
+        self.assertLedgerMatchesStock()
+        self.assertEqual(stock_ledger.take_snapshots(), 1)
+        self.assertEqual(StockSnapshot.objects.latest('movement_id').quantity, 6)
+        self.assertLedgerMatchesStock()
+
+
+class AvailabilityTests(TestCase):
+    def setUp(self):
+        refcache.clear()
+        self.addCleanup(refcache.clear)
+        user = get_user_model().objects.create_user('buyer')
+        self.client.force_login(user)
+        fish = Category.objects.create(name='Рыба', slug='fish')
+        kg = Unit.objects.create(code='kg', name='кг')
+        retail = PriceType.objects.create(name='Розничная', code='retail')
+        sale = PriceType.objects.create(name='Акция', code='sale')
+        self.main = Warehouse.objects.create(name='Основной')
+        self.far = Warehouse.objects.create(name='Дальний')
+        self.products = []
+        for number in range(10):
+            product = Product.objects.create(
+                name=f'Форель {number}', slug=f'trout-{number}', sku=f'T-{number}', category=fish, unit=kg,
+            )
+            Price.objects.create(product=product, price_type=retail, value=100 + number)
+            Stock.objects.create(product=product, warehouse=self.main, quantity=5, unit=kg)
+            Stock.objects.create(product=product, warehouse=self.far, quantity=2, unit=kg)
+            self.products.append(product)
+        Price.objects.create(product=self.products[1], price_type=sale, value=50, priority=1)
+
+    def test_mixed_lines(self):
+        trout, salmon = self.products[:2]
+        response = self.client.post(reverse('availability'), {'items': [
+            {'product_id': trout.pk, 'quantity': 3},
+            {'sku': 'T-1', 'quantity': 2, 'warehouse_id': self.far.pk},
+            {'sku': 'T-1', 'quantity': 3, 'warehouse_id': self.far.pk},
+            {'sku': 'NOPE'},
+        ]}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        first, second, third, missing = data['items']
+
+        self.assertEqual((first['warehouse_id'], first['max_quantity'], first['available']), (self.main.pk, 5, True))
+        self.assertEqual(first['price'], {'value': '100.00', 'price_type_code': 'retail', 'currency': 'RUB'})
+        self.assertEqual(first['line_total'], '300.00')
+        self.assertEqual([w['name'] for w in first['warehouses']], ['Основной', 'Дальний'])
+
+        self.assertEqual((second['product_id'], second['warehouse_id']), (salmon.pk, self.far.pk))
+        self.assertEqual((second['price']['price_type_code'], second['line_total']), ('sale', '100.00'))
+        self.assertTrue(second['available'])
+        self.assertEqual((third['max_quantity'], third['available']), (2, False))
+        self.assertEqual((missing['sku'], missing['available']), ('NOPE', False))
+        self.assertFalse(data['available'])
+
+    def test_query_count_does_not_grow_with_cart(self):
+        refcache.table(Warehouse)  # справочник складов — из кеша процесса
+        for products in (self.products[:1], self.products):
+            items = [{'product_id': p.pk, 'quantity': 1} for p in products]
+            # товары, цены, остатки
+            with self.assertNumQueries(3):
+                lines = check_availability(items)
+            self.assertEqual(len(lines), len(products))
+
+
+@override_settings(STORAGES=STORAGES)
+class AdminChangelistQueryTests(TestCase):
+    """Число запросов changelist не зависит от числа строк"""
+
+    def setUp(self):
+        refcache.clear()
+        self.addCleanup(refcache.clear)
+        admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'pass')
+        self.client.force_login(admin)
+        self.kg = Unit.objects.create(code='kg', name='кг')
+        self.retail = PriceType.objects.create(name='Розничная', code='retail')
+        self.store = Warehouse.objects.create(name='Основной')
+        self.count = 0
+
+    def add_rows(self, n):
+        for _ in range(n):
+            self.count += 1
+            number = self.count
+            category = Category.objects.create(name=f'Категория {number}', slug=f'category-{number}')
+            product = Product.objects.create(
+                name=f'Товар {number}', slug=f'product-{number}', sku=f'P-{number}', category=category, unit=self.kg,
+            )
+            Price.objects.create(product=product, price_type=self.retail, value=100)
+            Stock.objects.create(product=product, warehouse=self.store, quantity=number, unit=self.kg)
+            ProductImage.objects.create(product=product, image=f'product_images/{number}.jpg')
+            StockMovement.objects.create(product=product, warehouse=self.store, delta=number, reason='admin')
+            StockSnapshot.objects.create(product=product, warehouse=self.store, quantity=number)
+
+    def queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        urls = [
+            reverse(f'admin:products_{model}_changelist')
+            for model in ('product', 'category', 'price', 'stock', 'productimage', 'stockmovement', 'stocksnapshot')
+        ]
+        self.add_rows(5)
+        self.client.get(urls[0])  # autodiscover админки и справочники
+        before = {url: self.queries(url) for url in urls}
+        self.add_rows(5)
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.queries(url), before[url])
@@ -1,6 +1,8 @@
 from rest_framework.routers import DefaultRouter
 from django.urls import path
-from .views import ProductViewSet, CategoryViewSet, ProductImportView, ProductImageViewSet, PriceTypeViewSet
+from .views import ProductViewSet, CategoryViewSet, ProductImportView, ProductImageViewSet, PriceTypeViewSet, \
+    AvailabilityView, ProductImageBulkUploadView
+from . import async_views
 
 router = DefaultRouter()
 router.register(r'products', ProductViewSet)
@@ -10,5 +12,13 @@ router.register(r'product-images', ProductImageViewSet, basename='productimage')
 
 urlpatterns = [
     path('product-import/', ProductImportView.as_view(), name='product-import'),
+    path('availability/', AvailabilityView.as_view(), name='availability'),
+    path('images/bulk-upload/', ProductImageBulkUploadView.as_view(), name='product-images-bulk-upload'),
+    # Async-чтение каталога для ASGI (products/async_views.py)
+    path('async/products/', async_views.product_list, name='async-product-list'),
+    path('async/products/<int:pk>/', async_views.product_detail, name='async-product-detail'),
+    path('async/categories/', async_views.category_list, name='async-category-list'),
+    path('async/price-types/', async_views.price_type_list, name='async-pricetype-list'),
+    path('async/availability/', async_views.availability, name='async-availability'),
     *router.urls,
 ]
@@ -1,8 +1,11 @@
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
 from django.utils import timezone
 from django.utils.text import slugify
 from django.db import transaction
 from django.db.models import Sum
-import pandas as pd
 from django.db import models
 
 from rest_framework import viewsets, generics, status, filters
@@ -14,14 +17,22 @@ from rest_framework.decorators import action
 
 from django_filters.rest_framework import DjangoFilterBackend
 
-from .models import Product, ProductImage, Category, Tag, Unit, Warehouse, Stock, PriceType, Price
+from core.views import ConcurrencyLimitMixin, ReplicaReadMixin
+
+from .models import Product, ProductImage, Category, Tag, Unit, Warehouse, Stock, PriceType, Price, StockMovement
 from .serializers import ProductSerializer, CategorySerializer, ProductImageSerializer, PriceTypeSerializer, \
-    ProductPriceSerializer
+    ProductPriceSerializer, AvailabilityRequestSerializer
+from .availability import cache_key, check_availability
+from . import refcache
+from .image_upload import UploadError, read_files, read_zip, upload_images
+from .media_urls import image_url
+from .stock_ledger import movement, record_movements
 
 
-class ProductImportView(APIView):
+class ProductImportView(ConcurrencyLimitMixin, APIView):
     parser_classes = [MultiPartParser, FormParser]
     permission_classes = [IsAdminUser]
+    throttle_scope = 'import'  # цена и лимит одновременных — core/throttling.py
 
     BASE_PRICE_TYPE_CODE = "base"
 
@@ -29,6 +40,8 @@ class ProductImportView(APIView):
     # 🔹 Чтение файла (xlsx/csv/json)
     # -------------------------------------------------------
     def parse_file(self, file):
+        import pandas as pd  # ~0.3 с и десятки МБ на импорт — не грузим при старте воркера
+
         try:
             if file.name.endswith(".json"):
                 return pd.DataFrame(pd.read_json(file))
@@ -51,14 +64,17 @@ class ProductImportView(APIView):
             df = self.parse_file(file)
         except ValueError as e:
             return Response({"detail": str(e)}, status=400)
+        from pandas import to_datetime  # уже загружен в parse_file
 
         created, updated = 0, 0
         errors = []
 
-        base_price_type, _ = PriceType.objects.get_or_create(
-            code=self.BASE_PRICE_TYPE_CODE,
-            defaults={"name": "Базовая цена"}
-        )
+        base_price_type = refcache.lookup(PriceType, "code", self.BASE_PRICE_TYPE_CODE)
+        if base_price_type is None:
+            base_price_type, _ = PriceType.objects.get_or_create(
+                code=self.BASE_PRICE_TYPE_CODE,
+                defaults={"name": "Базовая цена"}
+            )
 
         for idx, row in df.iterrows():
             try:
@@ -69,10 +85,12 @@ class ProductImportView(APIView):
                     category_name = row.get("Категория")
                     category = None
                     if category_name:
-                        category, _ = Category.objects.get_or_create(
-                            name=str(category_name).strip(),
-                            defaults={"slug": slugify(category_name)}
-                        )
+                        category = refcache.lookup(Category, "name", str(category_name).strip())
+                        if category is None:
+                            category, _ = Category.objects.get_or_create(
+                                name=str(category_name).strip(),
+                                defaults={"slug": slugify(category_name)}
+                            )
 
                     # ---------------------------------------------------
                     # 🔸 Теги
@@ -84,20 +102,24 @@ class ProductImportView(APIView):
                             tag_name = tag_name.strip()
                             if not tag_name:
                                 continue
-                            tag, _ = Tag.objects.get_or_create(
-                                name=tag_name,
-                                defaults={"slug": slugify(tag_name)}
-                            )
+                            tag = refcache.lookup(Tag, "name", tag_name)
+                            if tag is None:
+                                tag, _ = Tag.objects.get_or_create(
+                                    name=tag_name,
+                                    defaults={"slug": slugify(tag_name)}
+                                )
                             tags_list.append(tag)
 
                     # ---------------------------------------------------
                     # 🔸 Единица измерения
                     # ---------------------------------------------------
                     unit_code = row.get("Единица") or "pcs"
-                    unit, _ = Unit.objects.get_or_create(
-                        code=str(unit_code).strip(),
-                        defaults={"name": str(unit_code)}
-                    )
+                    unit = refcache.lookup(Unit, "code", str(unit_code).strip())
+                    if unit is None:
+                        unit, _ = Unit.objects.get_or_create(
+                            code=str(unit_code).strip(),
+                            defaults={"name": str(unit_code)}
+                        )
 
                     # ---------------------------------------------------
                     # 🔸 SKU
@@ -110,7 +132,6 @@ class ProductImportView(APIView):
                     # ---------------------------------------------------
                     name = row.get("Название") or "Без названия"
                     description = row.get("Описание") or ""
-                    weight = int(row.get("Вес") or 0)
                     active = row.get("Активен")
                     is_active = bool(active) if active in [0, 1, True, False] else True
 
@@ -120,7 +141,7 @@ class ProductImportView(APIView):
                     expiration_date = None
                     if exp_raw:
                         try:
-                            expiration_date = pd.to_datetime(exp_raw).date()
+                            expiration_date = to_datetime(exp_raw).date()
                         except:
                             pass
 
@@ -130,10 +151,10 @@ class ProductImportView(APIView):
                         "description": description,
                         "category": category,
                         "unit": unit,
-                        "weight": weight,
                         "is_active": is_active,
                         "origin": origin,
                         "expiration_date": expiration_date,
+                        "changed_locally": True,
                     }
 
                     obj, created_flag = Product.objects.update_or_create(
@@ -166,13 +187,24 @@ class ProductImportView(APIView):
                     stock_qty = row.get("Остаток")
 
                     if wh_name and stock_qty is not None:
-                        wh, _ = Warehouse.objects.get_or_create(name=str(wh_name).strip())
+                        wh = refcache.lookup(Warehouse, "name", str(wh_name).strip())
+                        if wh is None:
+                            wh, _ = Warehouse.objects.get_or_create(name=str(wh_name).strip())
+
+                        old_qty = Stock.objects.filter(
+                            product=obj, warehouse=wh
+                        ).values_list("quantity", flat=True).first() or 0
 
                         Stock.objects.update_or_create(
                             product=obj,
                             warehouse=wh,
                             defaults={"quantity": int(stock_qty), "unit": unit},
                         )
+                        # Журнал — в транзакции строки: остаток без движения не закоммитится
+                        record_movements([movement(
+                            obj.pk, wh.pk, int(stock_qty) - old_qty,
+                            StockMovement.REASON_IMPORT, f"import:{file.name}"
+                        )])
 
                         obj.stock_cache = obj.stocks.aggregate(total=Sum("quantity"))["total"] or 0
                         obj.save()
@@ -189,21 +221,21 @@ class ProductImportView(APIView):
         )
 
 
-class ProductExportView(APIView):
+class ProductExportView(ConcurrencyLimitMixin, ReplicaReadMixin, APIView):
     permission_classes = [IsAdminUser]
+    throttle_scope = 'export'
 
     def get(self, request):
         data = []
 
-        products = Product.objects.select_related(
-            "category", "unit"
-        ).prefetch_related(
+        # Категории, единицы, типы цен и склады — из кеша справочников, без join и N+1
+        products = Product.objects.prefetch_related(
             "tags", "prices", "stocks", "images"
         )
 
         for p in products:
             prices = [{
-                "type": price.price_type.code,
+                "type": refcache.get(PriceType, price.price_type_id).code,
                 "value": str(price.value),
                 "start_date": price.start_date,
                 "end_date": price.end_date,
@@ -211,12 +243,12 @@ class ProductExportView(APIView):
             } for price in p.prices.all()]
 
             stocks = [{
-                "warehouse": s.warehouse.name,
+                "warehouse": refcache.get(Warehouse, s.warehouse_id).name,
                 "quantity": s.quantity
             } for s in p.stocks.all()]
 
             images = [{
-                "url": request.build_absolute_uri(img.image.url),
+                "url": image_url(img, request=request),
                 "is_main": img.is_main
             } for img in p.images.all()]
 
@@ -224,9 +256,9 @@ class ProductExportView(APIView):
                 "sku": p.sku,
                 "name": p.name,
                 "description": p.description,
-                "category": p.category.name if p.category else None,
+                "category": refcache.get(Category, p.category_id).name if p.category_id else None,
                 "tags": [t.name for t in p.tags.all()],
-                "unit": p.unit.code,
+                "unit": refcache.get(Unit, p.unit_id).code,
                 "origin": p.origin,
                 "expiration_date": p.expiration_date,
                 "is_active": p.is_active,
@@ -240,12 +272,59 @@ class ProductExportView(APIView):
         return Response(data)
 
 
-class ProductViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Product.objects.filter(is_active=True).select_related(
-        'category', 'unit'
-    ).prefetch_related(
-        'images', 'tags', 'prices__price_type'
-    )
+class ProductImageBulkUploadView(APIView):
+    """
+    Массовая загрузка фото товаров (см. products/image_upload.py).
+    multipart: archive=<zip> или files=<файл>... (+ sku=<SKU>... в том же порядке),
+    set_main=1 — первое новое фото каждого товара становится главным.
+    Больше DATA_UPLOAD_MAX_NUMBER_FILES (100) файлов — только архивом.
+    """
+    parser_classes = [MultiPartParser, FormParser]
+    permission_classes = [IsAdminUser]
+
+    def post(self, request):
+        archive = request.FILES.get("archive")
+        files = request.FILES.getlist("files")
+        if not archive and not files:
+            return Response({"detail": "Передайте archive (zip) или files"}, status=400)
+
+        try:
+            entries = read_zip(archive) if archive else read_files(files, request.data.getlist("sku"))
+        except UploadError as e:
+            return Response({"detail": str(e)}, status=400)
+
+        set_main = str(request.data.get("set_main", "")).lower() in ("1", "true", "yes")
+        result = upload_images(entries, set_main=set_main)
+        return Response(result, status=201 if result["created"] else 200)
+
+
+class AvailabilityView(APIView):
+    """
+    Цены и наличие для всей корзины одним запросом.
+    POST {"items": [{"product_id": 1, "quantity": 2}, {"sku": "A-1", "quantity": 1, "warehouse_id": 3}]}
+    """
+
+    def post(self, request):
+        serializer = AvailabilityRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        items = serializer.validated_data['items']
+
+        # Повторные обновления той же корзины отдаём из короткого кэша
+        key = cache_key(items)
+        lines = cache.get(key)
+        if lines is None:
+            lines = check_availability(items)
+            cache.set(key, lines, settings.AVAILABILITY_CACHE_TIMEOUT)
+
+        return Response({
+            'items': lines,
+            'available': all(line['available'] for line in lines),
+        })
+
+
+class ProductViewSet(ReplicaReadMixin, viewsets.ReadOnlyModelViewSet):
+    # Категория, единица и типы цен сериализуются из кеша справочников (refcache)
+    queryset = Product.objects.filter(is_active=True).prefetch_related('images', 'tags')
     serializer_class = ProductSerializer
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter, filters.SearchFilter]
     filterset_fields = {
@@ -261,9 +340,7 @@ class ProductViewSet(viewsets.ReadOnlyModelViewSet):
     def price_history(self, request, pk=None):
         """Получить историю цен для товара"""
         product = self.get_object()
-        prices = Price.objects.filter(
-            product=product
-        ).select_related('price_type').order_by('-start_date')
+        prices = Price.objects.filter(product=product).order_by('-start_date')
 
         serializer = ProductPriceSerializer(prices, many=True)
         return Response(serializer.data)
@@ -278,9 +355,8 @@ class ProductViewSet(viewsets.ReadOnlyModelViewSet):
                 status=400
             )
 
-        try:
-            price_type = PriceType.objects.get(code=price_type_code)
-        except PriceType.DoesNotExist:
+        price_type = refcache.lookup(PriceType, 'code', price_type_code)
+        if price_type is None:
             return Response(
                 {'error': 'Price type not found'},
                 status=404
@@ -307,18 +383,18 @@ class ProductViewSet(viewsets.ReadOnlyModelViewSet):
         return Response(serializer.data)
 
 
-class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
+class CategoryViewSet(ReplicaReadMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Category.objects.filter(is_active=True)
     serializer_class = CategorySerializer
 
 
-class PriceTypeViewSet(viewsets.ReadOnlyModelViewSet):
+class PriceTypeViewSet(ReplicaReadMixin, viewsets.ReadOnlyModelViewSet):
     """API для типов цен"""
     queryset = PriceType.objects.all()
     serializer_class = PriceTypeSerializer
 
 
-class ProductImageViewSet(viewsets.ReadOnlyModelViewSet):
+class ProductImageViewSet(ReplicaReadMixin, viewsets.ReadOnlyModelViewSet):
     queryset = ProductImage.objects.all().select_related('product')
     serializer_class = ProductImageSerializer
 
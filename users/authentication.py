@@ -0,0 +1,37 @@
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .tokens import CLAIMS
+
+
+def _not_persistable(*args, **kwargs):
+    # Поля профиля у такого пользователя пустые: save() затёр бы ими строку в БД
+    raise NotImplementedError('Пользователь собран из JWT и не сохраняется; перечитайте его из БД')
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    """
+    Authorization: Bearer <access> без запросов к БД: пользователь собирается из
+    данных токена (см. users/tokens.py). Это обычный экземпляр User с id — годится
+    для фильтров, внешних ключей и проверок is_staff, но остальные поля пусты:
+    кому нужен полный профиль, перечитывает его из БД (ManageUserView).
+    save() и delete() у него запрещены — изменения делаются на перечитанной записи.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Токен не содержит идентификатор пользователя')
+
+        user = get_user_model()(**{api_settings.USER_ID_FIELD: user_id}, is_active=True)
+        for claim in CLAIMS:
+            setattr(user, claim, validated_token.get(claim, False if claim != 'username' else ''))
+        # Объект «как из БД» — для внешних ключей и роутера реплик
+        user._state.adding = False
+        user._state.db = DEFAULT_DB_ALIAS
+        user.save = user.delete = _not_persistable
+        return user
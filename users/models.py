@@ -1,6 +1,23 @@
+from django.db import models
 from django.contrib.auth.models import User
 
 
 class CustomUser(User):
     # Добавьте сюда дополнительные поля, если хотите
     pass
+
+
+class RevokedToken(models.Model):
+    """
+    Отозванные refresh-токены JWT (выход, ротация). Хранится только jti до истечения
+    токена: просроченные строки удаляются при следующем отзыве, список остаётся маленьким.
+    """
+    jti = models.CharField(max_length=64, unique=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        verbose_name = 'Отозванный токен'
+        verbose_name_plural = 'Отозванные токены'
+
+    def __str__(self):
+        return self.jti
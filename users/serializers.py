@@ -3,6 +3,11 @@ from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
 from django.contrib.auth import get_user_model
 from rest_framework import serializers
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from .tokens import ShopRefreshToken, revoke, update_claims
 
 
 # Сериализатор для регистрации пользователя
@@ -50,3 +55,28 @@ class AuthTokenSerializer(serializers.Serializer):
 
         data['user'] = user
         return data
+
+
+# JWT: пара access/refresh по логину и паролю
+class JWTObtainSerializer(TokenObtainPairSerializer):
+    token_class = ShopRefreshToken
+
+
+# JWT: ротация refresh-токена (старый отзывается, права в токене обновляются из БД)
+class JWTRefreshSerializer(TokenRefreshSerializer):
+    token_class = ShopRefreshToken
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        user = get_user_model().objects.filter(
+            **{jwt_settings.USER_ID_FIELD: refresh[jwt_settings.USER_ID_CLAIM]}, is_active=True
+        ).first()
+        if user is None:
+            raise TokenError('Пользователь не найден или отключён')
+        revoke(refresh)
+
+        update_claims(refresh, user)
+        refresh.set_jti()
+        refresh.set_exp()
+        refresh.set_iat()
+        return {'access': str(refresh.access_token), 'refresh': str(refresh)}
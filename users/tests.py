@@ -1,3 +1,94 @@
-from django.test import TestCase
+from datetime import timedelta
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.test import RequestFactory, TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from .authentication import StatelessJWTAuthentication
+from .models import RevokedToken
+
+
+class JWTTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('anna', email='anna@example.com', password='secret1', is_staff=True)
+
+    def obtain(self):
+        response = self.client.post(reverse('token_obtain_pair'), {'username': 'anna', 'password': 'secret1'})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def refresh(self, token):
+        return self.client.post(reverse('token_refresh'), {'refresh': token})
+
+    def bearer(self, access):
+        return {'HTTP_AUTHORIZATION': f'Bearer {access}'}
+
+    def test_access_token_is_verified_without_queries(self):
+        access = self.obtain()['access']
+        request = RequestFactory().get('/', **self.bearer(access))
+        with self.assertNumQueries(0):
+            user, _ = StatelessJWTAuthentication().authenticate(request)
+        self.assertEqual((user.pk, user.username, user.is_staff), (self.user.pk, 'anna', True))
+
+    def test_token_user_cannot_overwrite_profile(self):
+        access = self.obtain()['access']
+        user, _ = StatelessJWTAuthentication().authenticate(RequestFactory().get('/', **self.bearer(access)))
+
+        with self.assertRaises(NotImplementedError):
+            user.save()
+        with self.assertRaises(NotImplementedError):
+            user.delete()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.email, 'anna@example.com')
+        self.assertTrue(self.user.check_password('secret1'))
+
+    def test_profile_is_read_from_db(self):
+        access = self.obtain()['access']
+        response = self.client.get(reverse('me'), **self.bearer(access))
+        self.assertEqual(response.json()['email'], 'anna@example.com')
+
+        response = self.client.patch(
+            reverse('me'), {'first_name': 'Анна'}, content_type='application/json', **self.bearer(access)
+        )
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        # Частичное обновление не затирает поля, которых нет в токене
+        self.assertEqual((self.user.first_name, self.user.email), ('Анна', 'anna@example.com'))
+
+    def test_refresh_rotates_and_old_token_is_single_use(self):
+        tokens = self.obtain()
+        response = self.refresh(tokens['refresh'])
+        self.assertEqual(response.status_code, 200)
+        rotated = response.json()
+        self.assertNotEqual(rotated['refresh'], tokens['refresh'])
+
+        self.assertEqual(self.refresh(tokens['refresh']).status_code, 401)
+        self.assertEqual(self.refresh(rotated['refresh']).status_code, 200)
+
+    def test_refresh_picks_up_permission_changes(self):
+        tokens = self.obtain()
+        User.objects.filter(pk=self.user.pk).update(is_staff=False)
+        rotated = self.refresh(tokens['refresh']).json()
+        request = RequestFactory().get('/', **self.bearer(rotated['access']))
+        self.assertFalse(StatelessJWTAuthentication().authenticate(request)[0].is_staff)
+
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.refresh(rotated['refresh']).status_code, 401)
+
+    def test_logout_revokes_refresh_and_purges_expired(self):
+        RevokedToken.objects.create(jti='old', expires_at=timezone.now() - timedelta(minutes=1))
+        tokens = self.obtain()
+        response = self.client.post(reverse('logout'), {'refresh': tokens['refresh']}, **self.bearer(tokens['access']))
+        self.assertEqual(response.status_code, 200)
+        # Просроченная запись удалена, осталась только отозванная при выходе
+        self.assertFalse(RevokedToken.objects.filter(jti='old').exists())
+        self.assertEqual(RevokedToken.objects.count(), 1)
+        self.assertEqual(self.refresh(tokens['refresh']).status_code, 401)
+
+    def test_token_logout_still_works(self):
+        token = Token.objects.create(user=self.user)
+        response = self.client.post(reverse('logout'), HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Token.objects.filter(user=self.user).exists())
@@ -0,0 +1,50 @@
+"""
+JWT для API (djangorestframework-simplejwt).
+
+Access-токен живёт ACCESS_TOKEN_LIFETIME и несёт всё, что нужно проверкам прав:
+user_id, username, is_staff, is_superuser. Проверка — только подпись и срок,
+без запросов к БД (users/authentication.py). Поэтому access-токен не отзывается,
+он просто истекает.
+
+Refresh-токен одноразовый: при обновлении (ротации) и при выходе его jti
+попадает в RevokedToken до своего истечения. Повторное предъявление того же
+refresh-токена отклоняется — в том числе при гонке двух одновременных обновлений:
+отзыв — это INSERT по уникальному jti, выигрывает только один.
+"""
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .models import RevokedToken
+
+CLAIMS = ('username', 'is_staff', 'is_superuser')
+
+
+class ShopRefreshToken(RefreshToken):
+    """Refresh-токен с данными пользователя; access-токены копируют их из него"""
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        update_claims(token, user)
+        return token
+
+
+def update_claims(token, user):
+    for claim in CLAIMS:
+        token[claim] = getattr(user, claim)
+
+
+def revoke(token):
+    """Отзывает refresh-токен. TokenError — он уже отозван."""
+    expires_at = datetime.fromtimestamp(token['exp'], tz=dt_timezone.utc)
+    try:
+        with transaction.atomic():
+            RevokedToken.objects.create(jti=token[api_settings.JTI_CLAIM], expires_at=expires_at)
+    except IntegrityError:
+        raise TokenError('Токен отозван')
+    RevokedToken.objects.filter(expires_at__lt=timezone.now()).delete()
@@ -1,9 +1,14 @@
 from django.urls import path
-from .views import CreateUserView, CreateTokenView, ManageUserView, LogoutView
+from rest_framework_simplejwt.views import TokenRefreshView, TokenVerifyView
+from .views import CreateUserView, CreateTokenView, ManageUserView, LogoutView, JWTObtainView
 
 urlpatterns = [
     path('register/', CreateUserView.as_view(), name='register'),
     path('login/', CreateTokenView.as_view(), name='login'),
     path('logout/', LogoutView.as_view(), name='logout'),
     path('me/', ManageUserView.as_view(), name='me'),
+    # JWT (users/tokens.py): пара токенов, ротация refresh, проверка access
+    path('token/', JWTObtainView.as_view(), name='token_obtain_pair'),
+    path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('token/verify/', TokenVerifyView.as_view(), name='token_verify'),
 ]
\ No newline at end of file
@@ -5,6 +5,11 @@ from rest_framework.settings import api_settings
 from rest_framework.authtoken.models import Token
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.views import TokenObtainPairView
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .tokens import ShopRefreshToken, revoke
 
 from .permissions import IsOwnerOrAdmin
 from .serializers import UserSerializer, AuthTokenSerializer
@@ -15,6 +20,7 @@ from .serializers import UserSerializer, AuthTokenSerializer
 class CreateUserView(generics.CreateAPIView):
     serializer_class = UserSerializer
     permission_classes = [permissions.AllowAny]
+    throttle_scope = 'login'  # отдельное ведро на адрес — core/throttling.py
 
     def create(self, request, *args, **kwargs):
         response = super().create(request, *args, **kwargs)
@@ -28,6 +34,9 @@ class CreateUserView(generics.CreateAPIView):
 class CreateTokenView(ObtainAuthToken):
     serializer_class = AuthTokenSerializer
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
+    # ObtainAuthToken отключает троттлинг — возвращаем общий, с ведром входа
+    throttle_classes = api_settings.DEFAULT_THROTTLE_CLASSES
+    throttle_scope = 'login'
 
     def post(self, request, *args, **kwargs):
         serializer = self.serializer_class(data=request.data, context={'request': request})
@@ -37,19 +46,41 @@ class CreateTokenView(ObtainAuthToken):
         return Response({'token': token.key})
 
 
+class JWTObtainView(TokenObtainPairView):
+    """Пара JWT по логину и паролю — с тем же ведром входа, что у login/"""
+    throttle_scope = 'login'
+
+
+class ObtainAuthTokenView(ObtainAuthToken):
+    """Стандартный api-token-auth/ DRF с троттлингом входа"""
+    throttle_classes = api_settings.DEFAULT_THROTTLE_CLASSES
+    throttle_scope = 'login'
+
+
 # Просмотр/редактирование своего профиля
 class ManageUserView(generics.RetrieveUpdateAPIView):
     serializer_class = UserSerializer
     permission_classes = [permissions.IsAuthenticated, IsOwnerOrAdmin]
 
     def get_object(self):
-        # Всегда возвращаем текущего юзера
-        return self.request.user
+        # Всегда возвращаем текущего юзера; при входе по JWT request.user собран
+        # из токена без профиля — читаем полную запись
+        return User.objects.get(pk=self.request.user.pk)
 
 
 class LogoutView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request):
-        request.user.auth_token.delete()
+        if isinstance(request.auth, AccessToken):
+            # JWT: отзываем refresh-токен клиента, access истечёт сам
+            try:
+                refresh = ShopRefreshToken(request.data.get("refresh", ""))
+                if refresh.get("user_id") != request.user.pk:
+                    raise TokenError("Токен другого пользователя")
+                revoke(refresh)
+            except TokenError as e:
+                return Response({"refresh": [str(e)]}, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            Token.objects.filter(user=request.user).delete()
         return Response({"detail": "Successfully logged out."}, status=status.HTTP_200_OK)
\ No newline at end of file